@@ -1,5 +1,6 @@
 import argparse
 import asyncio
+import functools
 import json
 import logging
 import time
@@ -7,11 +8,13 @@ import yaml
 
 from src.cypher_llm import CypherQueryGeneratorViaAPI
 from src.helper_llm import HelperLLM, HelperLLMViaAPI
+from src.llm_transport import TransportSettings, close_clients
 from src.ifc_handler import IFCGraphHandler
 from src.sandbox_handler import SandboxHandler
 from src.react_agent import ReActAgent
 from src.prompting.sandbox_prompts import API_DOCS, CHAT_API_EXAMPLES
 from src.voice_layer import record_audio, asr_from_file
+from src.vllm_metrics import prefix_cache_hit_rate
 
 
 def parse_args():
@@ -28,13 +31,23 @@ def load_all_handlers(config: dict[str, dict[str, object]]) -> tuple[CypherQuery
     username = config['neo4j']['username']
     password = config['neo4j']['password']
     database = config['neo4j']['database']
+    workers = config['neo4j'].get('workers', 1)
+    max_pool_size = config['neo4j'].get('maxPoolSize', 100)
+    cache_size = config['neo4j'].get('cacheSize', 256)
+    cache_ttl = config['neo4j'].get('cacheTTL', 600)
+    query_timeout = config['neo4j'].get('queryTimeout', 30)
+    building_isolation = config['neo4j'].get('buildingIsolation', "auto")
     
-    if config['neo4j']['resetGraph']:
-        graph_handler = IFCGraphHandler(uri, username, password, database, ifc_path=config['sandbox']['ifcPath'])
-    else:
-        graph_handler = IFCGraphHandler(uri, username, password, database)
+    # Without resetGraph, the IFC path is still used to find the saved schema of the loaded building
+    graph_handler = IFCGraphHandler(uri, username, password, database, ifc_path=config['sandbox']['ifcPath'], reset=config['neo4j']['resetGraph'], workers=workers, max_pool_size=max_pool_size, cache_size=cache_size, cache_ttl=cache_ttl, query_timeout=query_timeout, building_isolation=building_isolation)
+    # Other buildings, pre-loaded so that they can be activated with "/building <name>"
+    for building in config['neo4j'].get('buildings', []):
+        graph_handler.add_building(building['name'], building['ifcPath'])
     logging.info("IFC Graph Handler created")
     
+    ### Connection settings shared by the LLM clients
+    transport_settings = TransportSettings.from_config(config.get('transport'))
+
     ### Create object that generates cypher queries (for query mode)
     cypher_model = config['cypherLLM']['model']
     openai_api_cypher_url = config['cypherLLM']['apiUrl']
@@ -42,7 +55,15 @@ def load_all_handlers(config: dict[str, dict[str, object]]) -> tuple[CypherQuery
     cypher_llm = CypherQueryGeneratorViaAPI(
         model_name=cypher_model,
         openai_api_base_url=openai_api_cypher_url, 
-        openai_api_key=openai_api_key
+        openai_api_key=openai_api_key,
+        cache_path=config['cypherLLM'].get('cachePath', "data/cache/text2cypher.json"),
+        use_cache=config['cypherLLM'].get('useCache', True),
+        embedding_model=config['cypherLLM'].get('embeddingModel'),
+        embedding_api_base_url=config['cypherLLM'].get('embeddingApiUrl'),
+        similarity_threshold=config['cypherLLM'].get('similarityThreshold', 0.95),
+        use_templates=config['cypherLLM'].get('useTemplates', True),
+        prune_schema=config['cypherLLM'].get('pruneSchema', True),
+        transport_settings=transport_settings
     )
     logging.info("Cypher Query client created")
     
@@ -57,7 +78,8 @@ def load_all_handlers(config: dict[str, dict[str, object]]) -> tuple[CypherQuery
     helper_llm = HelperLLMViaAPI(
         model_name=model_name,
         openai_api_base_url=openai_api_helper_url, 
-        openai_api_key=openai_api_key
+        openai_api_key=openai_api_key,
+        transport_settings=transport_settings
     )
     logging.info("Helper LLM client created")
 
@@ -70,17 +92,22 @@ def process_query(input_text: str, graph_handler: IFCGraphHandler, cypher_llm: C
     start_time = time.time()
 
     print(f"[QUERY MODE] INPUT: {input_text}")
-    cypher_query = cypher_llm(question=input_text, schema=graph_handler.graph_schema)
+    schema = graph_handler.prompt_schema
+    cypher_query = cypher_llm(question=input_text, schema=schema)
     cypher_query_time = time.time()
 
-    cypher_output = graph_handler.execute_cypher_query(cypher_query=cypher_query)
+    cypher_result = graph_handler.execute_cypher_query(cypher_query=cypher_query)
     cypher_exec_time = time.time()
 
     print(f"CYPHER QUERY: {cypher_query.strip()}")
-    if cypher_output == "'No information retrieved.'":
-        print(" - This query gave an error while executing it.")
-
-    final_output = cypher_output
+    if not cypher_result.ok:
+        print(f" - This query could not be executed ({cypher_result.status}): {cypher_result.error}")
+    if cypher_result.status in ("rejected", "error"):
+        # A wrong translation must not be served again from the cache (timeouts may succeed on a retry)
+        cypher_llm.invalidate(input_text, schema)
+
+    # The observation of the agent: the rows within the result budget, or why the query could not be run
+    final_output = str(cypher_result)
     print(f"OUTPUT: {final_output}")
 
     print(f"TIMES: C. query {cypher_query_time-start_time:.2f}s - C. exec {cypher_exec_time-cypher_query_time:.2f}s")
@@ -122,39 +149,51 @@ def process_with_react_agent(input_text: str, agent: ReActAgent, graph_handler:
     def query_building_tool(query_input: str) -> tuple[str, str]:
         """Tool for querying building information"""
         try:
-            sandbox_handler.sandbox.text_to_speech("Using the query tool")
+            # Queries run alongside the sandbox tools, only the sandbox call waits for them
+            with agent.resource_locks["sandbox"]:
+                sandbox_handler.sandbox.text_to_speech("Using the query tool")
             result, cypher_query = process_query(query_input, graph_handler, cypher_llm, helper_llm)
             return result, cypher_query
         except Exception as e:
             return f"Error querying building: {str(e)}", ""
     
-    def retrieve_building_tool(retrieve_input: str) -> tuple[str, str]:
-        """Tool for retrieving building element IDs"""
+    def retrieval_code(retrieve_input: str) -> str:
+        """Generates the retrieval code, without using the sandbox"""
+        input_data = {
+            "query": retrieve_input,
+            "api_documentation": API_DOCS
+        }
+        return helper_llm(input_data=input_data, instruction_type="retrieval_api")
+
+    def run_retrieval(python_code: str) -> tuple[str, str]:
+        """Runs the retrieval code in the sandbox"""
         try:
-            sandbox_handler.sandbox.text_to_speech("Using the retrieve tool")
             start_time = time.time()
-            print(f"[RETRIEVE MODE] INPUT: {retrieve_input}")
-            
-            input_data = {
-                "query": retrieve_input,
-                "api_documentation": API_DOCS
-            }
-            
-            python_code = helper_llm(input_data=input_data, instruction_type="retrieval_api")
-            python_code_time = time.time()
-            
             python_outcome = sandbox_handler(code=python_code, return_result=True)
             python_exec_time = time.time()
-            
+
             logging.info(f"RETRIEVAL CODE:\n{python_code.strip()}")
             logging.info(f"RETRIEVAL RESULT: {python_outcome}")
-            
-            print(f"TIMES: P. code {python_code_time-start_time:.2f}s - P. exec {python_exec_time-python_code_time:.2f}s")
-            
+
+            print(f"TIMES: P. exec {python_exec_time-start_time:.2f}s")
+
             return python_outcome, python_code
         except Exception as e:
             return f"Error retrieving building elements: {str(e)}", ""
 
+    def retrieve_building_tool(retrieve_input: str) -> tuple[str, str]:
+        """Tool for retrieving building element IDs"""
+        try:
+            sandbox_handler.sandbox.text_to_speech("Using the retrieve tool")
+            start_time = time.time()
+            print(f"[RETRIEVE MODE] INPUT: {retrieve_input}")
+            
+            python_code = retrieval_code(retrieve_input)
+            print(f"TIMES: P. code {time.time()-start_time:.2f}s")
+        except Exception as e:
+            return f"Error retrieving building elements: {str(e)}", ""
+        return run_retrieval(python_code)
+
     def modify_building_tool(modify_input: str) -> tuple[str, str]:
         """Tool for modifying building elements"""
         try:
@@ -171,8 +210,19 @@ def process_with_react_agent(input_text: str, agent: ReActAgent, graph_handler:
         "modify_building": modify_building_tool,
     }
     
+    def complete_retrieval(python_code: str) -> tuple[str, str]:
+        """Runs speculatively generated retrieval code, announced as any other retrieval"""
+        sandbox_handler.sandbox.text_to_speech("Using the retrieve tool")
+        return run_retrieval(python_code)
+
+    # Speculative calls only generate the code (no sandbox access, since their result may be discarded),
+    # which is run in the sandbox if the agent makes the same retrieval request
+    speculative_executors = {
+        "retrieve_building": lambda retrieve_input: functools.partial(complete_retrieval, retrieval_code(retrieve_input)),
+    }
+    
     # Run the agent
-    final_answer, steps = agent.run(input_text, tool_executors)
+    final_answer, steps = agent.run(input_text, tool_executors, speculative_executors=speculative_executors)
     
     # Display trajectory if verbose mode
     if verbose and steps:
@@ -204,13 +254,21 @@ def main():
     # Initialize ReAct agent with config settings
     max_iterations = config['agent']['max_iterations']
     verbose = config['agent']['verbose']
-    agent = ReActAgent(helper_llm, max_iterations=max_iterations)
+    log_prefix_cache = config['agent'].get('logPrefixCache', False)
+    agent = ReActAgent(
+        helper_llm,
+        max_iterations=max_iterations,
+        stream=config['agent'].get('stream', True),
+        parallel_actions=config['agent'].get('parallelActions', False),
+        speculative_retrieval=config['agent'].get('speculativeRetrieval', False),
+        max_prompt_tokens=config['agent'].get('maxPromptTokens', 8000)
+    )
 
     print("**Unified BIM Assistant**")
     print("- Query examples: 'How many windows are there?', 'List all doors in the building'")
     print("- Modify examples: 'Change the left doors color to red', 'Hide all the visible stairs'")
     print("- Retrieval examples: 'What is the name of the door in front of me?'")
-    print("- Press Enter (empty input) to record voice, 'q' to quit")
+    print("- Press Enter (empty input) to record voice, '/building <name>' to switch building, 'q' to quit")
     print("-" * 60)
     
     if verbose:
@@ -222,6 +280,12 @@ def main():
         
         if input_text.lower() == "q":
             break
+        elif input_text.startswith("/building"):
+            try:
+                graph_handler.switch_building(input_text[len("/building"):].strip())
+            except KeyError as e:
+                print(f"Error: {e}")
+            continue
         elif input_text == "":  # Record audio if empty string
             logging.info("Starting to record for 5 seconds...")
             audio_file = record_audio(seconds=5)
@@ -243,6 +307,9 @@ def main():
                 sandbox_handler.sandbox.text_to_speech("Speech recognition failed, please try again")
                 continue
         
+        if log_prefix_cache:
+            prefix_cache_before = {"Helper": helper_llm.prefix_cache_stats(), "Cypher": cypher_llm.prefix_cache_stats()}
+
         try:
             result = process_with_react_agent(
                 input_text, 
@@ -263,8 +330,20 @@ def main():
 
         end_time = time.time()
         logging.info(f"Total execution time: {end_time-start_time:.2f}s")
+        if log_prefix_cache:
+            prefix_cache_after = {"Helper": helper_llm.prefix_cache_stats(), "Cypher": cypher_llm.prefix_cache_stats()}
+            for name, stats in prefix_cache_after.items():
+                hit_rate = prefix_cache_hit_rate(prefix_cache_before[name], stats)
+                if hit_rate is not None:
+                    logging.info(f"{name} LLM prefix cache hit rate: {hit_rate:.1%}")
         print("-" * 60)
 
+    # Write the translations not saved yet
+    cypher_llm.close()
+    agent.close()
+    graph_handler.close()
+    close_clients()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,371 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LRUCache():
+    """
+    Thread-safe least-recently-used cache with an optional time-to-live per entry.
+
+    Args:
+        max_size: Maximum number of entries, the least recently used one is evicted when exceeded
+        ttl: Seconds an entry stays valid (None to never expire)
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float | None = 600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value) -> None:
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# String literals are kept as they are, everything else is whitespace-normalized
+_CYPHER_LITERAL = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)")
+
+
+def normalize_cypher(cypher_query: str) -> str:
+    """
+    Normalizes a Cypher query so that queries differing only in whitespace or a trailing semicolon share a cache key.
+    """
+    parts = _CYPHER_LITERAL.split(cypher_query.strip().rstrip(";").strip())
+    # Odd positions hold the literals captured by the split
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts))
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a natural-language question (whitespace and trailing punctuation) for exact-match lookups. The case
+    is kept, since it may distinguish names and IDs.
+    """
+    return " ".join(question.strip().rstrip("?!. ").split())
+
+
+def schema_hash(schema: str) -> str:
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:16]
+
+
+def unit_vector(embedding) -> np.ndarray | None:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+class EmbeddingIndex():
+    """
+    Unit-normalized embeddings stored as the rows of one matrix, so that the cosine similarities of a query to all
+    of them are computed with a single matrix-vector product.
+    """
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self.keys = []
+        self._positions = {}
+        self._matrix = np.empty((capacity, dim), dtype=np.float32)
+
+    def add(self, key, vector: np.ndarray) -> None:
+        if key in self._positions:
+            self._matrix[self._positions[key]] = vector
+            return
+        if len(self.keys) == len(self._matrix):
+            # Grow geometrically, so that adding entries one by one stays cheap
+            self._matrix = np.concatenate([self._matrix, np.empty_like(self._matrix)])
+        self._positions[key] = len(self.keys)
+        self._matrix[len(self.keys)] = vector
+        self.keys.append(key)
+
+    def remove(self, key) -> None:
+        position = self._positions.pop(key, None)
+        if position is None:
+            return
+        # The last row takes the place of the removed one
+        last_key = self.keys.pop()
+        if last_key != key:
+            self._matrix[position] = self._matrix[len(self.keys)]
+            self.keys[position] = last_key
+            self._positions[last_key] = position
+
+    def similarities(self, vector: np.ndarray) -> np.ndarray:
+        return self._matrix[:len(self.keys)] @ vector
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+# Quoted strings and tokens containing digits (IDs, counts, levels...) must match exactly,
+# otherwise two questions that only differ in the referenced element would share a translation
+_QUESTION_LITERAL = re.compile(r"'[^']*'|\"[^\"]*\"|\S*\d\S*")
+
+
+def question_literals(question: str) -> list[str]:
+    return sorted(literal.strip(".,;:?!") for literal in _QUESTION_LITERAL.findall(question))
+
+
+class TranslationCache():
+    """
+    Persistent cache of natural-language question -> Cypher translations.
+
+    Lookups first try an exact match on the normalized question, the schema hash and the namespace. If an embedding
+    function is given, they then fall back to the most similar cached question of the same schema and namespace, provided that its cosine
+    similarity is above the threshold and both questions mention the same literals (IDs, numbers, quoted names).
+
+    New entries are written to disk in batches (every `save_every` changes) and by flush/close.
+
+    Args:
+        path: JSON file where the cache is persisted (None to keep it in memory)
+        embed_fn: Function mapping a question to its embedding vector (None to disable semantic lookups)
+        similarity_threshold: Minimum cosine similarity of a semantic hit
+        max_size: Maximum number of entries, the oldest ones are evicted first
+        save_every: Number of changes after which the cache is written to disk
+        namespace: Identifies what produced the translations (e.g. the model and its prompt), so that a file shared by
+                   several configurations only serves each one its own translations
+    """
+
+    def __init__(self, path: str | None = None, embed_fn=None, similarity_threshold: float = 0.95, max_size: int = 10000, save_every: int = 16, namespace: str = ""):
+        self.path = path
+        self.namespace = namespace
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.max_size = max_size
+        self.save_every = save_every
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Embeddings of the entries of each (schema hash, namespace) context
+        self._indexes = {}
+        # Embeddings computed by lookups, reused when the translation of a missed question is stored,
+        # and the entries returned for recent questions, removed if their translation turns out to be wrong
+        self._recent_embeddings = LRUCache(max_size=64, ttl=None)
+        self._served = LRUCache(max_size=64, ttl=None)
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        # Serializes the saves of this cache, so that an older snapshot never replaces a newer one
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def get(self, question: str, schema: str) -> str | None:
+        context = self._context(schema)
+        key = (normalize_question(question), context)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._served.put(key, key)
+                return entry["cypher"]
+
+        if self.embed_fn is not None:
+            entry_key = self._nearest(question, context)
+            if entry_key is not None:
+                with self._lock:
+                    entry = self._entries.get(entry_key)
+                if entry is not None:
+                    self.semantic_hits += 1
+                    self._served.put(key, entry_key)
+                    return entry["cypher"]
+
+        self.misses += 1
+        return None
+
+    def put(self, question: str, schema: str, cypher: str) -> None:
+        key = (normalize_question(question), self._context(schema))
+        embedding = self._recent_embeddings.get(key)
+        if embedding is None:
+            embedding = self._embed(question)
+        entry = {
+            "question": question,
+            "schema_hash": key[1][0],
+            "namespace": key[1][1],
+            "cypher": cypher,
+            "embedding": embedding,
+        }
+        with self._lock:
+            self._add(key, entry)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+        self._changed()
+
+    def invalidate(self, question: str, schema: str) -> None:
+        """
+        Removes the translation returned for a question (e.g. because the query failed), along with the cached
+        question it was taken from if it was a semantic hit.
+        """
+        key = (normalize_question(question), self._context(schema))
+        served_key = self._served.get(key)
+        with self._lock:
+            removed = [entry_key for entry_key in {key, served_key} if entry_key is not None and entry_key in self._entries]
+            for entry_key in removed:
+                self._remove(entry_key)
+        if removed:
+            self._changed()
+
+    def flush(self) -> None:
+        """
+        Writes the pending changes to disk.
+        """
+        with self._lock:
+            if not self._unsaved:
+                return
+            self._unsaved = 0
+        self._save()
+
+    def close(self) -> None:
+        self.flush()
+
+    def stats(self) -> dict[str, float]:
+        total = self.hits + self.semantic_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / total if total else 0.0,
+        }
+
+    def _embed(self, question: str) -> list[float] | None:
+        if self.embed_fn is None:
+            return None
+        try:
+            return [float(x) for x in self.embed_fn(question)]
+        except Exception as e:
+            logging.warning(f"Could not embed question for the translation cache: {e}")
+            return None
+
+    def _context(self, schema: str) -> tuple[str, str]:
+        return (schema_hash(schema), self.namespace)
+
+    def _nearest(self, question: str, context: tuple[str, str]) -> tuple | None:
+        """
+        Key of the most similar cached question of the context that mentions the same literals, if similar enough.
+        """
+        with self._lock:
+            if not self._indexes.get(context):
+                return None
+
+        embedding = self._embed(question)
+        if embedding is None:
+            return None
+        self._recent_embeddings.put((normalize_question(question), context), embedding)
+        vector = unit_vector(embedding)
+
+        with self._lock:
+            index = self._indexes.get(context)
+            if vector is None or index is None or index.dim != len(vector):
+                return None
+            similarities = index.similarities(vector)
+            keys = list(index.keys)
+
+        literals = question_literals(question)
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.similarity_threshold:
+                break
+            if question_literals(keys[i][0]) == literals:
+                return keys[i]
+        return None
+
+    def _add(self, key: tuple, entry: dict) -> None:
+        # Called with the lock held
+        self._remove(key)
+        self._entries[key] = entry
+        vector = unit_vector(entry["embedding"]) if entry["embedding"] is not None else None
+        if vector is not None:
+            index = self._indexes.setdefault(key[1], EmbeddingIndex(len(vector)))
+            if index.dim == len(vector):
+                index.add(key, vector)
+
+    def _remove(self, key: tuple) -> None:
+        # Called with the lock held
+        if self._entries.pop(key, None) is not None and key[1] in self._indexes:
+            self._indexes[key[1]].remove(key)
+
+    def _changed(self) -> None:
+        with self._lock:
+            self._unsaved += 1
+            save = self._unsaved >= self.save_every
+            if save:
+                self._unsaved = 0
+        if save:
+            self._save()
+
+    def _load(self) -> None:
+        if self.path is None or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)["entries"]
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not read translation cache {self.path}: {e}")
+            return
+        for entry in entries[-self.max_size:]:
+            # Entries saved without a namespace are kept in the file, but not served
+            self._add((normalize_question(entry["question"]), (entry["schema_hash"], entry.get("namespace"))), entry)
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                entries = list(self._entries.values())
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Write to a temporary file of its own first, so that neither an interrupted session nor another one
+            # saving at the same time leaves a corrupted cache
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory or ".", prefix=os.path.basename(self.path) + ".", suffix=".tmp", delete=False) as f:
+                tmp_path = f.name
+                try:
+                    json.dump({"entries": entries}, f)
+                except BaseException:
+                    f.close()
+                    os.remove(tmp_path)
+                    raise
+            os.replace(tmp_path, self.path)
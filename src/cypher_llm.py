@@ -1,5 +1,5 @@
+import json
 from abc import ABC, abstractmethod
-from openai import OpenAI
 from peft import PeftModel, PeftConfig
 import torch
 from transformers import (
@@ -9,15 +9,24 @@ from transformers import (
 )
 
 
-from src.prompting.cypher_prompts import CHAT_CYPHER_EXAMPLES, CYPHER_GENERATION_INSTRUCTION
+from src.caching import TranslationCache, schema_hash
+from src.llm_transport import TransportSettings, get_async_client, get_client
+from src.cypher_templates import match_cypher_template
+from src.schema_utils import prune_schema
+from src.prompting.cypher_prompts import CHAT_CYPHER_EXAMPLES, CYPHER_GENERATION_INSTRUCTION, CYPHER_QUESTION_TEMPLATE
+from src.vllm_metrics import prefix_cache_stats
 
 
 
 class CypherQueryGenerator(ABC):
 
-    def __init__(self, model_name: str, instruction_template: str = None):
+    def __init__(self, model_name: str, instruction_template: str = None, use_templates: bool = True, prune_schema: bool = True):
         
         self.model_name = model_name
+        # Answer frequent question classes with precompiled Cypher templates, calling the LLM only on a miss
+        self.use_templates = use_templates
+        # Only send the part of the schema relevant to each question
+        self.prune_schema = prune_schema
         
         self.model_generate_parameters = {
             "top_p": 0.9,
@@ -31,30 +40,61 @@ class CypherQueryGenerator(ABC):
             self.instruction = instruction_template
         else:
             self.instruction = CYPHER_GENERATION_INSTRUCTION
+
+        # Static prefix of every chat (instruction and few-shot examples), built once
+        self._static_chat = None
  
 
     @abstractmethod
     def __call__(self, question: str, schema: str) -> str:
         return
 
+    def _cache_namespace(self) -> str:
+        """
+        Identifies the model and prompt that produce the translations, so that cached translations are only reused
+        by the configuration that wrote them.
+        """
+        prompt = json.dumps([self.instruction, CHAT_CYPHER_EXAMPLES, CYPHER_QUESTION_TEMPLATE, self.prune_schema])
+        return f"{self.model_name}:{schema_hash(prompt)}"
+
+    def _match_template(self, question: str, schema: str) -> str | None:
+        if not self.use_templates:
+            return None
+        return match_cypher_template(question, schema)
+
     def _preprocess_input_chat(self, question: str, schema: str) -> list[dict]:
-        chat = [
+        if self.prune_schema:
+            schema = prune_schema(schema, question)
+
+        if "{schema}" in self.instruction:
+            # Custom instructions that embed the schema themselves
+            return self._chat_prefix(self.instruction.format(schema=schema)) + [
+                {
+                    "role": "user",
+                    "content": f"Question: {question}\nCypher output:"
+                }
+            ]
+
+        if self._static_chat is None:
+            self._static_chat = self._chat_prefix(self.instruction)
+        return self._static_chat + [
             {
                 "role": "user",
-                "content": CYPHER_GENERATION_INSTRUCTION,
+                "content": CYPHER_QUESTION_TEMPLATE.format(schema=schema, question=question)
+            }
+        ]
+
+    def _chat_prefix(self, instruction: str) -> list[dict]:
+        return [
+            {
+                "role": "user",
+                "content": instruction,
             },
             {
                 "role": "assistant",
                 "content": "Alright, from now on I will answer by writing only Cypher queries."
             }
-        ] + CHAT_CYPHER_EXAMPLES + [
-            {
-                "role": "user",
-                "content": f"Question: {question}\nCypher output:"
-            }
-        ]
-        
-        return chat
+        ] + CHAT_CYPHER_EXAMPLES
 
     def _postprocess_output_cypher(self, output_cypher: str) -> str:
         # Remove any explanation. E.g.  MATCH...\n\n**Explanation:**\n\n -> MATCH...
@@ -75,17 +115,30 @@ class CypherQueryGeneratorViaAPI(CypherQueryGenerator):
     This variant calls an endpoint containing the model. The endpoint is defined by calling `vllm serve [model_name]`.
     """
 
-    def __init__(self, model_name: str, instruction_template: str = None, openai_api_base_url: str = "http://localhost:8000/v1", openai_api_key: str = "EMPTY"):
+    def __init__(self, model_name: str, instruction_template: str = None, openai_api_base_url: str = "http://localhost:8000/v1", openai_api_key: str = "EMPTY", 
+                 cache_path: str = None, use_cache: bool = True, embedding_model: str = None, embedding_api_base_url: str = None, similarity_threshold: float = 0.95, use_templates: bool = True, prune_schema: bool = True, transport_settings: TransportSettings = None):
 
-        super().__init__(model_name, instruction_template)
+        super().__init__(model_name, instruction_template, use_templates, prune_schema)
 
         self.openai_api_key = openai_api_key
         self.open_api_base = openai_api_base_url
+        self.transport_settings = transport_settings
 
-        self.client = OpenAI(api_key=openai_api_key, base_url=openai_api_base_url)
+        self.client = get_client(openai_api_base_url, openai_api_key, transport_settings)
+
+        # Cache of previous translations, optionally with embedding-based lookups of near-repeated questions
+        embed_fn = None
+        if embedding_model is not None:
+            embedding_client = self.client if embedding_api_base_url is None else get_client(embedding_api_base_url, openai_api_key, transport_settings)
+            embed_fn = lambda text: embedding_client.embeddings.create(model=embedding_model, input=text).data[0].embedding
+        self.cache = TranslationCache(path=cache_path, embed_fn=embed_fn, similarity_threshold=similarity_threshold, namespace=self._cache_namespace()) if use_cache else None
 
     def __call__(self, question: str, schema: str) -> str:
 
+        cypher_query = self._lookup(question, schema)
+        if cypher_query is not None:
+            return cypher_query
+
         chat_response = self.client.chat.completions.create(
             model=self.model_name,
             messages=self._preprocess_input_chat(question, schema),
@@ -93,8 +146,59 @@ class CypherQueryGeneratorViaAPI(CypherQueryGenerator):
             temperature=self.model_generate_parameters['temperature'],
             top_p=self.model_generate_parameters['top_p'],
         )
+        cypher_query = chat_response.choices[0].message.content
+
+        if self.cache is not None:
+            self.cache.put(question, schema, cypher_query)
 
-        return chat_response.choices[0].message.content
+        return cypher_query
+
+    async def acall(self, question: str, schema: str) -> str:
+        """
+        Asynchronous version of __call__, using the pooled async client of the running event loop.
+        """
+        cypher_query = self._lookup(question, schema)
+        if cypher_query is not None:
+            return cypher_query
+
+        async_client = get_async_client(self.open_api_base, self.openai_api_key, self.transport_settings)
+        chat_response = await async_client.chat.completions.create(
+            model=self.model_name,
+            messages=self._preprocess_input_chat(question, schema),
+            max_tokens=self.model_generate_parameters['max_new_tokens'],
+            temperature=self.model_generate_parameters['temperature'],
+            top_p=self.model_generate_parameters['top_p'],
+        )
+        cypher_query = chat_response.choices[0].message.content
+
+        if self.cache is not None:
+            self.cache.put(question, schema, cypher_query)
+
+        return cypher_query
+
+    def invalidate(self, question: str, schema: str):
+        """
+        Forgets the cached translation of a question, e.g. because its query was rejected or failed.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(question, schema)
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    def _lookup(self, question: str, schema: str) -> str | None:
+        # Precompiled templates first, then previous translations
+        cypher_query = self._match_template(question, schema)
+        if cypher_query is None and self.cache is not None:
+            cypher_query = self.cache.get(question, schema)
+        return cypher_query
+
+    def prefix_cache_stats(self) -> dict[str, float] | None:
+        """
+        Prefix cache counters of the vLLM server behind the endpoint (see src.vllm_metrics).
+        """
+        return prefix_cache_stats(self.open_api_base)
         
 
         
@@ -104,9 +208,9 @@ class CypherQueryGeneratorLocal(CypherQueryGenerator):
     This variant runs the model locally on the machine.
     """
 
-    def __init__(self, model_name: str, instruction_template: str = None):
+    def __init__(self, model_name: str, instruction_template: str = None, use_templates: bool = True, prune_schema: bool = True):
 
-        super().__init__(model_name, instruction_template)
+        super().__init__(model_name, instruction_template, use_templates, prune_schema)
 
         #bnb_config = BitsAndBytesConfig(
         #    load_in_4bit=True,
@@ -134,6 +238,10 @@ class CypherQueryGeneratorLocal(CypherQueryGenerator):
     
     def __call__(self, question: str, schema: str) -> str:
 
+        cypher_query = self._match_template(question, schema)
+        if cypher_query is not None:
+            return cypher_query
+
         new_message = [self._preprocess_input_chat(question=question, schema=schema)]
         prompt = self.tokenizer.apply_chat_template(new_message, add_generation_prompt=True, tokenize=False)
         inputs = self.tokenizer(prompt, return_tensors="pt", padding=True)
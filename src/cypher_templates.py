@@ -0,0 +1,72 @@
+import re
+
+from src.schema_utils import label_aliases
+
+
+# IFC global ids are 22 characters long, encoded with the IFC base64 alphabet
+IFC_GLOBAL_ID = r"[0-9A-Za-z_$]{22}"
+
+_SCOPE = r"(?:\s+(?:are\s+there|exist|are\s+in\s+the\s+(?:building|house|model|scene)|does\s+the\s+(?:building|house)\s+have|do\s+we\s+have))?(?:\s+in\s+(?:the|this)\s+(?:building|house|model|scene))?"
+
+COUNT_PATTERN = re.compile(r"^(?:how\s+many|count(?:\s+the)?(?:\s+number\s+of)?|what\s+is\s+the\s+number\s+of)\s+(?P<element>[a-z ]+?)" + _SCOPE + r"$", re.IGNORECASE)
+LIST_PATTERN = re.compile(r"^(?:list|show\s+me|show|give\s+me|return|get|find|which\s+are|what\s+are)(?:\s+all)?(?:\s+(?:of\s+)?the)?\s+(?P<element>[a-z ]+?)" + _SCOPE + r"$", re.IGNORECASE)
+PROPERTY_PATTERN = re.compile(r"^(?:what\s+is|what's|give\s+me|return|get)\s+the\s+(?P<property>name|type|height|width|depth|volume)\s+of\s+(?:the\s+)?(?P<element>[a-z ]+?)\s+with\s+(?:the\s+)?(?:id|global\s+id|guid)\s+'?(?P<id>" + IFC_GLOBAL_ID + r")'?$", re.IGNORECASE)
+
+PROPERTY_RETURNS = {
+    "name": "n.IFC_name AS name",
+    "type": "n.IFC_type AS type",
+    "height": "apoc.convert.fromJsonMap(n.bbox_dimensions).bbox_height AS height",
+    "width": "apoc.convert.fromJsonMap(n.bbox_dimensions).bbox_width AS width",
+    "depth": "apoc.convert.fromJsonMap(n.bbox_dimensions).bbox_depth AS depth",
+    "volume": "apoc.convert.fromJsonMap(n.bbox_dimensions).bbox_volume AS volume",
+}
+
+
+def match_cypher_template(question: str, schema: str) -> str | None:
+    """
+    Translates the most frequent question classes (counts, lists by IFC type and properties of an element given its
+    ID) directly into Cypher, without calling the LLM.
+
+    The whole question must match one of the templates, and the elements it mentions must be node labels of the
+    schema. Returns None otherwise, so that the question is sent to the LLM.
+    """
+    question = " ".join(question.strip().rstrip("?.!").split())
+
+    match = PROPERTY_PATTERN.match(question)
+    if match is not None:
+        labels = label_aliases(schema).get(match.group("element").lower())
+        if labels is not None:
+            # The ID is validated by IFC_GLOBAL_ID, so it can not break out of the string literal
+            return union_query(labels, f"""MATCH (n:{{label}} {{{{IFC_global_id: '{match.group("id")}'}}}})
+RETURN {PROPERTY_RETURNS[match.group("property").lower()]}""")
+
+    match = COUNT_PATTERN.match(question)
+    if match is not None:
+        labels = label_aliases(schema).get(match.group("element").lower())
+        if labels is not None:
+            if len(labels) == 1:
+                # Answered from the count store, without reading the nodes
+                return f"""MATCH (n:{labels[0]})
+RETURN count(n) AS count"""
+            # Every node has a single label (its IFC type), so the counts per label can be added up
+            return f"""CALL {{
+{union_query(labels, "MATCH (n:{label}) RETURN count(n) AS count")}
+}}
+RETURN sum(count) AS count"""
+
+    match = LIST_PATTERN.match(question)
+    if match is not None:
+        labels = label_aliases(schema).get(match.group("element").lower())
+        if labels is not None:
+            return union_query(labels, """MATCH (n:{label})
+RETURN n.IFC_global_id AS id, n.IFC_name AS name, n.IFC_type AS type""")
+
+    return None
+
+
+def union_query(labels: list[str], query: str) -> str:
+    """
+    Repeats a query (with a {label} placeholder) for each label, so that each part uses the label scan or index of
+    its label, and joins the parts with UNION ALL.
+    """
+    return "\nUNION ALL\n".join(query.format(label=label) for label in labels)
@@ -1,5 +1,4 @@
 from abc import ABC, abstractmethod
-from openai import OpenAI
 import os
 import re
 from peft import PeftModel, PeftConfig
@@ -17,6 +16,8 @@ from src.prompting.sandbox_prompts import SANDBOX_PROMPT, SANDBOX_VERBALIZATION_
 from src.prompting.cypher_prompts import CYPHER_VERBALIZATION_PROMPT
 from src.prompting.router_prompts import ROUTER_PROMPT
 from src.prompting.retrieval_prompts import RETRIEVAL_PROMPT, CHAT_RETRIEVAL_EXAMPLES
+from src.vllm_metrics import prefix_cache_stats
+from src.llm_transport import TransportSettings, get_async_client, get_client
 
 import re
 
@@ -52,6 +53,9 @@ class HelperLLM(ABC):
                 "retrieval_api": RETRIEVAL_PROMPT,
                 "query_classification": ROUTER_PROMPT
             }
+
+        # Instructions formatted with static content (e.g. API documentation), reused across calls
+        self._formatted_instructions = {}
  
 
     @abstractmethod
@@ -61,9 +65,7 @@ class HelperLLM(ABC):
 
     def _preprocess_input_chat(self, input_data: dict[str, str], instruction_type: str) -> list[dict]:
         if instruction_type == "sandbox_api":
-            content = self.instructions[instruction_type].format(
-                api_documentation=input_data['api_documentation'],
-            )
+            content = self._format_instruction(instruction_type, api_documentation=input_data['api_documentation'])
             chat = [
                 {
                     "role": "user",
@@ -110,9 +112,7 @@ class HelperLLM(ABC):
                 }
             ]
         elif instruction_type == "retrieval_api":
-            content = self.instructions[instruction_type].format(
-                api_documentation=input_data['api_documentation'],
-            )
+            content = self._format_instruction(instruction_type, api_documentation=input_data['api_documentation'])
             chat = [
                 {
                     "role": "user",
@@ -143,6 +143,14 @@ class HelperLLM(ABC):
         return chat
 
 
+    def _format_instruction(self, instruction_type: str, **static_fields) -> str:
+        # Static instructions go first in the chat, so they must be byte-identical across calls for the
+        # server to reuse their prefix cache; they are formatted only once
+        key = (instruction_type, tuple(sorted(static_fields.items())))
+        if key not in self._formatted_instructions:
+            self._formatted_instructions[key] = self.instructions[instruction_type].format(**static_fields)
+        return self._formatted_instructions[key]
+
     def _postprocess_output_python(self, output_python: str) -> str:
         # Remove any explanation. E.g.  a = 2...\n\n**Explanation:**\n\n -> a = 2...
         # Remove python indicator. E.g.```python\na = 2...``` --> a = 2...
@@ -162,38 +170,82 @@ class HelperLLMViaAPI(HelperLLM):
     This variant calls an endpoint containing the model. The endpoint is defined by calling `vllm serve [model_name]`.
     """
 
-    def __init__(self, model_name: str, instruction_templates: dict[str, str] = None, openai_api_base_url: str = "http://localhost:8000/v1", openai_api_key: str = "EMPTY", enable_thinking: bool = False):
+    def __init__(self, model_name: str, instruction_templates: dict[str, str] = None, openai_api_base_url: str = "http://localhost:8000/v1", openai_api_key: str = "EMPTY", enable_thinking: bool = False, transport_settings: TransportSettings = None):
 
         super().__init__(model_name, instruction_templates)
 
         self.openai_api_key = openai_api_key
         self.open_api_base = openai_api_base_url
+        self.transport_settings = transport_settings
         self.model_generate_parameters["do_sample"] = True
 
-        self.client = OpenAI(api_key=openai_api_key, base_url=openai_api_base_url)
+        self.client = get_client(openai_api_base_url, openai_api_key, transport_settings)
 
     def __call__(self, input_data: dict[str, str], instruction_type: str) -> str:
-
-        stop_sequences = None
-        if instruction_type == "react_reasoning":
-            stop_sequences = ["Observation:", "\nObservation:", "Observation :", "\nObservation :"]  # Stop before generating observations
     
         try:
-            chat_response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=self._preprocess_input_chat(input_data, instruction_type),
-                temperature=self.model_generate_parameters['temperature'],
-                top_p=self.model_generate_parameters['top_p'],
-                stop=stop_sequences,
-                extra_body={"chat_template_kwargs": {"enable_thinking": False}} # TODO: Make it relative
-            )
+            chat_response = self.client.chat.completions.create(**self._request_parameters(input_data, instruction_type))
+        except Exception as e:
+            return f"Error during API call: {e}"
+
+        return self._postprocess_response(chat_response, instruction_type)
+
+    async def acall(self, input_data: dict[str, str], instruction_type: str) -> str:
+        """
+        Asynchronous version of __call__, using the pooled async client of the running event loop.
+        """
+        async_client = get_async_client(self.open_api_base, self.openai_api_key, self.transport_settings)
+        try:
+            chat_response = await async_client.chat.completions.create(**self._request_parameters(input_data, instruction_type))
         except Exception as e:
             return f"Error during API call: {e}"
 
+        return self._postprocess_response(chat_response, instruction_type)
+
+    def stream(self, input_data: dict[str, str], instruction_type: str):
+        """
+        Yields the completion in chunks as they are generated. Closing the generator closes the connection,
+        which makes the server abort the generation.
+        """
+        try:
+            response = self.client.chat.completions.create(**self._request_parameters(input_data, instruction_type), stream=True)
+        except Exception as e:
+            yield f"Error during API call: {e}"
+            return
+
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            response.close()
+
+    def _request_parameters(self, input_data: dict[str, str], instruction_type: str) -> dict:
+
+        stop_sequences = None
+        if instruction_type == "react_reasoning":
+            stop_sequences = ["Observation:", "\nObservation:", "Observation :", "\nObservation :"]  # Stop before generating observations
+
+        return dict(
+            model=self.model_name,
+            messages=self._preprocess_input_chat(input_data, instruction_type),
+            temperature=self.model_generate_parameters['temperature'],
+            top_p=self.model_generate_parameters['top_p'],
+            stop=stop_sequences,
+            extra_body={"chat_template_kwargs": {"enable_thinking": False}} # TODO: Make it relative
+        )
+
+    def _postprocess_response(self, chat_response, instruction_type: str) -> str:
         if instruction_type == "sandbox_api" or instruction_type == "retrieval_api":
             return self._postprocess_output_python(chat_response.choices[0].message.content)
         else:
             return chat_response.choices[0].message.content
+
+    def prefix_cache_stats(self) -> dict[str, float] | None:
+        """
+        Prefix cache counters of the vLLM server behind the endpoint (see src.vllm_metrics).
+        """
+        return prefix_cache_stats(self.open_api_base)
                 
         
 
@@ -0,0 +1,73 @@
+"""
+Offline IFC -> CSV -> `neo4j-admin database import` pipeline for models that are too large for Cypher inserts.
+
+Usage (from the repository root, with the Neo4j server stopped):
+
+    python -m src.ifc2graph.admin_import --ifc data/ifc/AC20-FZK-Haus.ifc --database neo4j
+"""
+import argparse
+import logging
+import os
+import subprocess
+
+from src.ifc2graph.custom_neo4j import CustomNeo4j
+from src.ifc2graph.graph_cache import ifc_graph_tables
+
+
+# Delimiter of list properties, a control character (the unit separator) that IFC strings do not contain,
+# since neo4j-admin has no way to escape it within array items
+ARRAY_DELIMITER = "\x1f"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert an IFC file to neo4j-admin import CSVs and (optionally) import them.")
+    parser.add_argument('--ifc', type=str, required=True, help="Path to the IFC file")
+    parser.add_argument('--output', type=str, default=None, help="Directory for the CSV files (default: data/import/<IFC name>)")
+    parser.add_argument('--database', type=str, default="neo4j", help="Name of the database to (re)create")
+    parser.add_argument('--neo4j-home', type=str, default="src/neo4j/neo4j-community-5.16.0", help="Neo4j installation directory")
+    parser.add_argument('--workers', type=int, default=1, help="Threads used to tessellate the IFC geometry")
+    parser.add_argument('--building', type=str, default=None, help="Tag the nodes and relationships with this building name, for databases shared by several buildings (buildingIsolation: property)")
+    parser.add_argument('--no-cache', action='store_true', help="Ignore the on-disk conversion cache")
+    parser.add_argument('--csv-only', action='store_true', help="Only write the CSV files, do not run neo4j-admin")
+    args = parser.parse_args()
+    return args
+
+
+def import_command(neo4j_home: str, database: str, files: dict[str, list[str]]) -> list[str]:
+    """Build the `neo4j-admin database import full` command for the written CSV files."""
+    command = [
+        os.path.join(neo4j_home, "bin", "neo4j-admin"), "database", "import", "full",
+        "--overwrite-destination=true",
+        "--id-type=integer",
+        "--multiline-fields=true",
+        f"--array-delimiter=U+{ord(ARRAY_DELIMITER):04X}",
+    ]
+    command += [f"--nodes={path}" for path in files["nodes"]]
+    command += [f"--relationships={path}" for path in files["relationships"]]
+    command.append(database)
+    return command
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    ifc_name = os.path.splitext(os.path.basename(args.ifc))[0]
+    output = args.output if args.output is not None else os.path.join("data", "import", ifc_name)
+
+    nodes, relationships = ifc_graph_tables(args.ifc, workers=args.workers, use_cache=not args.no_cache, building=args.building)
+    files = CustomNeo4j.ExportToAdminImport(nodes, relationships, output, bidirectional=True, arrayDelimiter=ARRAY_DELIMITER)
+    logging.info(f"Wrote {len(files['nodes'])} node and {len(files['relationships'])} relationship files to {output}")
+
+    command = import_command(args.neo4j_home, args.database, files)
+    if args.csv_only:
+        print(" ".join(command))
+        return
+
+    logging.info("Running neo4j-admin import (the database must be stopped)...")
+    subprocess.run(command, check=True)
+    logging.info(f"Database '{args.database}' imported. Start Neo4j and create the indexes with IFCGraphHandler or CustomNeo4j.CreateIndexes.")
+
+
+if __name__ == "__main__":
+    main()
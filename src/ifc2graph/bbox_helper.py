@@ -16,6 +16,30 @@ def boundingBox(vertices, mantissa=6):
     
     return ([min(x), min(y), min(z), max(x), max(y), max(z)])
 
+def points_array(points, mantissa=6):
+    """
+    Returns the input coordinates (e.g. a flat shape.geometry.verts buffer) as a rounded (N, 3) float array.
+    Raises a ValueError if there are no coordinates.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if len(points) == 0:
+        raise ValueError("No vertex coordinates given.")
+    return np.round(points, mantissa)
+
+def boundingBoxFromArray(points, mantissa=6):
+    """
+    Vectorized version of boundingBox for an (N, 3) array of coordinates.
+    """
+    points = points_array(points, mantissa=mantissa)
+    return points.min(axis=0).tolist() + points.max(axis=0).tolist()
+
+def centroidFromArray(points, mantissa=6):
+    """
+    Returns the [x, y, z] centroid of an (N, 3) array of coordinates.
+    """
+    points = points_array(points, mantissa=mantissa)
+    return np.round(points.mean(axis=0), mantissa).tolist()
+
 def width_height_depth(bbox):
     """
     Returns the width, depth and height of a bounding box.
@@ -133,4 +157,21 @@ def compute_dimensions(vertices, mantissa=6):
         # "oriented_bbox": oriented_bbox,
         **bbox_dimensions,
         # **oriented_bbox_dimensions # Commented out to avoid duplicate values
-    }
\ No newline at end of file
+    }
+
+
+def compute_dimensions_from_array(points, mantissa=6):
+    """
+    Computes the dimensions of the axis-aligned bounding box of an (N, 3) array of coordinates, without building a
+    topologic Vertex per point. The oriented bounding box of compute_dimensions is skipped, its dimensions are not
+    part of the output.
+    """
+    try:
+        bbox = boundingBoxFromArray(points, mantissa=mantissa)
+    except ValueError:
+        return {key: value for key, value in empty_dimensions().items() if not key.startswith("oriented_")}
+
+    bbox_dimensions, _ = width_height_depth(bbox)
+    return {
+        **bbox_dimensions,
+    }
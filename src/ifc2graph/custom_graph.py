@@ -1,6 +1,5 @@
 import os
 
-from datetime import datetime
 import warnings
 import math
 
@@ -8,7 +7,8 @@ import topologicpy
 from topologicpy.Graph import Graph
 
 # from src.ifc2graph.custom_topology import CustomTopology
-from src.ifc2graph.bbox_helper import compute_dimensions, empty_dimensions
+from src.ifc2graph.bbox_helper import centroidFromArray, compute_dimensions_from_array, empty_dimensions
+from src.ifc2graph.spatial_grid import addToGrid, hasNeighbourWithin
 
 
 
@@ -33,7 +33,8 @@ class CustomGraph(Graph):
                   removeCoplanarFaces: bool = False,
                   xMin: float = -0.5, yMin: float = -0.5, zMin: float = -0.5,
                   xMax: float = 0.5, yMax: float = 0.5, zMax: float = 0.5,
-                  tolerance: float = 0.0001):
+                  tolerance: float = 0.0001,
+                  workers: int = 1):
         """
         Create a Graph from an IFC file. This code is partially based on code from Bruno Postle.
 
@@ -71,6 +72,8 @@ class CustomGraph(Graph):
             The desired maximum value to assign for a vertex's Z coordinate. The default is 0.5.
         tolerance : float , optional
             The desired tolerance. The default is 0.0001.
+        workers : int , optional
+            The number of threads used to tessellate the IFC geometry. If greater than 1, the multi-threaded ifcopenshell geometry iterator is used. The default is 1.
         
         Returns
         -------
@@ -105,16 +108,16 @@ class CustomGraph(Graph):
             except:
                 warnings.warn("Graph.ByIFCFile - Error: Could not import ifcopenshell. Please try to install ifcopenshell manually. Returning None.")
                 return None
-        
-        import random
 
-        def vertexAtKeyValue(vertices, key, value):
-            for v in vertices:
+        def vertexIndexByKey(vertices, key):
+            # Map each dictionary value to its (vertex, index) pair, built once per graph
+            index = {}
+            for i, v in enumerate(vertices):
                 d = Topology.Dictionary(v)
                 d_value = Dictionary.ValueAtKey(d, key)
-                if value == d_value:
-                    return v
-            return None
+                if d_value is not None and d_value not in index:
+                    index[d_value] = (v, i)
+            return index
 
         def IFCObjects(ifc_file, include=[], exclude=[]):
             include = [s.lower() for s in include]
@@ -278,14 +281,54 @@ class CustomGraph(Graph):
             
             return color, default_transparency, material_list
 
-        def vertexByIFCObject(ifc_object, object_types, restrict=False, prev_vertices=None, ndo_info=None):
+        def geometryByIFCObjects(ifc_file, ifc_objects, workers=1, topology=False):
+            # Tessellate every product once; all later stages read verts (and edges/faces if topology) from here
             settings = ifcopenshell.geom.settings()
             settings.set(settings.USE_WORLD_COORDS,True)
-            try:
-                shape = ifcopenshell.geom.create_shape(settings, ifc_object)
-            except:
-                shape = None
-            if shape or restrict == False: #Only add vertices of entities that have 3D geometries.
+
+            def geometryByShape(shape):
+                geometry = {"verts": ifcopenshell.util.shape.get_vertices(shape.geometry)}
+                if topology:
+                    # Edges and faces are only needed to rebuild the BREP of the product
+                    geometry["edges"] = ifcopenshell.util.shape.get_edges(shape.geometry)
+                    geometry["faces"] = ifcopenshell.util.shape.get_faces(shape.geometry)
+                return geometry
+
+            geometries = {}
+            if workers > 1 and len(ifc_objects) > 0:
+                # The geometry iterator tessellates the products in parallel threads
+                try:
+                    iterator = ifcopenshell.geom.iterator(settings, ifc_file, workers, include=ifc_objects)
+                    if iterator.initialize():
+                        while True:
+                            shape = iterator.get()
+                            try:
+                                geometries[shape.id] = geometryByShape(shape)
+                            except Exception as e:
+                                # Retried by the serial pass below
+                                print("Graph.ByIFCFile - Warning: Could not read the geometry of the IFC object", shape.guid, "(" + str(e) + ").")
+                            if not iterator.next():
+                                break
+                except Exception as e:
+                    print("Graph.ByIFCFile - Warning: The geometry iterator failed (" + str(e) + "). Falling back to serial tessellation.")
+
+            # Serial pass, also used for the products the iterator skipped (e.g. openings and spaces)
+            for ifc_object in ifc_objects:
+                if ifc_object.id() in geometries:
+                    continue
+                if not hasattr(ifc_object, "Representation") or ifc_object.Representation is None:
+                    continue
+                try:
+                    shape = ifcopenshell.geom.create_shape(settings, ifc_object)
+                    geometries[ifc_object.id()] = geometryByShape(shape)
+                except Exception as e:
+                    # A product that cannot be tessellated is skipped, the rest of the import goes on
+                    print("Graph.ByIFCFile - Warning: Could not tessellate the IFC object", getattr(ifc_object, 'GlobalId', ifc_object.id()), "of type", ifc_object.is_a(), "(" + str(e) + ").")
+            return geometries
+
+        def vertexByIFCObject(ifc_object, object_types, restrict=False, prev_vertex_grid=None, ndo_info=None, geometries=None):
+            geometry = (geometries or {}).get(ifc_object.id())
+            if geometry or restrict == False: #Only add vertices of entities that have 3D geometries.
                 obj_id = ifc_object.id()
                 psets = ifcopenshell.util.element.get_psets(ifc_object)
                 obj_type = ifc_object.is_a()
@@ -307,13 +350,10 @@ class CustomGraph(Graph):
                     LongName = "Untitled"
                 label = str(obj_id)+" "+LongName+" ("+obj_type+" "+str(obj_type_id)+")"
                 
-                random.seed(datetime.now().timestamp())
                 is_ndo = False
                 if label not in ndo_info["ndo"]:
-                    grouped_verts = ifcopenshell.util.shape.get_vertices(shape.geometry)
-                    vertices = [Vertex.ByCoordinates(list(coords)) for coords in grouped_verts]
-                    centroid = Vertex.Centroid(vertices)
-                    bbox_info = compute_dimensions(vertices)
+                    centroid = Vertex.ByCoordinates(centroidFromArray(geometry["verts"]))
+                    bbox_info = compute_dimensions_from_array(geometry["verts"])
                 else:
                     row, column, depth = -1, -1, -1
                     idx = ndo_info['ndo'].index(label)
@@ -336,24 +376,16 @@ class CustomGraph(Graph):
                 
                 # Avoid overlapping vertices
                 centroid_offset = [0.0, 0.0, 0.0]
-                new_centroid = Vertex.ByCoordinates(centroid.X(), centroid.Y(), centroid.Z())
-                found_vert = False
                 value = ndo_info['ndo_distance']
-                for vert in prev_vertices:
-                    while Vertex.Distance(vert, new_centroid, mantissa=6) < value - 1e-6:
-                        # print(vert, new_centroid, "is too close. Adding random offset.")
-                        # If the vertex already exists, add random offset to the centroid
-                        centroid_offset = [centroid_offset[0] + random.uniform(value, value), centroid_offset[1] + random.uniform(-value, value), centroid_offset[2] + random.uniform(-value, value)]
-                        # print(centroid_offset)
-                        new_centroid = Vertex.ByCoordinates(centroid.X() + centroid_offset[0], centroid.Y() + centroid_offset[1], centroid.Z() + centroid_offset[2])
-                        # print(centroid.X(), centroid.Y(), centroid.Z())
-                        # print(new_centroid.X(), new_centroid.Y(), new_centroid.Z())
-                    if Vertex.Distance(centroid, new_centroid, mantissa=6) > value:
-                        found_vert = True
-                        break
-
-                if found_vert:
-                    centroid = Vertex.ByCoordinates(new_centroid.X(), new_centroid.Y(), new_centroid.Z())
+                coords = [Vertex.X(centroid, mantissa=6), Vertex.Y(centroid, mantissa=6), Vertex.Z(centroid, mantissa=6)]
+                new_coords = coords
+                while hasNeighbourWithin(prev_vertex_grid, new_coords, value):
+                    # If the position is already taken, shift the centroid along the X axis
+                    centroid_offset[0] += value
+                    new_coords = [coords[0] + centroid_offset[0], coords[1], coords[2]]
+
+                if centroid_offset[0] > 0:
+                    centroid = Vertex.ByCoordinates(new_coords[0], new_coords[1], new_coords[2])
                 
                 # Store relevant information
                 if transferDictionaries == True:
@@ -392,25 +424,19 @@ class CustomGraph(Graph):
                     topology_dict = Dictionary.ByMergedDictionaries([topology_dict, pset_dict])
                     if storeBREP == True or useInternalVertex == True:
                         shape_topology = None
-                        if hasattr(ifc_object, "Representation") and ifc_object.Representation:
-                            for rep in ifc_object.Representation.Representations:
-                                if rep.is_a("IfcShapeRepresentation"):
-                                    try:
-                                        # Generate the geometry for this entity
-                                        shape = ifcopenshell.geom.create_shape(settings, ifc_object)
-                                        # Get grouped vertices and grouped faces     
-                                        grouped_verts = shape.geometry.verts
-                                        verts = [ [grouped_verts[i], grouped_verts[i + 1], grouped_verts[i + 2]] for i in range(0, len(grouped_verts), 3)]
-                                        grouped_edges = shape.geometry.edges
-                                        edges = [[grouped_edges[i], grouped_edges[i + 1]] for i in range(0, len(grouped_edges), 2)]
-                                        grouped_faces = shape.geometry.faces
-                                        faces = [ [grouped_faces[i], grouped_faces[i + 1], grouped_faces[i + 2]] for i in range(0, len(grouped_faces), 3)]
-                                        shape_topology = Topology.ByGeometry(verts, edges, faces, silent=True)
-                                        if not shape_topology == None:
-                                            if removeCoplanarFaces == True:
-                                                shape_topology = Topology.RemoveCoplanarFaces(shape_topology, epsilon=0.0001)
-                                    except:
-                                        pass
+                        if geometry and hasattr(ifc_object, "Representation") and ifc_object.Representation:
+                            if any(rep.is_a("IfcShapeRepresentation") for rep in ifc_object.Representation.Representations):
+                                try:
+                                    # Reuse the cached geometry for this entity
+                                    verts = geometry["verts"].tolist()
+                                    edges = geometry["edges"].tolist()
+                                    faces = geometry["faces"].tolist()
+                                    shape_topology = Topology.ByGeometry(verts, edges, faces, silent=True)
+                                    if not shape_topology == None:
+                                        if removeCoplanarFaces == True:
+                                            shape_topology = Topology.RemoveCoplanarFaces(shape_topology, epsilon=0.0001)
+                                except:
+                                    pass
                         # print(f"# IFC Object: {ifc_object.GlobalId} - {ifc_object.Name} - {ifc_object.is_a()}")
                         if not shape_topology == None and storeBREP:
                             topology_dict = Dictionary.SetValuesAtKeys(topology_dict, ["brep", "brepType", "brepTypeString"], [Topology.BREPString(shape_topology), Topology.Type(shape_topology), Topology.TypeAsString(shape_topology)])
@@ -421,8 +447,9 @@ class CustomGraph(Graph):
             return None
 
         def edgesByIFCRelationships(ifc_relationships, ifc_types, vertices):
-            tuples = []
+            pairs = set()
             edges = []
+            vertex_index = vertexIndexByKey(vertices, key="IFC_global_id")
 
             for ifc_rel in ifc_relationships:
                 source = None
@@ -466,38 +493,31 @@ class CustomGraph(Graph):
                 else:
                     print("Graph.ByIFCFile - Warning: The relationship", ifc_rel, "is not supported. Skipping.")
                 if source:
-                    sv = vertexAtKeyValue(vertices, key="IFC_global_id", value=getattr(source, 'GlobalId', 0))
-                    if sv:
-                        si = Vertex.Index(sv, vertices, tolerance=tolerance)
-                        if not si == None:
-                            for destination in destinations:
-                                if destination == None:
-                                    continue
-                                ev = vertexAtKeyValue(vertices, key="IFC_global_id", value=getattr(destination, 'GlobalId', 0),)
-                                if ev:
-                                    ei = Vertex.Index(ev, vertices, tolerance=tolerance)
-                                    if not ei == None:
-                                        if not([si,ei] in tuples or [ei,si] in tuples):
-                                            tuples.append([si,ei])
-                                            e = Edge.ByVertices([sv,ev])
-                                            d = Dictionary.ByKeysValues(["IFC_global_id", "IFC_name", "IFC_type"], [ifc_rel.id(), ifc_rel.Name, ifc_rel.is_a()])
-                                            e = Topology.SetDictionary(e, d)
-                                            edges.append(e)
+                    source_entry = vertex_index.get(getattr(source, 'GlobalId', 0))
+                    if source_entry:
+                        sv, si = source_entry
+                        for destination in destinations:
+                            if destination == None:
+                                continue
+                            destination_entry = vertex_index.get(getattr(destination, 'GlobalId', 0))
+                            if destination_entry:
+                                ev, ei = destination_entry
+                                if not((si,ei) in pairs or (ei,si) in pairs):
+                                    pairs.add((si,ei))
+                                    e = Edge.ByVertices([sv,ev])
+                                    d = Dictionary.ByKeysValues(["IFC_global_id", "IFC_name", "IFC_type"], [getattr(ifc_rel, 'GlobalId', ifc_rel.id()), ifc_rel.Name, ifc_rel.is_a()])
+                                    e = Topology.SetDictionary(e, d)
+                                    edges.append(e)
             return edges
         
-        def compute_bbox_for_non_dimensional_objects(ifc_objects, ifc_types):
-
-            settings = ifcopenshell.geom.settings()
-            settings.set(settings.USE_WORLD_COORDS,True)
+        def compute_bbox_for_non_dimensional_objects(ifc_objects, ifc_types, geometries):
 
             centroids = []
             non_dimensional_objects = []
             for ifc_object in ifc_objects:
                 try:
-                    shape = ifcopenshell.geom.create_shape(settings, ifc_object)
-                    grouped_verts = ifcopenshell.util.shape.get_vertices(shape.geometry)
-                    vertices = [Vertex.ByCoordinates(list(coords)) for coords in grouped_verts]
-                    centroids.append(Vertex.Centroid(vertices))
+                    geometry = geometries[ifc_object.id()]
+                    centroids.append(centroidFromArray(geometry["verts"]))
                 except Exception as e:
                     obj_id = ifc_object.id()
                     psets = ifcopenshell.util.element.get_psets(ifc_object)
@@ -542,9 +562,9 @@ class CustomGraph(Graph):
                     "ndo_distance": inter_ndo_distance
                 }
             
-            x_coords = [c.X() for c in centroids]
-            y_coords = [c.Y() for c in centroids]
-            z_coords = [c.Z() for c in centroids]
+            x_coords = [c[0] for c in centroids]
+            y_coords = [c[1] for c in centroids]
+            z_coords = [c[2] for c in centroids]
 
             # Second grade equation to compute the bounding box for non-dimensional objects
             a, b, c = 1, 1, -ndo_count*2
@@ -572,18 +592,17 @@ class CustomGraph(Graph):
         ifc_types = IFCObjectTypes(file)
         ifc_objects = IFCObjects(file, include=includeTypes, exclude=excludeTypes)
 
-        ndo_info = compute_bbox_for_non_dimensional_objects(ifc_objects, ifc_types)  # This is just to ensure the dimensions are computed, but not used here.
+        geometries = geometryByIFCObjects(file, ifc_objects, workers=workers, topology=storeBREP or useInternalVertex)
+        ndo_info = compute_bbox_for_non_dimensional_objects(ifc_objects, ifc_types, geometries)  # This is just to ensure the dimensions are computed, but not used here.
 
         vertices = []
+        vertex_grid = {}
         # print("BEFORE")
         for ifc_object in ifc_objects:
-            v = vertexByIFCObject(ifc_object, ifc_types, prev_vertices=vertices, ndo_info=ndo_info)
-            elem = topologicpy.Dictionary.Dictionary.PythonDictionary(Topology.Dictionary(v))
-            # if elem['IFC_type'] == "IfcOpeningElement":
-            # print(f"{elem['IFC_type'].ljust(24, ' ')}{elem['TOPOLOGIC_id'].ljust(32, ' ')} {v.X():2.6f},{v.Y():2.6f},{v.Z():2.6f}")
-            # print(elem['IFC_type'], Topology.Geometry(v, mantissa=6)['vertices'][0])
+            v = vertexByIFCObject(ifc_object, ifc_types, prev_vertex_grid=vertex_grid, ndo_info=ndo_info, geometries=geometries)
             if v:
                 vertices.append(v)
+                addToGrid(vertex_grid, [Vertex.X(v, mantissa=6), Vertex.Y(v, mantissa=6), Vertex.Z(v, mantissa=6)], ndo_info['ndo_distance'])
         # print("AFTER")
         # print(len(vertices), "vertices created from", len(ifc_objects), "IFC objects.")
         # for v in vertices:
@@ -606,7 +625,8 @@ class CustomGraph(Graph):
                   useInternalVertex=False,
                   storeBREP=False,
                   removeCoplanarFaces=False,
-                  xMin=-0.5, yMin=-0.5, zMin=-0.5, xMax=0.5, yMax=0.5, zMax=0.5):
+                  xMin=-0.5, yMin=-0.5, zMin=-0.5, xMax=0.5, yMax=0.5, zMax=0.5,
+                  workers=1):
         """
         Create a Graph from an IFC path. This code is partially based on code from Bruno Postle.
 
@@ -642,6 +662,8 @@ class CustomGraph(Graph):
             The desired maximum value to assign for a vertex's Y coordinate. The default is 0.5.
         zMax : float, optional
             The desired maximum value to assign for a vertex's Z coordinate. The default is 0.5.
+        workers : int , optional
+            The number of threads used to tessellate the IFC geometry. If greater than 1, the multi-threaded ifcopenshell geometry iterator is used. The default is 1.
         
         Returns
         -------
@@ -687,7 +709,8 @@ class CustomGraph(Graph):
                                useInternalVertex=useInternalVertex,
                                storeBREP=storeBREP,
                                removeCoplanarFaces=removeCoplanarFaces,
-                               xMin=xMin, yMin=yMin, zMin=zMin, xMax=xMax, yMax=yMax, zMax=zMax)
+                               xMin=xMin, yMin=yMin, zMin=zMin, xMax=xMax, yMax=yMax, zMax=zMax,
+                               workers=workers)
 
 
 
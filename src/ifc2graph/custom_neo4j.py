@@ -34,6 +34,37 @@ except:
     except:
         warnings.warn("Neo4j - Error: Could not import neo4j")
 
+
+# Property that tags the nodes and relationships of each building, when several buildings share one database
+BUILDING_KEY = "building"
+
+
+def buildingScope(variable: str, building: str = None) -> str:
+    """
+    Returns a Cypher predicate restricting a node variable to the given building (always true if building is None).
+    Untagged nodes, loaded before buildings were tagged, are included so that they are adopted by the building.
+    """
+    if building is None:
+        return "true"
+    return f"({variable}.{BUILDING_KEY} = $building OR {variable}.{BUILDING_KEY} IS NULL)"
+
+
+def sanitize_for_neo4j(identifier):
+    """
+    Replaces illegal characters in Neo4j labels or relationship types with an underscore ('_').
+    Ensures the identifier starts with an alphabetic character and contains only valid characters.
+    """
+    import re
+    # Replace any non-alphanumeric characters with underscores
+    sanitized = re.sub(r'[^a-zA-Z0-9]', '_', identifier)
+
+    # Ensure the identifier starts with an alphabetic character
+    if not sanitized[0].isalpha():
+        sanitized = f"_{sanitized}"
+
+    return sanitized
+
+
 class CustomNeo4j:    
     @staticmethod
     def ExportToGraph(neo4jGraph, cypher=None, xMin=-0.5, yMin=-0.5, zMin=-0.5, xMax=0.5, yMax=0.5, zMax=0.5, tolerance=0.0001, silent=False):
@@ -204,6 +235,605 @@ class CustomNeo4j:
         
         return neo4jGraph
 
+    @staticmethod
+    def GraphTables(graph,
+                    vertexLabelKey: str = "label",
+                    defaultVertexLabel: str = "NODE",
+                    vertexCategoryKey: str = "category",
+                    defaultVertexCategory: str = None,
+                    edgeLabelKey: str = "label",
+                    defaultEdgeLabel: str = "CONNECTED_TO",
+                    edgeCategoryKey: str = "category",
+                    defaultEdgeCategory: str = None,
+                    mantissa: int = 6,
+                    tolerance: float = 0.0001,
+                    building: str = None):
+        """
+        Converts a Topologic graph to the node and relationship property tables that are written to Neo4j.
+
+        Parameters
+        ----------
+        graph : topologic_core.Graph
+            The input topologic graph.
+        vertexLabelKey : str , optional
+            The returned vertices are labelled according to the dictionary values stored under this key.
+            If the vertexLabelKey does not exist, it will be created and the vertices are labelled numerically using the format defaultVertexLabel_XXX. The default is "label".
+        defaultVertexLabel : str , optional
+            The default vertex label to use if no value is found under the vertexLabelKey. The default is "NODE".
+        vertexCategoryKey : str , optional
+            The returned vertices are categorized according to the dictionary values stored under this key. The dfefault is "category".
+        defaultVertexCategory : str , optional
+            The default vertex category to use if no value is found under the vertexCategoryKey. The default is None.
+        edgeLabelKey : str , optional
+            The returned edges are labelled according to the dictionary values stored under this key.
+            If the edgeLabelKey does not exist, it will be created and the edges are labelled numerically using the format defaultEdgeLabel_XXX. The default is "label".
+        defaultEdgeLabel : str , optional
+            The default edge label to use if no value is found under the edgeLabelKey. The default is "CONNECTED_TO".
+        edgeCategoryKey : str , optional
+            The returned edges are categorized according to the dictionary values stored under this key. The dfefault is "category".
+        defaultEdgeCategory : str , optional
+            The default edge category to use if no value is found under the edgeCategoryKey. The default is None.
+        mantissa : int , optional
+            The desired length of the mantissa. The default is 6.
+        tolerance : float , optional
+            The desired tolerance. The default is 0.0001.
+        building : str , optional
+            The name of the building, stored in the "building" property of every node and relationship (see TagTables). The default is None which means no tag is stored.
+
+        Returns
+        -------
+        tuple
+            A (nodes, relationships) tuple. Each node is a dictionary with "label" and "properties" keys and each
+            relationship is a dictionary with "type", "start_id", "end_id" and "properties" keys. The start and end
+            ids refer to the "id" property of the nodes.
+
+        """
+        from topologicpy.Vertex import Vertex
+        from topologicpy.Edge import Edge
+        from topologicpy.Graph import Graph
+        from topologicpy.Dictionary import Dictionary
+        from topologicpy.Topology import Topology
+
+        vertices = Graph.Vertices(graph)
+        edges = Graph.Edges(graph)
+
+        nodes = []
+        relationships = []
+        # Map each IFC_global_id to its vertex index, built once so edge endpoints avoid a distance scan
+        index_by_global_id = {}
+
+        def endpointIndex(vertex):
+            global_id = Dictionary.ValueAtKey(Topology.Dictionary(vertex), "IFC_global_id")
+            if global_id in index_by_global_id:
+                return index_by_global_id[global_id]
+            return Vertex.Index(vertex=vertex, vertices=vertices, strict=False, tolerance=tolerance)
+
+        n = max(len(str(len(vertices))), 3)
+        for i, vertex in enumerate(vertices):
+            vertex_props = Dictionary.PythonDictionary(Topology.Dictionary(vertex))  # Get the dictionary of vertex attributes
+            global_id = vertex_props.get("IFC_global_id")
+            if global_id is not None:
+                index_by_global_id.setdefault(global_id, i)
+            # Extract label and category, remove them from the properties
+            value = defaultVertexLabel+"_"+str(i+1).zfill(n)
+            vertex_label = vertex_props.pop(vertexLabelKey, value)
+            vertex_label = sanitize_for_neo4j(vertex_label)
+            vertex_category = vertex_props.pop(vertexCategoryKey, defaultVertexCategory)  # Extract category if it exists
+            # Add coordinates to the vertex properties
+            if "CUSTOM_offset" in vertex_props:
+                vertex_props.update({
+                    'x': round(Vertex.X(vertex, mantissa=mantissa) + vertex_props['CUSTOM_offset'][0], ndigits=mantissa),  # X coordinate
+                    'y': round(Vertex.Y(vertex, mantissa=mantissa) + vertex_props['CUSTOM_offset'][1], ndigits=mantissa),  # Y coordinate
+                    'z': round(Vertex.Z(vertex, mantissa=mantissa) + vertex_props['CUSTOM_offset'][2], ndigits=mantissa),  # Z coordinate
+                })
+            else:
+                vertex_props.update({
+                    'x': Vertex.X(vertex, mantissa=mantissa),  # X coordinate
+                    'y': Vertex.Y(vertex, mantissa=mantissa),  # Y coordinate
+                    'z': Vertex.Z(vertex, mantissa=mantissa),  # Z coordinate
+                })
+            
+            if not vertex_category == None:
+                vertex_props[vertexCategoryKey] = vertex_category  # Add category to properties if it exists
+            if not vertex_label == None:
+                vertex_props[vertexLabelKey] = vertex_label  # Add label to properties if it exists
+            
+            vertex_props['id'] = i
+
+            # Remove some items if they exist
+            dict_keys = list(vertex_props.keys())
+            for k in dict_keys:
+                if 'TOPOLOGIC_' in k or 'CUSTOM_' in k:
+                    del vertex_props[k] 
+
+            nodes.append({"label": vertex_label, "properties": vertex_props})
+
+        for edge in edges:
+            edge_props = Dictionary.PythonDictionary(Topology.Dictionary(edge))  # Get the dictionary of edge attributes
+            
+            # Extract label and category for the relationship
+            edge_label = edge_props.pop(edgeLabelKey, defaultEdgeLabel)  # Default label is 'CONNECTED_TO'
+            edge_label = sanitize_for_neo4j(edge_label)
+            edge_category = edge_props.pop(edgeCategoryKey, defaultEdgeCategory)  # Extract category if it exists
+
+            start_vertex = Edge.StartVertex(edge)  # Get the starting vertex of the edge
+            start_id = endpointIndex(start_vertex)
+            end_vertex = Edge.EndVertex(edge)      # Get the ending vertex of the edge
+            end_id = endpointIndex(end_vertex)
+
+            # Add category to edge properties if it exists
+            if not edge_category == None:
+                edge_props[vertexCategoryKey] = edge_category
+            if not edge_label == None:
+                edge_props[edgeLabelKey] = edge_label  # Add label to properties if it exists
+
+            relationships.append({"type": edge_label, "start_id": start_id, "end_id": end_id, "properties": edge_props})
+
+        if building is not None:
+            CustomNeo4j.TagTables(nodes, relationships, building)
+        return nodes, relationships
+
+    @staticmethod
+    def TagTables(nodes: list, relationships: list, building: str):
+        """
+        Stores the name of a building in the "building" property of every node and relationship of the tables (see
+        GraphTables), so that several buildings can share one database.
+
+        Parameters
+        ----------
+        nodes : list
+            The list of node dictionaries with "label" and "properties" keys.
+        relationships : list
+            The list of relationship dictionaries with "type", "start_id", "end_id" and "properties" keys.
+        building : str
+            The name of the building. If None, the tag is removed.
+
+        Returns
+        -------
+        tuple
+            The tagged (nodes, relationships) tuple.
+
+        """
+        for row in nodes + relationships:
+            if building is None:
+                row['properties'].pop(BUILDING_KEY, None)
+            else:
+                row['properties'][BUILDING_KEY] = building
+        return nodes, relationships
+
+    @staticmethod
+    def DeleteAll(neo4jGraph, batchSize: int = 10000, database: str = None, building: str = None):
+        """
+        Deletes all nodes and relationships (of a building, if given) in batches, each batch in its own transaction,
+        so that large graphs do not exhaust the transaction memory. Indexes and constraints are kept.
+
+        Parameters
+        ----------
+        neo4jGraph : neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The input neo4j driver.
+        batchSize : int , optional
+            The number of nodes deleted per transaction. The default is 10000.
+        database : str , optional
+            The name of the Neo4j database to write to. The default is None which means the server's default database.
+        building : str , optional
+            The building whose nodes are deleted (see TagTables), untagged nodes included. The default is None which means all nodes are deleted.
+
+        Returns
+        -------
+        neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The returned neo4j driver.
+
+        """
+        with neo4jGraph.session(database=database) as session:
+            # CALL { } IN TRANSACTIONS is only allowed in auto-commit queries
+            session.run(f"""
+                MATCH (n) WHERE {buildingScope("n", building)}
+                CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF {int(batchSize)} ROWS
+            """, building=building).consume()
+        return neo4jGraph
+
+    @staticmethod
+    def TagUntagged(neo4jGraph, building: str, batchSize: int = 10000, database: str = None):
+        """
+        Stores the name of a building in the "building" property of the nodes and relationships that have none, e.g.
+        graphs loaded before buildings were tagged (see TagTables).
+
+        Parameters
+        ----------
+        neo4jGraph : neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The input neo4j driver.
+        building : str
+            The name of the building.
+        batchSize : int , optional
+            The number of nodes or relationships tagged per transaction. The default is 10000.
+        database : str , optional
+            The name of the Neo4j database to write to. The default is None which means the server's default database.
+
+        Returns
+        -------
+        neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The returned neo4j driver.
+
+        """
+        with neo4jGraph.session(database=database) as session:
+            session.run(f"""
+                MATCH (n) WHERE n.{BUILDING_KEY} IS NULL
+                CALL {{ WITH n SET n.{BUILDING_KEY} = $building }} IN TRANSACTIONS OF {int(batchSize)} ROWS
+            """, building=building).consume()
+            session.run(f"""
+                MATCH ()-[r]->() WHERE r.{BUILDING_KEY} IS NULL
+                CALL {{ WITH r SET r.{BUILDING_KEY} = $building }} IN TRANSACTIONS OF {int(batchSize)} ROWS
+            """, building=building).consume()
+        return neo4jGraph
+
+    @staticmethod
+    def SyncTables(neo4jGraph,
+                   nodes: list,
+                   relationships: list,
+                   keyProperty: str = "IFC_global_id",
+                   relationshipKeyProperty: str = "IFC_global_id",
+                   ignoredProperties: list = ["id"],
+                   bidirectional: bool = True,
+                   batchSize: int = 1000,
+                   indexKeys: list = ["id", "IFC_global_id"],
+                   database: str = None,
+                   building: str = None,
+                   silent: bool = False):
+        """
+        Synchronizes a Neo4j graph with node and relationship property tables (see GraphTables) by only adding, updating or
+        removing the nodes and relationships that differ, instead of deleting and reloading the whole graph. Nodes are
+        matched by the value of keyProperty, and relationships by their type, the keyProperty of their endpoints and their
+        own relationshipKeyProperty, so that the diff is stable when the IFC file is exported again. If the tables or the
+        database contain missing or duplicated node keys, the graph is fully reloaded instead.
+
+        Parameters
+        ----------
+        neo4jGraph : neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The input neo4j driver.
+        nodes : list
+            The list of node dictionaries with "label" and "properties" keys.
+        relationships : list
+            The list of relationship dictionaries with "type", "start_id", "end_id" and "properties" keys.
+        keyProperty : str , optional
+            The node property that identifies a node across imports. The default is "IFC_global_id".
+        relationshipKeyProperty : str , optional
+            The relationship property that identifies a relationship across imports. The default is "IFC_global_id".
+        ignoredProperties : list , optional
+            The node properties that do not mark a node as updated, since they change between imports of the same model. They are still written to
+            the kept nodes, so that they stay consistent with the relationships of the tables. The default is ["id"] (the vertex index).
+        bidirectional : bool , optional
+            If set to True, the output Neo4j graph is forced to be bidirectional. The defaul is True.
+        batchSize : int , optional
+            The number of rows written or deleted per transaction. The default is 1000.
+        indexKeys : list , optional
+            The node properties to index for every node label. The default is ["id", "IFC_global_id"].
+        database : str , optional
+            The name of the Neo4j database to write to. The default is None which means the server's default database.
+        building : str , optional
+            The building of the tables (see TagTables). If given, the nodes and relationships of other buildings in the database are left untouched. The default is None.
+        silent : bool , optional
+            If set to True, no error and warning messages are printed. Otherwise, they are. The default is False.
+
+        Returns
+        -------
+        neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The returned neo4j driver.
+
+        """
+        import json
+
+        if not isinstance(neo4jGraph, neo4j._sync.driver.BoltDriver) and not isinstance(neo4jGraph, neo4j._sync.driver.Neo4jDriver):
+            if not silent:
+                print("Neo4j.SyncTables - Error: The input neo4jGraph is not a valid neo4j graph. Returning None.")
+            return None
+
+        def fullReload():
+            CustomNeo4j.DeleteAll(neo4jGraph, database=database, building=building)
+            return CustomNeo4j.ByTables(neo4jGraph, nodes, relationships, bidirectional=bidirectional, bulk=True, batchSize=batchSize, indexKeys=indexKeys, database=database, building=building, silent=silent)
+
+        def canonical(properties, ignored=()):
+            # Neo4j does not store null properties, so they are ignored when comparing
+            return json.dumps({k: v for k, v in properties.items() if v is not None and k not in ignored}, sort_keys=True, default=str)
+
+        def runBatches(session, query, rows):
+            for i in range(0, len(rows), batchSize):
+                batch = rows[i:i+batchSize]
+                session.execute_write(lambda tx: tx.run(query, rows=batch, building=building).consume())
+
+        new_nodes = {node['properties'].get(keyProperty): node for node in nodes}
+        if None in new_nodes or len(new_nodes) != len(nodes):
+            if not silent:
+                print(f"Neo4j.SyncTables - Warning: The input nodes do not have unique '{keyProperty}' values. Reloading the whole graph.")
+            return fullReload()
+        keys_by_id = {node['properties']['id']: key for key, node in new_nodes.items()}
+
+        keys = indexKeys + [keyProperty] + ([BUILDING_KEY] if building is not None else [])
+        CustomNeo4j.CreateIndexes(neo4jGraph, labels={node['label'] for node in nodes}, keys=list(dict.fromkeys(keys)), database=database)
+
+        with neo4jGraph.session(database=database) as session:
+            old_nodes = {}
+            for record in session.run(f"MATCH (n) WHERE {buildingScope('n', building)} RETURN n[$key] AS key, labels(n) AS labels, properties(n) AS properties", key=keyProperty, building=building):
+                if record['key'] is None or record['key'] in old_nodes or len(record['labels']) != 1:
+                    if not silent:
+                        print(f"Neo4j.SyncTables - Warning: The database nodes do not have unique '{keyProperty}' values. Reloading the whole graph.")
+                    return fullReload()
+                old_nodes[record['key']] = (record['labels'][0], record['properties'])
+
+            # Nodes whose label changed are removed and created again
+            removed_nodes = {}
+            created_nodes = {}
+            updated_nodes = {}
+            renumbered_nodes = {}
+            for key, (label, properties) in old_nodes.items():
+                if key not in new_nodes or new_nodes[key]['label'] != label:
+                    removed_nodes.setdefault(label, []).append(key)
+            for key, node in new_nodes.items():
+                if key not in old_nodes or old_nodes[key][0] != node['label']:
+                    created_nodes.setdefault(node['label'], []).append(node['properties'])
+                elif canonical(old_nodes[key][1], ignoredProperties) != canonical(node['properties'], ignoredProperties):
+                    updated_nodes.setdefault(node['label'], []).append({"key": key, "properties": node['properties']})
+                else:
+                    # Only write the ignored properties that changed, e.g. the vertex index of a node that moved in the graph
+                    changed = {k: node['properties'].get(k) for k in ignoredProperties if old_nodes[key][1].get(k) != node['properties'].get(k)}
+                    if changed:
+                        renumbered_nodes.setdefault(node['label'], []).append({"key": key, "properties": changed})
+
+            for label, keys in removed_nodes.items():
+                # CALL { } IN TRANSACTIONS is only allowed in auto-commit queries
+                session.run(f"""
+                    MATCH (n:{label}) WHERE n.{keyProperty} IN $keys AND {buildingScope("n", building)}
+                    CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF {int(batchSize)} ROWS
+                """, keys=keys, building=building).consume()
+            for label, rows in created_nodes.items():
+                runBatches(session, f"""
+                    UNWIND $rows AS row
+                    CREATE (n:{label})
+                    SET n = row
+                """, rows)
+            for label, rows in updated_nodes.items():
+                runBatches(session, f"""
+                    UNWIND $rows AS row
+                    MATCH (n:{label} {{{keyProperty}: row.key}}) WHERE {buildingScope("n", building)}
+                    SET n = row.properties
+                """, rows)
+            for label, rows in renumbered_nodes.items():
+                runBatches(session, f"""
+                    UNWIND $rows AS row
+                    MATCH (n:{label} {{{keyProperty}: row.key}}) WHERE {buildingScope("n", building)}
+                    SET n += row.properties
+                """, rows)
+
+            # Relationships are identified by their endpoints, type and key, and updated if their other properties changed
+            new_relationships = {}
+            for relationship in relationships:
+                start_key = keys_by_id.get(relationship['start_id'])
+                end_key = keys_by_id.get(relationship['end_id'])
+                if start_key is None or end_key is None:
+                    continue
+                relationship_key = relationship['properties'].get(relationshipKeyProperty)
+                new_relationships.setdefault((start_key, end_key, relationship['type'], relationship_key), []).append(relationship['properties'])
+                # If the graph is bi-directional, add the reverse edge as well
+                if bidirectional:
+                    new_relationships.setdefault((end_key, start_key, relationship['type'], relationship_key), []).append(relationship['properties'])
+
+            removed_relationships = []
+            updated_relationships = []
+            for record in session.run(f"MATCH (a)-[r]->(b) WHERE {buildingScope('a', building)} RETURN a[$key] AS start, b[$key] AS end, type(r) AS type, properties(r) AS properties, elementId(r) AS element_id", key=keyProperty, building=building):
+                signature = (record['start'], record['end'], record['type'], record['properties'].get(relationshipKeyProperty))
+                pending = new_relationships.get(signature)
+                if not pending:
+                    removed_relationships.append(record['element_id'])
+                    continue
+                properties = pending.pop()
+                if canonical(record['properties']) != canonical(properties):
+                    updated_relationships.append({"element_id": record['element_id'], "properties": properties})
+
+            if len(removed_relationships) > 0:
+                session.run(f"""
+                    UNWIND $element_ids AS element_id
+                    MATCH ()-[r]->() WHERE elementId(r) = element_id
+                    CALL {{ WITH r DELETE r }} IN TRANSACTIONS OF {int(batchSize)} ROWS
+                """, element_ids=removed_relationships).consume()
+            runBatches(session, """
+                UNWIND $rows AS row
+                MATCH ()-[r]->() WHERE elementId(r) = row.element_id
+                SET r = row.properties
+            """, updated_relationships)
+
+            created_relationships = {}
+            for (start_key, end_key, relationship_type, _), pending in new_relationships.items():
+                if not pending:
+                    continue
+                group = (relationship_type, new_nodes[start_key]['label'], new_nodes[end_key]['label'])
+                created_relationships.setdefault(group, []).extend({"start": start_key, "end": end_key, "properties": properties} for properties in pending)
+            for (relationship_type, start_label, end_label), rows in created_relationships.items():
+                runBatches(session, f"""
+                    UNWIND $rows AS row
+                    MATCH (a:{start_label} {{{keyProperty}: row.start}}) WHERE {buildingScope("a", building)}
+                    MATCH (b:{end_label} {{{keyProperty}: row.end}}) WHERE {buildingScope("b", building)}
+                    CREATE (a)-[r:{relationship_type}]->(b)
+                    SET r = row.properties
+                """, rows)
+
+        if not silent:
+            print(f"Neo4j.SyncTables - Nodes: {sum(len(v) for v in created_nodes.values())} created, {sum(len(v) for v in updated_nodes.values())} updated, {sum(len(v) for v in renumbered_nodes.values())} renumbered, {sum(len(v) for v in removed_nodes.values())} removed. "
+                  f"Relationships: {sum(len(v) for v in created_relationships.values())} created, {len(updated_relationships)} updated, {len(removed_relationships)} removed.")
+        return neo4jGraph
+
+    @staticmethod
+    def ByTables(neo4jGraph,
+                 nodes: list,
+                 relationships: list,
+                 bidirectional: bool = True,
+                 bulk: bool = False,
+                 batchSize: int = 1000,
+                 indexKeys: list = ["id", "IFC_global_id"],
+                 database: str = None,
+                 building: str = None,
+                 silent: bool = False):
+        """
+        Writes node and relationship property tables (see GraphTables) to a Neo4j graph.
+
+        Parameters
+        ----------
+        neo4jGraph : neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The input neo4j driver.
+        nodes : list
+            The list of node dictionaries with "label" and "properties" keys.
+        relationships : list
+            The list of relationship dictionaries with "type", "start_id", "end_id" and "properties" keys.
+        bidirectional : bool , optional
+            If set to True, the output Neo4j graph is forced to be bidirectional. The defaul is True.
+        bulk : bool , optional
+            If set to True, nodes are grouped by label and relationships by type, and each group is written with
+            UNWIND queries of batchSize rows, each inside its own explicit transaction. Otherwise, every node and
+            relationship is created with its own auto-commit query. The default is False.
+        batchSize : int , optional
+            The number of rows written per transaction in bulk mode. The default is 1000.
+        indexKeys : list , optional
+            The node properties to index for every node label before the relationships are loaded. Relationship
+            endpoints are matched by label and "id", so "id" should be kept in this list. The default is ["id", "IFC_global_id"].
+        database : str , optional
+            The name of the Neo4j database to write to. The default is None which means the server's default database.
+        building : str , optional
+            The building of the tables (see TagTables). If given, relationship endpoints are only matched among its nodes, since the "id" of the nodes is only unique within a building. The default is None.
+        silent : bool , optional
+            If set to True, no error and warning messages are printed. Otherwise, they are. The default is False.
+
+        Returns
+        -------
+        neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The returned neo4j driver.
+
+        """
+        if not isinstance(neo4jGraph, neo4j._sync.driver.BoltDriver) and not isinstance(neo4jGraph, neo4j._sync.driver.Neo4jDriver):
+            if not silent:
+                print("Neo4j.ByTables - Error: The input neo4jGraph is not a valid neo4j graph. Returning None.")
+            return None
+
+        # Node labels are needed to match relationship endpoints through the per-label indexes
+        labels_by_id = {node['properties']['id']: node['label'] for node in nodes}
+        keys = indexKeys + ([BUILDING_KEY] if building is not None else [])
+        CustomNeo4j.CreateIndexes(neo4jGraph, labels=set(labels_by_id.values()), keys=list(dict.fromkeys(keys)), database=database)
+
+        if bulk:
+            return CustomNeo4j._bulkWrite(neo4jGraph, nodes, relationships, labels_by_id, bidirectional=bidirectional, batchSize=batchSize, database=database, building=building)
+
+        with neo4jGraph.session(database=database) as session:
+            # Create vertices (nodes in Neo4j)
+            for node in nodes:
+                # Create a node with dynamic label and properties
+                session.run(f"""
+                    CREATE (n:{node['label']} $properties)
+                """, properties=node['properties'])
+
+            # Create edges (relationships in Neo4j)
+            for relationship in relationships:
+                start_label = labels_by_id.get(relationship['start_id'])
+                end_label = labels_by_id.get(relationship['end_id'])
+                if start_label == None or end_label == None:
+                    continue
+                # Create the relationship with dynamic label and properties
+                session.run(f"""
+                    MATCH (a:{start_label} {{id: $start_id}}) WHERE {buildingScope("a", building)}
+                    WITH a
+                    MATCH (b:{end_label} {{id: $end_id}}) WHERE {buildingScope("b", building)}
+                    WITH a, b
+                    CREATE (a)-[r:{relationship['type']} $properties]->(b)
+                """, start_id=relationship['start_id'], end_id=relationship['end_id'], properties=relationship['properties'], building=building)
+
+                # If the graph is bi-directional, add the reverse edge as well
+                if bidirectional:
+                    session.run(f"""
+                    MATCH (a:{end_label} {{id: $end_id}}) WHERE {buildingScope("a", building)}
+                    WITH a
+                    MATCH (b:{start_label} {{id: $start_id}}) WHERE {buildingScope("b", building)}
+                    WITH a, b
+                    CREATE (a)-[r:{relationship['type']} $properties]->(b)
+                    """, start_id=relationship['start_id'], end_id=relationship['end_id'], properties=relationship['properties'], building=building)
+        
+        return neo4jGraph
+
+    @staticmethod
+    def CreateIndexes(neo4jGraph, labels: list, keys: list = ["id", "IFC_global_id"], timeout: int = 300, database: str = None):
+        """
+        Creates (if they do not exist yet) a range index on each of the input property keys for every input node label,
+        and waits until they are online.
+
+        Parameters
+        ----------
+        neo4jGraph : neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The input neo4j driver.
+        labels : list
+            The node labels to index.
+        keys : list , optional
+            The node properties to index. The default is ["id", "IFC_global_id"].
+        timeout : int , optional
+            The number of seconds to wait for the indexes to come online. The default is 300.
+        database : str , optional
+            The name of the Neo4j database to write to. The default is None which means the server's default database.
+
+        Returns
+        -------
+        neo4j._sync.driver.BoltDriver or neo4jGraph, neo4j._sync.driver.Neo4jDriver
+            The returned neo4j driver.
+
+        """
+        with neo4jGraph.session(database=database) as session:
+            for label in sorted(labels):
+                for key in keys:
+                    session.run(f"CREATE INDEX IF NOT EXISTS FOR (n:{label}) ON (n.{key})").consume()
+            session.run("CALL db.awaitIndexes($timeout)", timeout=timeout).consume()
+        return neo4jGraph
+
+    @staticmethod
+    def _bulkWrite(neo4jGraph, nodes, relationships, labels_by_id, bidirectional=True, batchSize=1000, database=None, building=None):
+        """
+        Writes the node and relationship tables with batched UNWIND queries. See ByTables.
+        """
+        def runBatches(session, query, rows):
+            for i in range(0, len(rows), batchSize):
+                batch = rows[i:i+batchSize]
+                session.execute_write(lambda tx: tx.run(query, rows=batch, building=building).consume())
+
+        node_rows = {}
+        for node in nodes:
+            node_rows.setdefault(node['label'], []).append(node['properties'])
+
+        # Group relationships by type and endpoint labels so that both endpoints are found through the label indexes
+        relationship_rows = {}
+        for relationship in relationships:
+            start_label = labels_by_id.get(relationship['start_id'])
+            end_label = labels_by_id.get(relationship['end_id'])
+            if start_label == None or end_label == None:
+                continue
+            rows = relationship_rows.setdefault((relationship['type'], start_label, end_label), [])
+            rows.append({"start_id": relationship['start_id'], "end_id": relationship['end_id'], "properties": relationship['properties']})
+            # If the graph is bi-directional, add the reverse edge as well
+            if bidirectional:
+                reverse_rows = relationship_rows.setdefault((relationship['type'], end_label, start_label), [])
+                reverse_rows.append({"start_id": relationship['end_id'], "end_id": relationship['start_id'], "properties": relationship['properties']})
+
+        with neo4jGraph.session(database=database) as session:
+            for label, rows in node_rows.items():
+                runBatches(session, f"""
+                    UNWIND $rows AS row
+                    CREATE (n:{label})
+                    SET n = row
+                """, rows)
+
+            for (relationship_type, start_label, end_label), rows in relationship_rows.items():
+                runBatches(session, f"""
+                    UNWIND $rows AS row
+                    MATCH (a:{start_label} {{id: row.start_id}}) WHERE {buildingScope("a", building)}
+                    MATCH (b:{end_label} {{id: row.end_id}}) WHERE {buildingScope("b", building)}
+                    CREATE (a)-[r:{relationship_type}]->(b)
+                    SET r = row.properties
+                """, rows)
+
+        return neo4jGraph
+
+    @staticmethod
     def ByGraph(neo4jGraph,
                 graph,
                 vertexLabelKey: str = "label",
@@ -215,8 +845,11 @@ class CustomNeo4j:
                 edgeCategoryKey: str = "category",
                 defaultEdgeCategory: str = None,
                 bidirectional: bool = True,
+                bulk: bool = False,
+                batchSize: int = 1000,
                 mantissa: int = 6,
                 tolerance: float = 0.0001,
+                database: str = None,
                 silent: bool = False):
         """
         Converts a Topologic graph to a Neo4j graph.
@@ -245,10 +878,16 @@ class CustomNeo4j:
             The default edge category to use if no value is found under the edgeCategoryKey. The default is None.
         bidirectional : bool , optional
             If set to True, the output Neo4j graph is forced to be bidirectional. The defaul is True.
+        bulk : bool , optional
+            If set to True, the graph is written with batched UNWIND queries inside explicit transactions. See ByTables. The default is False.
+        batchSize : int , optional
+            The number of rows written per transaction in bulk mode. The default is 1000.
         mantissa : int , optional
             The desired length of the mantissa. The default is 6.
         tolerance : float , optional
             The desired tolerance. The default is 0.0001.
+        database : str , optional
+            The name of the Neo4j database to write to. The default is None which means the server's default database.
         silent : bool , optional
             If set to True, no error and warning messages are printed. Otherwise, they are. The default is False.
         
@@ -258,27 +897,8 @@ class CustomNeo4j:
             The returned neo4j driver.
         
         """
-        from topologicpy.Vertex import Vertex
-        from topologicpy.Edge import Edge
-        from topologicpy.Graph import Graph
-        from topologicpy.Dictionary import Dictionary
         from topologicpy.Topology import Topology
 
-        def sanitize_for_neo4j(identifier):
-            """
-            Replaces illegal characters in Neo4j labels or relationship types with an underscore ('_').
-            Ensures the identifier starts with an alphabetic character and contains only valid characters.
-            """
-            import re
-            # Replace any non-alphanumeric characters with underscores
-            sanitized = re.sub(r'[^a-zA-Z0-9]', '_', identifier)
-
-            # Ensure the identifier starts with an alphabetic character
-            if not sanitized[0].isalpha():
-                sanitized = f"_{sanitized}"
-
-            return sanitized
-        
         if not isinstance(neo4jGraph, neo4j._sync.driver.BoltDriver) and not isinstance(neo4jGraph, neo4j._sync.driver.Neo4jDriver):
             if not silent:
                 print("Neo4j.ByGraph - Error: The input neo4jGraph is not a valid neo4j graph. Returning None.")
@@ -307,94 +927,125 @@ class CustomNeo4j:
         #     if not silent:
         #         print("Neo4j.ByGraph - Error: The input defaultEdgeLabel is not a valid string. Returning None.")
         #     return None
-        vertices = Graph.Vertices(graph)
-        edges = Graph.Edges(graph)
+        nodes, relationships = CustomNeo4j.GraphTables(graph,
+                                                       vertexLabelKey=vertexLabelKey,
+                                                       defaultVertexLabel=defaultVertexLabel,
+                                                       vertexCategoryKey=vertexCategoryKey,
+                                                       defaultVertexCategory=defaultVertexCategory,
+                                                       edgeLabelKey=edgeLabelKey,
+                                                       defaultEdgeLabel=defaultEdgeLabel,
+                                                       edgeCategoryKey=edgeCategoryKey,
+                                                       defaultEdgeCategory=defaultEdgeCategory,
+                                                       mantissa=mantissa,
+                                                       tolerance=tolerance)
+        return CustomNeo4j.ByTables(neo4jGraph, nodes, relationships, bidirectional=bidirectional, bulk=bulk, batchSize=batchSize, database=database, silent=silent)
 
-        with neo4jGraph.session() as session:
-            # Create vertices (nodes in Neo4j)
-            n = max(len(str(len(vertices))), 3)
-            for i, vertex in enumerate(vertices):
-                vertex_props = Dictionary.PythonDictionary(Topology.Dictionary(vertex))  # Get the dictionary of vertex attributes
-                # Extract label and category, remove them from the properties
-                value = defaultVertexLabel+"_"+str(i+1).zfill(n)
-                vertex_label = vertex_props.pop(vertexLabelKey, value)
-                vertex_label = sanitize_for_neo4j(vertex_label)
-                vertex_category = vertex_props.pop(vertexCategoryKey, defaultVertexCategory)  # Extract category if it exists
-                # Add coordinates to the vertex properties
-                if "CUSTOM_offset" in vertex_props:
-                    vertex_props.update({
-                        'x': round(Vertex.X(vertex, mantissa=mantissa) + vertex_props['CUSTOM_offset'][0], ndigits=mantissa),  # X coordinate
-                        'y': round(Vertex.Y(vertex, mantissa=mantissa) + vertex_props['CUSTOM_offset'][1], ndigits=mantissa),  # Y coordinate
-                        'z': round(Vertex.Z(vertex, mantissa=mantissa) + vertex_props['CUSTOM_offset'][2], ndigits=mantissa),  # Z coordinate
-                    })
-                else:
-                    vertex_props.update({
-                        'x': Vertex.X(vertex, mantissa=mantissa),  # X coordinate
-                        'y': Vertex.Y(vertex, mantissa=mantissa),  # Y coordinate
-                        'z': Vertex.Z(vertex, mantissa=mantissa),  # Z coordinate
-                    })
-                
-                if not vertex_category == None:
-                    vertex_props[vertexCategoryKey] = vertex_category  # Add category to properties if it exists
-                if not vertex_label == None:
-                    vertex_props[vertexLabelKey] = vertex_label  # Add label to properties if it exists
-                
-                vertex_props['id'] = i
-
-                # print(f"Vertex {i+1} - Label: {vertex_props[vertexLabelKey]}, Category: {vertex_props['category'] if 'category' in vertex_props else vertex_category}")
-                # print(f"Properties: {vertex_props.keys()}")
-
-                # Remove some items if they exist
-                dict_keys = list(vertex_props.keys())
-                for k in dict_keys:
-                    if 'TOPOLOGIC_' in k or 'CUSTOM_' in k:
-                        del vertex_props[k] 
 
-                # Create a node with dynamic label and properties
-                session.run(f"""
-                    CREATE (n:{vertex_label} $properties)
-                """, properties=vertex_props)
+    @staticmethod
+    def ExportToAdminImport(nodes: list,
+                            relationships: list,
+                            directory: str,
+                            bidirectional: bool = True,
+                            arrayDelimiter: str = "\x1f"):
+        """
+        Writes node and relationship property tables (see GraphTables) as CSV files in the format expected by
+        `neo4j-admin database import full`. One node file is written per label and one relationship file per type.
+        The files must be imported with --id-type=integer, --array-delimiter matching arrayDelimiter and --multiline-fields=true.
 
-            # Create edges (relationships in Neo4j)
-            for edge in edges:
-                edge_props = Dictionary.PythonDictionary(Topology.Dictionary(edge))  # Get the dictionary of edge attributes
-                
-                # Extract label and category for the relationship
-                edge_label = edge_props.pop(edgeLabelKey, defaultEdgeLabel)  # Default label is 'CONNECTED_TO'
-                edge_label = sanitize_for_neo4j(edge_label)
-                edge_category = edge_props.pop(edgeCategoryKey, defaultEdgeCategory)  # Extract category if it exists
-
-                start_vertex = Edge.StartVertex(edge)  # Get the starting vertex of the edge
-                start_id = Vertex.Index(vertex=start_vertex, vertices=vertices, strict=False, tolerance=tolerance)
-                end_vertex = Edge.EndVertex(edge)      # Get the ending vertex of the edge
-                end_id = Vertex.Index(vertex=end_vertex, vertices=vertices, strict=False, tolerance=tolerance)
-
-                # Add category to edge properties if it exists
-                if not edge_category == None:
-                    edge_props[vertexCategoryKey] = edge_category
-                if not edge_label == None:
-                    edge_props[edgeLabelKey] = edge_label  # Add label to properties if it exists
-                # Create the relationship with dynamic label and properties
-                session.run(f"""
-                    MATCH (a {{id: $start_id}})
-                    WITH a
-                    MATCH (b {{id: $end_id}})
-                    WITH a, b
-                    CREATE (a)-[r:{edge_label} $properties]->(b)
-                """, start_id=start_id, end_id=end_id, properties=edge_props)
+        Parameters
+        ----------
+        nodes : list
+            The list of node dictionaries with "label" and "properties" keys.
+        relationships : list
+            The list of relationship dictionaries with "type", "start_id", "end_id" and "properties" keys.
+        directory : str
+            The output directory. It is created if it does not exist.
+        bidirectional : bool , optional
+            If set to True, a reverse relationship is written for every relationship. The defaul is True.
+        arrayDelimiter : str , optional
+            The delimiter used for list properties. neo4j-admin does not unescape it, so list items that contain it raise a ValueError. The default is "\\x1f" (the
+            unit separator, passed to neo4j-admin as --array-delimiter=U+001F).
 
-                # If the graph is bi-directional, add the reverse edge as well
-                if bidirectional:
-                    session.run(f"""
-                    MATCH (a {{id: $end_id}})
-                    WITH a
-                    MATCH (b {{id: $start_id}})
-                    WITH a, b
-                    CREATE (a)-[r:{edge_label} $properties]->(b)
-                    """, start_id=start_id, end_id=end_id, properties=edge_props)
-        
-        return neo4jGraph
+        Returns
+        -------
+        dict
+            A dictionary with the list of written "nodes" and "relationships" file paths.
+
+        """
+        import csv
+        import json
+
+        def columnType(values):
+            values = [v for v in values if v is not None]
+            if len(values) == 0:
+                return ""
+            if all(isinstance(v, bool) for v in values):
+                return ":boolean"
+            if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+                return ":long"
+            if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+                return ":double"
+            if all(isinstance(v, (list, tuple)) for v in values):
+                items = [item for v in values for item in v]
+                if len(items) > 0 and all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in items):
+                    return ":double[]"
+                return ":string[]"
+            return ""
+
+        def cellValue(value, value_type):
+            if value is None:
+                return ""
+            if value_type.endswith("[]"):
+                items = [str(item) for item in value]
+                for item in items:
+                    if arrayDelimiter in item:
+                        # It would be split into several array elements on import
+                        raise ValueError(f"The list item {item!r} contains the array delimiter {arrayDelimiter!r}, export with a different arrayDelimiter.")
+                return arrayDelimiter.join(items)
+            if isinstance(value, dict):
+                return json.dumps(value)
+            if isinstance(value, bool):
+                return str(value).lower()
+            return value
+
+        def writeTable(path, fixed_header, fixed_values, rows):
+            keys = sorted({k for row in rows for k in row})
+            types = {k: columnType([row.get(k) for row in rows]) for k in keys}
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(fixed_header + [k + types[k] for k in keys])
+                for values, row in zip(fixed_values, rows):
+                    writer.writerow(values + [cellValue(row.get(k), types[k]) for k in keys])
+
+        os.makedirs(directory, exist_ok=True)
+
+        node_rows = {}
+        for node in nodes:
+            node_rows.setdefault(node['label'], []).append(node['properties'])
+
+        relationship_rows = {}
+        for relationship in relationships:
+            if relationship['start_id'] == None or relationship['end_id'] == None:
+                continue
+            rows = relationship_rows.setdefault(relationship['type'], [])
+            rows.append((relationship['start_id'], relationship['end_id'], relationship['properties']))
+            if bidirectional:
+                rows.append((relationship['end_id'], relationship['start_id'], relationship['properties']))
+
+        written = {"nodes": [], "relationships": []}
+        for label, rows in node_rows.items():
+            path = os.path.join(directory, f"nodes_{label}.csv")
+            # The "id" property doubles as the import ID that relationships refer to
+            properties = [{k: v for k, v in row.items() if k != 'id'} for row in rows]
+            writeTable(path, ["id:ID", ":LABEL"], [[row['id'], label] for row in rows], properties)
+            written["nodes"].append(path)
+
+        for relationship_type, rows in relationship_rows.items():
+            path = os.path.join(directory, f"relationships_{relationship_type}.csv")
+            writeTable(path, [":START_ID", ":END_ID", ":TYPE"], [[start_id, end_id, relationship_type] for start_id, end_id, _ in rows], [row[2] for row in rows])
+            written["relationships"].append(path)
 
+        return written
 
     @staticmethod
     def SetGraph(neo4jGraph,
@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+
+# Bump this whenever CustomGraph or CustomNeo4j.GraphTables change the produced tables,
+# so that conversions cached by older versions are not reused.
+CONVERTER_VERSION = "2"
+
+
+def ifc_file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Returns the SHA-256 hex digest of the content of the IFC file.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def graph_cache_path(ifc_path: str) -> str:
+    """
+    Returns the path of the conversion cache stored next to the IFC file (e.g. data/ifc/House.graph.json.gz).
+    """
+    return os.path.splitext(ifc_path)[0] + ".graph.json.gz"
+
+
+def load_graph_tables(ifc_path: str, ifc_hash: str = None) -> tuple[list, list] | None:
+    """
+    Loads the cached (nodes, relationships) tables of an IFC file. The file is hashed unless ifc_hash is given.
+
+    Returns None if there is no cache, or if it was built from a different file content or converter version.
+    """
+    cache_path = graph_cache_path(ifc_path)
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        with gzip.open(cache_path, "rt", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read graph cache {cache_path}: {e}")
+        return None
+
+    if cached.get("converter_version") != CONVERTER_VERSION:
+        return None
+    if cached.get("ifc_hash") != (ifc_hash or ifc_file_hash(ifc_path)):
+        return None
+
+    return cached["nodes"], cached["relationships"]
+
+
+def save_graph_tables(ifc_path: str, nodes: list, relationships: list, ifc_hash: str = None) -> str:
+    """
+    Stores the (nodes, relationships) tables of an IFC file next to it, keyed by file hash and converter version.
+    The file is hashed unless ifc_hash is given.
+    """
+    cache_path = graph_cache_path(ifc_path)
+    cached = {
+        "converter_version": CONVERTER_VERSION,
+        "ifc_hash": ifc_hash or ifc_file_hash(ifc_path),
+        "nodes": nodes,
+        "relationships": relationships,
+    }
+    with gzip.open(cache_path, "wt", encoding="utf-8") as f:
+        json.dump(cached, f, default=str)
+    return cache_path
+
+
+def ifc_graph_tables(ifc_path: str, workers: int = 1, use_cache: bool = True, building: str = None) -> tuple[list, list]:
+    """
+    Converts an IFC file to the (nodes, relationships) tables written to Neo4j, reusing the on-disk cache when possible.
+    If a building name is given, the tables are tagged with it (see CustomNeo4j.TagTables).
+    """
+    from src.ifc2graph.custom_graph import CustomGraph
+    from src.ifc2graph.custom_neo4j import CustomNeo4j
+
+    # Hashed once, before the conversion, so a miss does not read the file twice
+    ifc_hash = ifc_file_hash(ifc_path) if use_cache else None
+    tables = load_graph_tables(ifc_path, ifc_hash) if use_cache else None
+    if tables is not None:
+        logging.info("IFC data loaded from the conversion cache.")
+        # The same file may be loaded under different building names, so the tag is not taken from the cache
+        return CustomNeo4j.TagTables(*tables, building)
+
+    logging.info("Processing IFC file...")
+    topologic_graph = CustomGraph.ByIFCPath(ifc_path, transferDictionaries=True, workers=workers)
+    nodes, relationships = CustomNeo4j.GraphTables(
+        graph=topologic_graph,
+        vertexLabelKey="IFC_type",
+        edgeLabelKey="IFC_type",
+        building=building
+    )
+    logging.info("IFC data loaded.")
+    if use_cache:
+        cache_path = save_graph_tables(ifc_path, nodes, relationships, ifc_hash)
+        logging.info(f"IFC conversion cached in {cache_path}.")
+    return nodes, relationships
@@ -0,0 +1,31 @@
+import math
+
+
+def gridCell(coords, cellSize):
+    """
+    Returns the cell of a uniform grid that holds the given [x, y, z] coordinates. Without a positive cell size,
+    each distinct point gets its own cell (coordinates are rounded to 6 decimals, as the vertices of the graph).
+    """
+    if cellSize <= 0:
+        return tuple(round(c, 6) for c in coords)
+    return tuple(math.floor(c / cellSize) for c in coords)
+
+def addToGrid(grid, coords, cellSize):
+    grid.setdefault(gridCell(coords, cellSize), []).append(coords)
+
+def hasNeighbourWithin(grid, coords, distance):
+    """
+    Returns True if the grid (built with addToGrid and a cell size equal to distance) holds a point closer than
+    distance to the given coordinates. No point is closer than a distance that is not positive.
+    """
+    if distance <= 0:
+        return False
+    # Only the 27 cells around the point can hold vertices closer than the cell size
+    cx, cy, cz = gridCell(coords, distance)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                for other in grid.get((cx + dx, cy + dy, cz + dz), []):
+                    if round(math.dist(coords, other), 6) < distance - 1e-6:
+                        return True
+    return False
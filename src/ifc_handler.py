@@ -1,63 +1,422 @@
+import asyncio
 import json
+import os
+import re
+import weakref
 import neo4j
 import ifcopenshell
 from langchain_neo4j import Neo4jGraph
 from neo4j_graphrag.schema import get_schema
 import logging
-from neo4j import GraphDatabase
+from dataclasses import dataclass, field
+from neo4j import AsyncGraphDatabase, GraphDatabase
+from neo4j.graph import Node, Path, Relationship
 from tqdm import tqdm
 
-from src.ifc2graph.custom_graph import CustomGraph
-from src.ifc2graph.custom_neo4j import CustomNeo4j
+from src.caching import LRUCache, normalize_cypher
+from src.ifc2graph.custom_neo4j import BUILDING_KEY, CustomNeo4j
+from src.ifc2graph.graph_cache import CONVERTER_VERSION, ifc_graph_tables
+from src.schema_utils import build_schema, drop_schema_properties, format_schema, parse_schema, query_schema_elements, scope_query
+
+
+# Text of the queries that could not be run, followed by the reason
+NO_INFORMATION = "'No information retrieved.'"
+
+# Version of the saved schemas, part of their fingerprint: changes of the converter may change the property types of
+# the graph without changing its counts or property keys, so the schemas are recomputed along with the conversions
+SCHEMA_VERSION = CONVERTER_VERSION
+
+# Plan operators that read every node or relationship of the graph
+FULL_SCAN_OPERATORS = ("AllNodesScan", "AllRelationshipsScan", "DirectedAllRelationshipsScan", "UndirectedAllRelationshipsScan")
+
+# How buildings are kept apart: "database" (one Neo4j database each, requires Enterprise Edition), "property"
+# (a shared database, with every node and relationship tagged with its building), "none" (a single building) or
+# "auto" (database on Enterprise, otherwise none until a second building is added or found in the database)
+BUILDING_ISOLATION_MODES = ("auto", "database", "property", "none")
+
+# Node properties kept when a row with whole nodes does not fit in the result budget,
+# the rest (property sets, materials...) is dropped
+NODE_SUMMARY_KEYS = ["IFC_global_id", "IFC_name", "IFC_type", "x", "y", "z", "bbox_dimensions"]
+
+
+def plain_value(value, compact: bool = False):
+    """
+    Converts a value returned by Neo4j into plain Python objects. Nodes keep all their properties, or only the
+    summary ones (NODE_SUMMARY_KEYS) if compact.
+    """
+    if isinstance(value, Node):
+        if compact:
+            return {key: value.get(key) for key in NODE_SUMMARY_KEYS if value.get(key) is not None}
+        return dict(value)
+    if isinstance(value, Relationship):
+        return {"type": value.type, **dict(value)}
+    if isinstance(value, Path):
+        return [plain_value(node, compact) for node in value.nodes]
+    if isinstance(value, (list, tuple)):
+        return [plain_value(v, compact) for v in value]
+    if isinstance(value, dict):
+        return {key: plain_value(v, compact) for key, v in value.items()}
+    return value
+
+
+@dataclass
+class QueryResult:
+    """Outcome of a Cypher query: its rows (within the result budget), or the reason why it could not be run"""
+    status: str  # "ok", "rejected", "timeout" or "error"
+    rows: list = field(default_factory=list)
+    dropped: int = 0  # Number of rows left out because of the budget
+    error: str | None = None
+    max_chars: int | None = field(default=None, repr=False)
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+    def __str__(self) -> str:
+        if not self.ok:
+            return f"{NO_INFORMATION} Reason: {self.error}."
+        text = str(self.rows)
+        if self.max_chars is not None and len(text) > self.max_chars:
+            # A single row larger than the whole budget
+            text = text[:self.max_chars] + "...]"
+        if self.dropped:
+            text += f" ({self.dropped} more rows were dropped from the result)"
+        return text
+
+
+class RowBudget():
+    """
+    Collects query records until a row or character budget is exhausted. The remaining records are only counted,
+    without being converted, so that the result reports how many rows were dropped.
+    """
+
+    def __init__(self, max_rows: int = None, max_chars: int = None):
+        self.max_rows = max_rows
+        self.max_chars = max_chars
+        self.rows = []
+        self.chars = 2
+        self.dropped = 0
+
+    def add(self, record: neo4j.Record) -> bool:
+        """
+        Adds a record to the result. Returns False if it was dropped because the budget is exhausted.
+        """
+        # Once a row is dropped, later ones are dropped too, so that the result is a prefix of the query's rows
+        if self.dropped or (self.max_rows is not None and len(self.rows) >= self.max_rows):
+            self.dropped += 1
+            return False
+
+        row = {key: plain_value(value) for key, value in record.items()}
+        row_chars = len(str(row)) + 2
+        if self.max_chars is not None and self.chars + row_chars > self.max_chars:
+            # Whole nodes are reduced to their summary properties only when the row would not fit otherwise
+            row = {key: plain_value(value, compact=True) for key, value in record.items()}
+            row_chars = len(str(row)) + 2
+            if self.rows and self.chars + row_chars > self.max_chars:
+                self.dropped += 1
+                return False
+
+        self.rows.append(row)
+        self.chars += row_chars
+        return True
+
+    def result(self) -> QueryResult:
+        return QueryResult(status="ok", rows=self.rows, dropped=self.dropped, max_chars=self.max_chars)
+
+
+def is_timeout_error(error: neo4j.exceptions.ClientError) -> bool:
+    """
+    Whether the server terminated the transaction because it exceeded its timeout.
+    """
+    return error.code is not None and "TransactionTimedOut" in error.code
+
+
+def plan_rejection_reason(plan: dict, max_estimated_rows: float, max_cartesian_rows: float, max_scan_rows: float) -> str | None:
+    """
+    Walks an EXPLAIN plan looking for operators that are too expensive to run.
+    """
+    operator = plan.get("operatorType", "").split("@")[0]
+    estimated_rows = plan.get("args", {}).get("EstimatedRows", 0) or 0
+    if operator.startswith("CartesianProduct") and estimated_rows > max_cartesian_rows:
+        return f"the query builds a cartesian product of ~{int(estimated_rows)} rows, connect the matched patterns with relationships"
+    if operator in FULL_SCAN_OPERATORS and estimated_rows > max_scan_rows:
+        return f"the query scans the whole graph (~{int(estimated_rows)} rows), restrict it to node labels"
+    if estimated_rows > max_estimated_rows:
+        return f"the query is estimated to produce ~{int(estimated_rows)} rows in {operator}"
+    for child in plan.get("children", []):
+        reason = plan_rejection_reason(child, max_estimated_rows, max_cartesian_rows, max_scan_rows)
+        if reason is not None:
+            return reason
+    return None
 
 
 class IFCGraphHandler():
 
-    def __init__(self, uri: str, username: str, password: str, database: str, ifc_path: str = None):
+    def __init__(self, uri: str, username: str, password: str, database: str, ifc_path: str = None, reset: bool = True, workers: int = 1, max_pool_size: int = 100, connection_acquisition_timeout: float = 60.0, max_result_rows: int = 100, max_result_chars: int = 8000, cache_size: int = 256, cache_ttl: float = 600.0, validate_queries: bool = True, max_estimated_rows: float = 1e6, max_cartesian_rows: float = 1e4, max_scan_rows: float = 1e5, query_timeout: float = 30.0, building_isolation: str = "auto"):
 
         self.uri = uri
         self.username = username
         self.password = password
         self.database = database
         self.ifc_path = ifc_path
+        self.workers = workers
+        self.max_pool_size = max_pool_size
+        self.connection_acquisition_timeout = connection_acquisition_timeout
+        # Budget of the query results returned as text (they end up in LLM prompts)
+        self.max_result_rows = max_result_rows
+        self.max_result_chars = max_result_chars
+        # Query results are cached per database and graph version, which changes whenever the graph is reloaded
+        self.result_cache = LRUCache(max_size=cache_size, ttl=cache_ttl)
+        self.graph_version = 0
+        # Queries are checked against the schema and their EXPLAIN plan before being executed
+        self.validate_queries = validate_queries
+        self.max_estimated_rows = max_estimated_rows
+        self.max_cartesian_rows = max_cartesian_rows
+        self.max_scan_rows = max_scan_rows
+        # Seconds after which the server terminates a query (None for no limit)
+        self.query_timeout = query_timeout
         
-        self.driver = GraphDatabase.driver(self.uri, auth=(self.username, password), database=self.database)
+        self.driver = GraphDatabase.driver(
+            self.uri, auth=(self.username, password), database=self.database,
+            max_connection_pool_size=self.max_pool_size,
+            connection_acquisition_timeout=self.connection_acquisition_timeout
+        )
+        # Asynchronous drivers are created lazily, one per event loop, since their connections are bound to it
+        self.async_drivers = weakref.WeakKeyDictionary()
 
         self.topologic_graph = None
         self.neo_4j_graph = None
 
-        if ifc_path is not None:
+        # Pre-loaded buildings, each one stored in its own database or tagged in a shared one
+        self.building_isolation = self._resolve_isolation(building_isolation)
+        self.active_building = self._building_name(ifc_path)
+        self.buildings = {self.active_building: {"database": self.database, "ifc_path": ifc_path, "graph_schema": None}}
+
+        # Without reset, the IFC path only names the building and its saved schema (the graph is already loaded)
+        if ifc_path is not None and reset:
             self.reset_graph(ifc_path)
-        
-        self.graph_schema = get_schema(driver=self.driver)
+        else:
+            if self.building_tag is not None:
+                # Nodes loaded without a tag (e.g. before buildings were tagged) belong to the loaded building
+                CustomNeo4j.TagUntagged(self.driver, self.building_tag, database=self.database)
+            self.refresh_schema()
+
+    def add_building(self, name: str, ifc_path: str, database: str = None, workers: int = None, activate: bool = False):
+        """
+        Loads a building so that it can later be activated with switch_building without re-ingesting it. With
+        "database" isolation it gets its own Neo4j database, otherwise it is tagged in the current one.
+        """
+        if self.building_isolation == "none":
+            # The database is shared from now on, the loaded building is tagged to keep it apart from the new one
+            self.building_isolation = "property"
+            CustomNeo4j.TagUntagged(self.driver, self.active_building, database=self.database)
+
+        if self.building_isolation == "database":
+            database = database if database is not None else self._database_name(name)
+            with self.driver.session(database="system") as session:
+                session.run("CREATE DATABASE $name IF NOT EXISTS WAIT", name=database).consume()
+        else:
+            database = database if database is not None else self.database
+
+        previous = (self.database, self.ifc_path, self.graph_schema, self.active_building)
+        self.database = database
+        self.active_building = name
+        self.buildings[name] = {"database": database, "ifc_path": ifc_path, "graph_schema": None}
+        self.reset_graph(ifc_path, workers=workers)
+        logging.info(f"Building '{name}' loaded into database '{database}'.")
+
+        if not activate:
+            self.database, self.ifc_path, self.graph_schema, self.active_building = previous
+
+    def switch_building(self, name: str):
+        """
+        Routes subsequent queries to an already loaded building.
+        """
+        if name not in self.buildings:
+            raise KeyError(f"Unknown building '{name}'. Loaded buildings: {list(self.buildings.keys())}")
+        building = self.buildings[name]
+        self.database = building["database"]
+        self.ifc_path = building["ifc_path"]
+        self.graph_schema = building["graph_schema"]
+        self.active_building = name
+        logging.info(f"Active building set to '{name}' (database '{self.database}').")
+
+    def _resolve_isolation(self, building_isolation: str) -> str:
+        """
+        Resolves the "auto" isolation mode: separate databases can only be created on Neo4j Enterprise Edition. On
+        Community Edition, buildings are only tagged (and queries rewritten) if the database already holds tagged ones.
+        """
+        if building_isolation not in BUILDING_ISOLATION_MODES:
+            raise ValueError(f"Unknown building isolation '{building_isolation}', expected one of {BUILDING_ISOLATION_MODES}")
+        if building_isolation != "auto":
+            return building_isolation
+        records, _, _ = self.driver.execute_query("CALL dbms.components() YIELD edition RETURN edition", database_="system")
+        edition = records[0]["edition"] if records else "community"
+        if edition.lower() == "enterprise":
+            return "database"
+        return "property" if self._has_tagged_buildings() else "none"
+
+    def _has_tagged_buildings(self) -> bool:
+        """
+        Whether the database holds nodes tagged with a building, e.g. loaded by a previous session with several buildings.
+        """
+        records, _, _ = self.driver.execute_query(f"""
+CALL db.propertyKeys() YIELD propertyKey WITH collect(propertyKey) AS propertyKeys
+RETURN $key IN propertyKeys AND EXISTS {{ MATCH (n) WHERE n.{BUILDING_KEY} IS NOT NULL }} AS tagged
+""", key=BUILDING_KEY, database_=self.database)
+        return bool(records and records[0]["tagged"])
+
+    @property
+    def building_tag(self) -> str | None:
+        """
+        Value of the building property of the active building's nodes and relationships (None if not tagged).
+        """
+        return self.active_building if self.building_isolation == "property" else None
             
-    def reset_graph(self, path: str):
+    def reset_graph(self, path: str, workers: int = None, use_cache: bool = True, incremental: bool = True):
         
-        logging.info("Processing IFC file...")
-        self.topologic_graph = CustomGraph.ByIFCPath(path, transferDictionaries=True)
-        logging.info("IFC data loaded.")
-
-        logging.info("Resetting Neo4j session...")
-        self._reset_neo4j_session()
-        self.neo_4j_graph = CustomNeo4j.ByGraph(
-            neo4jGraph=self.driver, 
-            graph=self.topologic_graph,
-            vertexLabelKey="IFC_type",
-            edgeLabelKey="IFC_type",
-            bidirectional=True,
-            silent=True
-        )
+        workers = self.workers if workers is None else workers
+        self.ifc_path = path
+        self.graph_version += 1
+
+        nodes, relationships = ifc_graph_tables(path, workers=workers, use_cache=use_cache, building=self.building_tag)
+
+        if incremental:
+            logging.info("Synchronizing Neo4j graph...")
+            self.neo_4j_graph = CustomNeo4j.SyncTables(
+                neo4jGraph=self.driver,
+                nodes=nodes,
+                relationships=relationships,
+                keyProperty="IFC_global_id",
+                bidirectional=True,
+                database=self.database,
+                building=self.building_tag,
+                silent=False
+            )
+        else:
+            logging.info("Resetting Neo4j session...")
+            self._reset_neo4j_session()
+            self.neo_4j_graph = CustomNeo4j.ByTables(
+                neo4jGraph=self.driver,
+                nodes=nodes,
+                relationships=relationships,
+                bidirectional=True,
+                bulk=True,
+                database=self.database,
+                building=self.building_tag,
+                silent=True
+            )
         logging.info("Neo4j graph loaded.")
 
-        self.graph_schema = get_schema(driver=self.driver)
+        self.refresh_schema()
+
+    def refresh_schema(self, force: bool = False):
+        """
+        Loads the graph schema saved in data/schema, or computes it (sampling the whole database, or reading the
+        nodes of the active building with "property" isolation, since the database may hold other buildings) when the
+        fingerprint of the graph does not match the one saved next to it (which is not tracked by git). Nothing is
+        written while the fingerprint matches.
+        """
+        filename = self.active_building
+        schema_path = f"data/schema/{filename}.schema"
+        fingerprint_path = f"data/schema/{filename}.fingerprint.json"
+        fingerprint = self.graph_fingerprint()
+
+        if not force and os.path.exists(schema_path) and os.path.exists(fingerprint_path):
+            with open(fingerprint_path, "r") as f:
+                saved_fingerprint = json.load(f)
+            if saved_fingerprint == fingerprint:
+                with open(schema_path, "r") as f:
+                    self.graph_schema = f.read()
+                self.buildings[self.active_building]["graph_schema"] = self.graph_schema
+                logging.info("Graph schema loaded.")
+                return
+
+        schema = self._building_schema() if self.building_tag is not None else get_schema(driver=self.driver, database=self.database)
+        # The building tag is internal, queries are scoped to the active building by execute_cypher_query
+        self.graph_schema = drop_schema_properties(schema, {BUILDING_KEY})
+        self.buildings[self.active_building]["graph_schema"] = self.graph_schema
 
-        # Save schema
-        filename = self.ifc_path.split("/")[-1].split(".")[0] if self.ifc_path is not None else self.database
-        with open(f"data/schema/{filename}.schema", "w") as f:
-                f.write(self.graph_schema) 
+        # Save schema, the tracked file is only rewritten if it changed
+        saved_schema = None
+        if os.path.exists(schema_path):
+            with open(schema_path, "r", errors="replace") as f:
+                saved_schema = f.read()
+        if saved_schema != self.graph_schema:
+            with open(schema_path, "w") as f:
+                f.write(self.graph_schema)
+        with open(fingerprint_path, "w") as f:
+            json.dump(fingerprint, f, indent=2, sort_keys=True)
         
         logging.info("Graph schema computed.")
 
+    def graph_fingerprint(self) -> dict[str, object]:
+        """
+        Cheap summary of the graph (label and relationship pattern counts, property keys and SCHEMA_VERSION) that
+        changes whenever its schema may have changed. Only metadata and the count store are read, so changes of
+        property types made outside the converter are not noticed (use refresh_schema(force=True) after them).
+        With "property" isolation, the count store still covers the whole database: loading another building also
+        invalidates the saved schema.
+        """
+        records, _, _ = self.driver.execute_query("""
+CALL apoc.meta.stats() YIELD labels, relTypes, nodeCount, relCount
+CALL { CALL db.propertyKeys() YIELD propertyKey RETURN collect(propertyKey) AS propertyKeys }
+RETURN labels, relTypes, propertyKeys, nodeCount, relCount
+""", database_=self.database)
+        record = records[0]
+        fingerprint = {
+            "schema_version": SCHEMA_VERSION,
+            "labels": dict(record["labels"]),
+            "relationship_types": dict(record["relTypes"]),
+            "property_keys": sorted(record["propertyKeys"]),
+            "nodes": record["nodeCount"],
+            "relationships": record["relCount"],
+        }
+        if self.building_tag is not None:
+            fingerprint["building"] = self.building_tag
+        return fingerprint
+
+    def _building_schema(self) -> str:
+        """
+        Schema of the nodes and relationships of the active building only, in the format of get_schema.
+        """
+        def value_type(types):
+            # Same type names as get_schema, e.g. "LIST OF STRING" -> "LIST"
+            return sorted(types)[0].split(" ")[0]
+
+        node_records, _, _ = self.driver.execute_query(f"""
+MATCH (n {{{BUILDING_KEY}: $building}})
+UNWIND labels(n) AS label
+UNWIND keys(n) AS key
+RETURN label, key, collect(DISTINCT apoc.meta.cypher.type(n[key])) AS types
+""", building=self.building_tag, database_=self.database)
+        relationship_records, _, _ = self.driver.execute_query(f"""
+MATCH (:{{{BUILDING_KEY}: $building}})-[r]->()
+UNWIND keys(r) AS key
+RETURN type(r) AS type, key, collect(DISTINCT apoc.meta.cypher.type(r[key])) AS types
+""", building=self.building_tag, database_=self.database)
+        triple_records, _, _ = self.driver.execute_query(f"""
+MATCH (a {{{BUILDING_KEY}: $building}})-[r]->(b)
+UNWIND labels(a) AS start
+UNWIND labels(b) AS end
+RETURN DISTINCT start, type(r) AS type, end
+""", building=self.building_tag, database_=self.database)
+
+        node_properties, relationship_properties = {}, {}
+        for record in node_records:
+            node_properties.setdefault(record["label"], {})[record["key"]] = value_type(record["types"])
+        for record in relationship_records:
+            relationship_properties.setdefault(record["type"], {})[record["key"]] = value_type(record["types"])
+        relationships = [(record["start"], record["type"], record["end"]) for record in triple_records]
+        return build_schema(node_properties, relationship_properties, relationships)
+
+    @property
+    def prompt_schema(self) -> str:
+        """
+        Compact version of the graph schema, to be used in prompts.
+        """
+        return format_schema(self.graph_schema)
+
     
     def save_graph_schema(self, path: str, structured: bool = False):
         
@@ -72,14 +431,191 @@ class IFCGraphHandler():
             with open(path, "w") as f:
                 f.write(schema) 
     
-    def execute_cypher_query(self, cypher_query: str) -> str:
+    def execute_cypher_query(self, cypher_query: str, limit: int = None) -> QueryResult:
+        """
+        Runs a read-only Cypher query. Queries that fail validation, exceed the time limit or have invalid syntax
+        are not raised, they are reported in the status and error of the returned QueryResult.
+        """
 
+        cache_key, output = self._before_query(cypher_query, limit)
+        if output is not None:
+            return output
+
+        budget = RowBudget(max_rows=self.max_result_rows, max_chars=self.max_result_chars)
         try:
-            records, summary, _ = self.driver.execute_query(cypher_query, database_=self.database)
-        except neo4j.exceptions.CypherSyntaxError:
-            return "'No information retrieved.'"
-        
-        return str(records)
+            with self.driver.session(database=self.database, fetch_size=self._fetch_size(limit)) as session:
+                query, parameters = self._scoped(cypher_query)
+                if self.validate_queries:
+                    try:
+                        reason = self._plan_error(session.run(f"EXPLAIN {query}", parameters).consume())
+                    except neo4j.exceptions.ClientError as e:
+                        reason = self._explain_error(e)
+                    if reason is not None:
+                        return self._reject(cache_key, cypher_query, reason)
+
+                result = session.run(self._query(query), parameters)
+                # Records are streamed, those beyond the budget are only counted
+                for i, record in enumerate(result):
+                    if limit is not None and i >= limit:
+                        break
+                    budget.add(record)
+                result.consume()
+        except neo4j.exceptions.ClientError as e:
+            output = self._query_error(e, cypher_query)
+            if output is None:
+                raise
+            return output
+
+        return self._after_query(cache_key, budget)
+
+    async def execute_cypher_query_async(self, cypher_query: str, limit: int = None) -> QueryResult:
+        """
+        Asynchronous version of execute_cypher_query, so that several queries can run concurrently
+        (e.g. with asyncio.gather) over the connection pool without blocking the event loop. Each event loop uses
+        its own driver, closed with close_async from that loop.
+        """
+        async_driver = self._async_driver()
+
+        cache_key, output = self._before_query(cypher_query, limit)
+        if output is not None:
+            return output
+
+        budget = RowBudget(max_rows=self.max_result_rows, max_chars=self.max_result_chars)
+        try:
+            async with async_driver.session(database=self.database, fetch_size=self._fetch_size(limit)) as session:
+                query, parameters = self._scoped(cypher_query)
+                if self.validate_queries:
+                    try:
+                        result = await session.run(f"EXPLAIN {query}", parameters)
+                        reason = self._plan_error(await result.consume())
+                    except neo4j.exceptions.ClientError as e:
+                        reason = self._explain_error(e)
+                    if reason is not None:
+                        return self._reject(cache_key, cypher_query, reason)
+
+                result = await session.run(self._query(query), parameters)
+                i = 0
+                async for record in result:
+                    if limit is not None and i >= limit:
+                        break
+                    budget.add(record)
+                    i += 1
+                await result.consume()
+        except neo4j.exceptions.ClientError as e:
+            output = self._query_error(e, cypher_query)
+            if output is None:
+                raise
+            return output
+
+        return self._after_query(cache_key, budget)
+
+    def _before_query(self, cypher_query: str, limit: int = None) -> tuple[tuple, QueryResult | None]:
+        """
+        Steps shared by the sync and async paths before the query is sent: returns its cache key, and its output
+        if it is already known (cached, or rejected by the schema validation).
+        """
+        cache_key = self._cache_key(cypher_query, limit)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return cache_key, cached
+
+        if self.validate_queries:
+            reason = self._schema_error(cypher_query)
+            if reason is not None:
+                return cache_key, self._reject(cache_key, cypher_query, reason)
+        return cache_key, None
+
+    def _after_query(self, cache_key: tuple, budget: RowBudget) -> QueryResult:
+        output = budget.result()
+        self.result_cache.put(cache_key, output)
+        return output
+
+    def _scoped(self, cypher_query: str) -> tuple[str, dict]:
+        """
+        Restricts the query to the nodes of the active building with "property" isolation, since the database may
+        hold other buildings (loaded by this or previous sessions). Returns the query to run and its parameters.
+        """
+        if self.building_tag is None:
+            return cypher_query, {}
+        return scope_query(cypher_query, BUILDING_KEY, "building"), {"building": self.building_tag}
+
+    def _query(self, cypher_query: str) -> neo4j.Query:
+        return neo4j.Query(cypher_query, timeout=self.query_timeout)
+
+    @staticmethod
+    def _explain_error(error: neo4j.exceptions.ClientError) -> str:
+        return f"invalid query: {error.message}"
+
+    def _query_error(self, error: neo4j.exceptions.ClientError, cypher_query: str) -> QueryResult | None:
+        """
+        Output of a query that failed on the server, or None if the error must be raised.
+        """
+        if isinstance(error, neo4j.exceptions.CypherSyntaxError):
+            return QueryResult(status="error", error=f"invalid query: {error.message}")
+        if is_timeout_error(error):
+            return self._timeout(cypher_query)
+        return None
+
+    def _schema_error(self, cypher_query: str) -> str | None:
+        schema = parse_schema(self.graph_schema)
+        if not schema["node_properties"]:
+            return None
+
+        labels, relationship_types = query_schema_elements(cypher_query)
+        unknown_labels = sorted(labels - set(schema["node_properties"].keys()))
+        if unknown_labels:
+            # The building may simply have no elements of that type (e.g. no columns), which the query answers correctly
+            logging.warning(f"Cypher query uses node labels that are not part of the graph schema {unknown_labels}: {cypher_query}")
+        known_types = set(schema["relationship_properties"].keys()) | {relationship[1] for relationship in schema["relationships"]}
+        unknown_types = sorted(relationship_types - known_types)
+        if unknown_types:
+            return f"unknown relationship types {unknown_types}, they are not part of the graph schema"
+        return None
+
+    def _plan_error(self, summary: neo4j.ResultSummary) -> str | None:
+        if summary.query_type != "r":
+            return "only read queries are allowed"
+        if summary.plan is None:
+            return None
+        return plan_rejection_reason(summary.plan, self.max_estimated_rows, self.max_cartesian_rows, self.max_scan_rows)
+
+    def _timeout(self, cypher_query: str) -> QueryResult:
+        # Not cached, the same query may finish in time once the database is less loaded
+        logging.warning(f"Cypher query cancelled after {self.query_timeout}s: {cypher_query}")
+        return QueryResult(status="timeout", error=f"the query was cancelled after exceeding the time limit of {self.query_timeout}s, write a simpler query (e.g. bound variable-length paths)")
+
+    def _reject(self, cache_key: tuple, cypher_query: str, reason: str) -> QueryResult:
+        logging.info(f"Cypher query rejected ({reason}): {cypher_query}")
+        output = QueryResult(status="rejected", error=reason)
+        self.result_cache.put(cache_key, output)
+        return output
+
+    def _cache_key(self, cypher_query: str, limit: int = None) -> tuple:
+        return (self.database, self.active_building, self.graph_version, normalize_cypher(cypher_query), limit)
+
+    def _fetch_size(self, limit: int = None) -> int:
+        # Pull records in small batches, so that results larger than the budget are never fully buffered
+        fetch_size = max(self.max_result_rows, 1) if self.max_result_rows is not None else 1000
+        return min(fetch_size, limit) if limit else fetch_size
+
+    def close(self):
+        self.driver.close()
+
+    async def close_async(self):
+        """Closes the asynchronous driver of the running event loop"""
+        async_driver = self.async_drivers.pop(asyncio.get_running_loop(), None)
+        if async_driver is not None:
+            await async_driver.close()
+
+    def _async_driver(self) -> neo4j.AsyncDriver:
+        loop = asyncio.get_running_loop()
+        if loop not in self.async_drivers:
+            self.async_drivers[loop] = AsyncGraphDatabase.driver(
+                self.uri, auth=(self.username, self.password),
+                max_connection_pool_size=self.max_pool_size,
+                connection_acquisition_timeout=self.connection_acquisition_timeout
+            )
+        return self.async_drivers[loop]
 
     def _wrap_graph(self) -> Neo4jGraph:
         return Neo4jGraph(
@@ -87,9 +623,19 @@ class IFCGraphHandler():
         )
 
     def _reset_neo4j_session(self):
-        with self.driver.session() as session:
-            # Clear existing data (optional)
-            session.run("MATCH (n) DETACH DELETE n")
+        # Clear existing data (of the active building, if tagged) in batches
+        CustomNeo4j.DeleteAll(self.driver, database=self.database, building=self.building_tag)
+
+    def _building_name(self, ifc_path: str = None) -> str:
+        return os.path.splitext(os.path.basename(ifc_path))[0] if ifc_path is not None else self.database
+
+    @staticmethod
+    def _database_name(name: str) -> str:
+        # Neo4j database names only allow lowercase ASCII letters, digits, dots and dashes, starting with a letter
+        database = re.sub(r"[^a-z0-9.-]", "-", name.lower()).strip(".-")
+        if not database or not database[0].isalpha():
+            database = "b-" + database
+        return database[:63]
 
 
 # Example usage
@@ -0,0 +1,140 @@
+import asyncio
+import importlib.util
+import logging
+import threading
+from dataclasses import dataclass
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+
+@dataclass(frozen=True)
+class TransportSettings:
+    """Connection settings shared by all the OpenAI-compatible clients"""
+    timeout: float = 60.0
+    connect_timeout: float = 5.0
+    max_retries: int = 2
+    max_connections: int = 32
+    max_keepalive_connections: int = 16
+    keepalive_expiry: float = 30.0
+    http2: bool = True
+
+    @classmethod
+    def from_config(cls, config: dict | None) -> "TransportSettings":
+        """Builds the settings from the optional `transport` section of the configuration file"""
+        config = config or {}
+        defaults = cls()
+        return cls(
+            timeout=config.get('timeout', defaults.timeout),
+            connect_timeout=config.get('connectTimeout', defaults.connect_timeout),
+            max_retries=config.get('maxRetries', defaults.max_retries),
+            max_connections=config.get('maxConnections', defaults.max_connections),
+            max_keepalive_connections=config.get('maxKeepaliveConnections', defaults.max_keepalive_connections),
+            keepalive_expiry=config.get('keepaliveExpiry', defaults.keepalive_expiry),
+            http2=config.get('http2', defaults.http2),
+        )
+
+    def httpx_kwargs(self) -> dict:
+        return {
+            "timeout": httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            # HTTP/2 is only negotiated with TLS endpoints
+            "http2": self.http2 and http2_available(),
+        }
+
+
+def http2_available() -> bool:
+    """Whether the h2 package needed by httpx for HTTP/2 is installed (warns once if it is not)"""
+    global _http2_warned
+    if importlib.util.find_spec("h2") is not None:
+        return True
+    if not _http2_warned:
+        logging.warning("HTTP/2 was requested but the h2 package is not installed (pip install 'httpx[http2]'), using HTTP/1.1.")
+        _http2_warned = True
+    return False
+
+
+_http2_warned = False
+_lock = threading.Lock()
+_http_clients = {}
+_clients = {}
+# Asynchronous pools are bound to the event loop they are used from, so they are kept per loop
+# ({loop: {"http_clients": {...}, "clients": {...}}}) until closed by aclose_clients or close_clients
+_async_clients = {}
+
+
+def get_client(base_url: str, api_key: str = "EMPTY", settings: TransportSettings | None = None) -> OpenAI:
+    """
+    Returns the OpenAI client of an endpoint. Clients with the same settings share one pool of keep-alive
+    connections, and retry failed requests (connection errors, 408/409/429/5xx) with exponential backoff and jitter.
+    """
+    settings = settings or TransportSettings()
+    with _lock:
+        key = (base_url, api_key, settings)
+        if key not in _clients:
+            if settings not in _http_clients:
+                _http_clients[settings] = httpx.Client(**settings.httpx_kwargs())
+            _clients[key] = OpenAI(
+                api_key=api_key, base_url=base_url, max_retries=settings.max_retries,
+                timeout=httpx.Timeout(settings.timeout, connect=settings.connect_timeout),
+                http_client=_http_clients[settings]
+            )
+        return _clients[key]
+
+
+def get_async_client(base_url: str, api_key: str = "EMPTY", settings: TransportSettings | None = None) -> AsyncOpenAI:
+    """
+    Asynchronous counterpart of get_client, to be called from a running event loop. Each event loop gets its own
+    pools, since connections can not be shared between loops. They are closed with aclose_clients from that loop,
+    or by close_clients on shutdown.
+    """
+    settings = settings or TransportSettings()
+    loop = asyncio.get_running_loop()
+    with _lock:
+        loop_clients = _async_clients.setdefault(loop, {"http_clients": {}, "clients": {}})
+        key = (base_url, api_key, settings)
+        if key not in loop_clients["clients"]:
+            if settings not in loop_clients["http_clients"]:
+                loop_clients["http_clients"][settings] = httpx.AsyncClient(**settings.httpx_kwargs())
+            loop_clients["clients"][key] = AsyncOpenAI(
+                api_key=api_key, base_url=base_url, max_retries=settings.max_retries,
+                timeout=httpx.Timeout(settings.timeout, connect=settings.connect_timeout),
+                http_client=loop_clients["http_clients"][settings]
+            )
+        return loop_clients["clients"][key]
+
+
+async def aclose_clients():
+    """Closes the asynchronous connection pools of the running event loop"""
+    with _lock:
+        loop_clients = _async_clients.pop(asyncio.get_running_loop(), None)
+    if loop_clients is not None:
+        for http_client in loop_clients["http_clients"].values():
+            await http_client.aclose()
+
+
+def close_clients():
+    """
+    Closes the connection pools, to be called on shutdown. Asynchronous pools of event loops that are not running
+    are closed too, those of running loops must be closed from them with aclose_clients.
+    """
+    with _lock:
+        for http_client in _http_clients.values():
+            http_client.close()
+        _http_clients.clear()
+        _clients.clear()
+        async_clients = [(loop, _async_clients.pop(loop)) for loop in list(_async_clients.keys()) if not loop.is_running()]
+
+    for loop, loop_clients in async_clients:
+        for http_client in loop_clients["http_clients"].values():
+            try:
+                if loop.is_closed():
+                    asyncio.run(http_client.aclose())
+                else:
+                    loop.run_until_complete(http_client.aclose())
+            except Exception as e:
+                logging.warning(f"Could not close an asynchronous LLM connection pool ({e}).")
@@ -6,6 +6,7 @@ import os
 import subprocess
 import base64
 import platform
+import threading
 import uuid
 
 
@@ -16,10 +17,16 @@ class Luminous:
     def __init__(self, address="127.0.0.1", port=9999):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.connect((address, port))
+        # Requests and answers share one socket, so concurrent callers must not interleave them
+        self.lock = threading.Lock()
 
         self.hidden_objects = []
 
     def send_message(self, message):
+        with self.lock:
+            return self.__send_message(message)
+
+    def __send_message(self, message):
         json_message = json.dumps(message).encode()
         json_message_len = len(json_message)
         self.socket.sendall(struct.pack("<I", json_message_len) + json_message)
@@ -1,7 +1,6 @@
 CYPHER_GENERATION_INSTRUCTION = """
 Generate Cypher statement to query a graph database.
-Use only the provided relationship types and properties in the schema.
-Schema: {schema}
+Use only the provided relationship types and properties in the schema, which is given together with each question.
 
 If the question refers to specific objects by ID, always use the property IFC_global_id for matching (e.g., WHERE n.IFC_global_id = '<ID>' or WHERE n.IFC_global_id IN [<IDs>]).
 When the question asks for the name or properties of an object:
@@ -12,6 +11,17 @@ When answering, provide ONLY the Cypher query without any explanation or markdow
 """.strip()
 
 
+# The schema is part of the last message (it is pruned per question), so that everything before it stays
+# byte-identical across calls and can be reused from the prefix cache of the server
+CYPHER_QUESTION_TEMPLATE = """
+Schema:
+{schema}
+
+Question: {question}
+Cypher output:
+""".strip()
+
+
 CYPHER_VERBALIZATION_PROMPT = """
 Answer the query with the related metadata.
 Query: {query}
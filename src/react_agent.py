@@ -1,7 +1,83 @@
 import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 
+
+# Tools that use the same resource are never run at the same time
+TOOL_RESOURCES = {
+    "retrieve_building": "sandbox",
+    "modify_building": "sandbox",
+}
+
+# Queries referring to the user's point of view, which are usually solved by retrieving the element first
+DEICTIC_PATTERN = re.compile(r"\b(in front of me|ahead|on my (left|right)|to my (left|right)|(the|my) (left|right)|behind me|nearest|closest|in (my )?sight|i am looking at|i'm looking at)\b", re.IGNORECASE)
+QUESTION_PATTERN = re.compile(r"^(what|which|how|where|who|is|are|does|do|get|retrieve|find|give|tell|show)\b|\?\s*$", re.IGNORECASE)
+# Deictic phrases usually followed by the element they refer to (e.g. "the closest window"), the rest follow it
+PREFIX_DEICTIC_PATTERN = re.compile(r"^(nearest|closest|(the|my) (left|right)|i am looking at|i'm looking at)$", re.IGNORECASE)
+# Words skipped when looking for the element next to a deictic phrase
+TARGET_STOPWORDS = {"a", "an", "the", "this", "that", "which", "who", "is", "are", "one", "ones", "of", "me", "my", "to", "on", "in", "right", "left", "now", "just", "currently", "element", "elements", "object", "objects"}
+
+def deictic_target(text: str) -> Optional[tuple[str, str]]:
+    """
+    Element and position a text refers to from the user's point of view (e.g. ("door", "in front of me")),
+    so that rephrased requests about the same element can be recognized
+    """
+    match = DEICTIC_PATTERN.search(text)
+    if match is None:
+        return None
+    phrase = " ".join(match.group(0).lower().replace("i'm", "i am").split())
+    after = re.findall(r"[\w-]+", text[match.end():].lower())
+    before = list(reversed(re.findall(r"[\w-]+", text[:match.start()].lower())))
+    # The element usually follows a prefix phrase ("the closest window"), otherwise it is the last one mentioned
+    # ("the wall I am looking at", or "I am looking at a wall" if there is none)
+    if phrase.startswith("i am"):
+        words = before + after
+    elif PREFIX_DEICTIC_PATTERN.match(phrase):
+        words = after + before
+    else:
+        words = before
+    element = next((word for word in words if word not in TARGET_STOPWORDS), None)
+    if element is None:
+        return None
+    # "the left door" and "my left door" are the same element, as are "door" and "doors"
+    phrase = re.sub(r"^(the|my) ", "", phrase)
+    return element.rstrip("s"), phrase
+
+
+def retrieval_request(query: str) -> Optional[str]:
+    """
+    Retrieval request for the element a query refers to, phrased as in the examples of the agent's prompt
+    (e.g. "Get the ID of the door in front of me"), or None if the query does not refer to one
+    """
+    target = deictic_target(query)
+    if target is None:
+        return None
+    element, phrase = target
+    if PREFIX_DEICTIC_PATTERN.match(phrase) and not phrase.startswith("i am"):
+        return f"Get the ID of the {phrase} {element}"
+    return f"Get the ID of the {element} {phrase.replace('i am', 'I am')}"
+
+
+def normalize_tool_input(text: str) -> str:
+    """Normalize a tool input (case, quotes, whitespace, final punctuation) to compare requests"""
+    return " ".join(text.lower().strip().strip("'\"").rstrip("?!. ").split())
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token), enough to keep prompts within budget"""
+    return len(text) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Truncate a text to approximately max_tokens, noting how much was removed"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f" ... [{len(text) - max_chars} characters truncated]"
+
+
 @dataclass
 class ToolResult:
     """Stores the result of a tool execution"""
@@ -13,7 +89,7 @@ class ToolResult:
 @dataclass 
 class AgentStep:
     """Stores one reasoning-action step"""
-    thought: str
+    thought: Optional[str]
     action: str
     action_input: str
     observation: str
@@ -26,14 +102,40 @@ class ReActAgent:
     Supports iterative reasoning and acting until task is complete.
     """
     
-    def __init__(self, helper_llm, max_iterations: int = 5):
+    def __init__(self, helper_llm, max_iterations: int = 5, stream: bool = True, parallel_actions: bool = False, speculative_retrieval: bool = False,
+                 max_prompt_tokens: int = 8000, max_observation_tokens: int = 2000, old_observation_tokens: int = 100):
         """
         Args:
             helper_llm: HelperLLM instance for reasoning
             max_iterations: Maximum number of reasoning-action iterations
+            stream: Stream the reasoning steps and stop generating as soon as a complete action is found
+                    (only if helper_llm supports streaming)
+            parallel_actions: Allow several independent actions per step, which are executed concurrently
+            speculative_retrieval: For questions about elements around the user (e.g. "the door in front of me"),
+                                   prepare retrieve_building with the request the prompt examples teach (see
+                                   retrieval_request) while the first step is generated, and complete it if the agent
+                                   makes that same request first. A preparation already running when it is discarded
+                                   still runs to the end
+            max_prompt_tokens: Approximate token budget of the prompt, the observations of the oldest steps are
+                               truncated to old_observation_tokens when it is exceeded
+            max_observation_tokens: Approximate maximum number of tokens of each observation
+            old_observation_tokens: Approximate number of tokens kept from old observations when over budget
         """
         self.helper_llm = helper_llm
         self.max_iterations = max_iterations
+        self.stream = stream
+        self.parallel_actions = parallel_actions
+        self.speculative_retrieval = speculative_retrieval
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_observation_tokens = max_observation_tokens
+        self.old_observation_tokens = old_observation_tokens
+        # Prompt formatted so far for the current query, extended with each new step
+        self._prompt_state = None
+        # Instructions, tools and examples, the same for every query
+        self._static_prompt_text = None
+
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.resource_locks = {resource: threading.Lock() for resource in set(TOOL_RESOURCES.values())}
         self.available_tools = {
             "query_building": {
                 "name_for_model": "query_building",
@@ -69,7 +171,7 @@ class ReActAgent:
                         "thought": "This is a straightforward information retrieval query about counting windows.",
                         "action": "query_building",
                         "action_input": "How many windows are in the building?",
-                        "observation": "[<Record windowCount=24>]"
+                        "observation": "[{'windowCount': 24}]"
                     },
                     {
                         "thought": "I have the answer the user needs.",
@@ -222,6 +324,60 @@ class ReActAgent:
         
     def _create_react_prompt(self, query: str, history: List[AgentStep]) -> str:
         """Create the ReAct prompt with reasoning format and few-shot examples"""
+
+        # The prompt of each iteration extends the previous one, so only the new steps are formatted
+        # (and the server only processes them, the rest comes from its prefix cache)
+        state = self._prompt_state
+        if state is None or state["query"] != query or not self._extends(history, state["history"]):
+            state = {"query": query, "history": [], "text": self._static_prompt() + f"\n\nQuestion: {query}\n"}
+            self._prompt_state = state
+        for step in history[len(state["history"]):]:
+            state["text"] += self._format_step(step, self.max_observation_tokens)
+            state["history"].append(step)
+
+        prompt = state["text"]
+        if approx_tokens(prompt) > self.max_prompt_tokens:
+            prompt = self._fit_prompt_budget(query, history)
+        prompt += "Thought:"
+        return prompt
+
+    @staticmethod
+    def _extends(history: List[AgentStep], formatted: List[AgentStep]) -> bool:
+        """Whether the history starts with the already formatted steps"""
+
+        return len(formatted) <= len(history) and all(a is b for a, b in zip(history, formatted))
+
+    @staticmethod
+    def _format_step(step: AgentStep, max_observation_tokens: int) -> str:
+        """Format one step of the history, truncating its observation to the given budget"""
+
+        step_text = ""
+        if step.thought is not None:
+            step_text += f"Thought: {step.thought}\n"
+        step_text += f"Action: {step.action}\n"
+        step_text += f"Action Input: {step.action_input}\n"
+        step_text += f"Observation: {truncate_to_tokens(str(step.observation), max_observation_tokens)}\n"
+        return step_text
+
+    def _fit_prompt_budget(self, query: str, history: List[AgentStep]) -> str:
+        """Rebuild the prompt truncating the observations of the oldest steps until it fits in the token budget"""
+
+        budgets = [self.max_observation_tokens] * len(history)
+        prefix = self._static_prompt() + f"\n\nQuestion: {query}\n"
+        prompt = prefix + "".join(self._format_step(step, budget) for step, budget in zip(history, budgets))
+        # The last step is always kept whole, the agent is about to act on it
+        for i in range(len(history) - 1):
+            if approx_tokens(prompt) <= self.max_prompt_tokens:
+                break
+            budgets[i] = self.old_observation_tokens
+            prompt = prefix + "".join(self._format_step(step, budget) for step, budget in zip(history, budgets))
+        return prompt
+
+    def _static_prompt(self) -> str:
+        """Tool descriptions, rules and few-shot examples: the prefix shared by all the prompts, built once"""
+
+        if self._static_prompt_text is not None:
+            return self._static_prompt_text
         
         TOOL_DESC = """{name_for_model}: Call this tool to interact with the {name_for_human} API.\nWhat is the {name_for_human} API useful for?\n{description_for_model}\nExamples: {examples}"""
         tools_name_text = ", ".join(list(map(lambda t: t["name_for_model"], self.available_tools.values())))
@@ -232,17 +388,10 @@ class ReActAgent:
         
         # Format few-shot examples
         examples_text = self._format_examples()
-        
-        # Format conversation history
-        history_text = ""
-        if history:
-            history_text = f"\n{'='*50}\nCurrent Task Progress:\n{'='*50}\n"
-            history_text += f"User Question: {query}\n\n"
-            for i, step in enumerate(history, 1):
-                history_text += f"Thought: {step.thought}\n"
-                history_text += f"Action: {step.action}\n"
-                history_text += f"Action Input: {step.action_input}\n"
-                history_text += f"Observation: {step.observation}\n\n"
+
+        parallel_rule = ""
+        if self.parallel_actions:
+            parallel_rule = "\n5. If several tool calls do not depend on each other, write all their Action/Action Input pairs in the same step, they will be run at the same time."
 
         
 #         prompt = f"""You are an intelligent agent that helps users interact with building information models (BIM).
@@ -280,7 +429,7 @@ Important rules:
 1. If you need to identify a specific element (like "door in front of me"), use modify_building tool first to get its ID.
 2. If you need to query properties of a specific element, use query_building tool with the ID (IFC_global_id in the schema).
 3. Chain tools when necessary - use output from one tool as input to another.
-4. Be concise.
+4. Be concise.{parallel_rule}
 
 Use the following format:
 
@@ -297,19 +446,17 @@ Action Input: the final answer to the original input question
 Here are some example of how to solve tasks using these tools (DO NOT take the examples' information into account, they are only for reference):
 {examples_text}
 
-The examples have finished. Now, Begin!
-        """
+The examples have finished. Now, Begin!"""
 
-        if history:
-            prompt += f"{history_text}\n"
-        else:
-            prompt += f"\n\nQuestion: {query}\nThought:"
-        
-        #print(prompt[-800:], "=========================================================================END PROMPT")
+        self._static_prompt_text = prompt
         return prompt
     
     def _parse_action(self, llm_output: str) -> tuple[Optional[str], Optional[str], Optional[str]]:
         """Parse the LLM output to extract Thought, Action, and Action Input"""
+
+        # The prompt ends with "Thought:", so the model usually continues from there
+        if not llm_output.lstrip().startswith("Thought:"):
+            llm_output = "Thought: " + llm_output.lstrip()
         
         # Extract Thought
         thought_match = re.search(r'Thought:\s*(.+?)(?=\nAction:|$)', llm_output, re.DOTALL)
@@ -325,7 +472,7 @@ The examples have finished. Now, Begin!
         
         return thought, action, action_input
     
-    def run(self, query: str, tool_executors: Dict[str, callable]) -> tuple[str, List[AgentStep]]:
+    def run(self, query: str, tool_executors: Dict[str, callable], speculative_executors: Optional[Dict[str, callable]] = None) -> tuple[str, List[AgentStep]]:
         """
         Run the ReAct agent loop
         
@@ -333,6 +480,10 @@ The examples have finished. Now, Begin!
             query: User's input query
             tool_executors: Dictionary mapping tool names to their executor functions
                            Example: {'query_building': query_func, 'modify_building': modify_func}
+            speculative_executors: Optional executors that prepare a tool call speculatively and return a function
+                                   that completes it. Preparing must not have side effects nor use the resources of
+                                   TOOL_RESOURCES (e.g. only generate the retrieval code), since it runs without their
+                                   locks and its result may be discarded
         
         Returns:
             final_answer: The final answer to the user's query
@@ -340,7 +491,24 @@ The examples have finished. Now, Begin!
         """
         
         history: List[AgentStep] = []
-        
+
+        speculation, speculative_input = None, None
+        if self.speculative_retrieval and "retrieve_building" in (speculative_executors or {}) and self._should_speculate(query):
+            speculative_input = retrieval_request(query)
+            speculation = self.executor.submit(speculative_executors["retrieve_building"], speculative_input)
+
+        try:
+            return self._run(query, history, tool_executors, speculation, speculative_input)
+        finally:
+            # Unused speculative calls are discarded, or never started if still queued
+            if speculation is not None:
+                speculation.cancel()
+
+    def close(self):
+        """Stops the tool executor, cancelling the calls that have not started (e.g. queued speculations)"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, query: str, history: List[AgentStep], tool_executors: Dict[str, callable], speculation: Optional[Future], speculative_input: Optional[str] = None) -> tuple[str, List[AgentStep]]:
         for iteration in range(self.max_iterations):
             # Generate reasoning and action
             prompt = self._create_react_prompt(query, history)
@@ -350,10 +518,7 @@ The examples have finished. Now, Begin!
                 "prompt": prompt
             }
             
-            llm_output = self.helper_llm(
-                input_data=input_data, 
-                instruction_type="react_reasoning"
-            )
+            llm_output = self._generate(input_data)
             
             # Parse the output
             thought, action, action_input = self._parse_action(llm_output)
@@ -373,19 +538,35 @@ The examples have finished. Now, Begin!
                 )
                 history.append(step) 
                 return action_input, history
+
+            actions = [(action, action_input)]
+            if self.parallel_actions:
+                actions = [a for a in self._parse_actions(llm_output) if a[0].lower() != "finish"] or actions
+
+            # Execute the actions, concurrently if there are several of them
+            futures = []
+            for action, action_input in actions:
+                # The speculation is only used for the request it was prepared for, others generate their own code
+                if speculation is not None and action.lower().strip() == "retrieve_building" and normalize_tool_input(action_input) == normalize_tool_input(speculative_input):
+                    futures.append(self._complete_speculation(speculation, action, action_input, tool_executors))
+                    speculation = None
+                else:
+                    futures.append(self._submit_tool(action, action_input, tool_executors))
+            if speculation is not None:
+                speculation.cancel()
+                speculation = None
             
-            # Execute the action
-            observation, extra_body = self._execute_tool(action, action_input, tool_executors)
-            
-            # Store the step
-            step = AgentStep(
-                thought=thought or "",
-                action=action,
-                action_input=action_input,
-                observation=observation,
-                code=extra_body
-            )
-            history.append(step)
+            # Store the steps, the thought is only written once per reasoning step
+            for i, ((action, action_input), future) in enumerate(zip(actions, futures)):
+                observation, extra_body = future.result()
+                step = AgentStep(
+                    thought=(thought or "") if i == 0 else None,
+                    action=action,
+                    action_input=action_input,
+                    observation=observation,
+                    code=extra_body
+                )
+                history.append(step)
             
             # Check if we hit max iterations
             if iteration == self.max_iterations - 1:
@@ -393,19 +574,108 @@ The examples have finished. Now, Begin!
         
         return "Task completed", history
     
-    def _execute_tool(self, tool_name: str, tool_input: str, tool_executors: Dict[str, callable]) -> str:
-        """Execute a tool and return its observation"""
+    def _generate(self, input_data: Dict[str, str]) -> str:
+        """Generate the next reasoning step, streaming it when possible to dispatch the action early"""
+
+        # With parallel actions, the model may write more actions after the first one
+        if not self.stream or self.parallel_actions or not hasattr(self.helper_llm, "stream"):
+            return self.helper_llm(input_data=input_data, instruction_type="react_reasoning")
+
+        llm_output = ""
+        chunks = self.helper_llm.stream(input_data=input_data, instruction_type="react_reasoning")
+        try:
+            for chunk in chunks:
+                llm_output += chunk
+                action_end = self._complete_action_end(llm_output)
+                if action_end is not None:
+                    llm_output = llm_output[:action_end]
+                    break
+        finally:
+            # Cancels the rest of the generation
+            chunks.close()
+        return llm_output
+
+    def _complete_action_end(self, llm_output: str) -> Optional[int]:
+        """Position where the action input ends, if the output already contains an action and its whole input"""
+
+        action_match = re.search(r'Action:[ \t]*(\S[^\n]*)\n', llm_output)
+        if action_match is None:
+            return None
+        action_input_match = re.search(r'Action Input:[ \t]*\S', llm_output[action_match.end():])
+        if action_input_match is None:
+            return None
+
+        start = action_match.end() + action_input_match.end()
+        if action_match.group(1).strip().lower() == "finish":
+            # Final answers may span several lines
+            ends = [llm_output.find(separator, start) for separator in ("\n\n", "\nObservation")]
+        else:
+            # Tool inputs are single-line requests
+            ends = [llm_output.find("\n", start)]
+        ends = [end for end in ends if end != -1]
+        return min(ends) if ends else None
+
+    def _parse_actions(self, llm_output: str) -> List[tuple[str, str]]:
+        """Parse all the Action/Action Input pairs of the LLM output"""
+
+        pattern = r'Action:\s*(.+?)\n\s*Action Input:\s*(.+?)(?=\n\s*Action:|\n\n|\nObservation|\nThought|$)'
+        return [(action.strip(), action_input.strip()) for action, action_input in re.findall(pattern, llm_output, re.DOTALL)]
+
+    def _should_speculate(self, query: str) -> bool:
+        """Whether the query asks about elements around the user, which are usually retrieved first"""
+
+        return deictic_target(query) is not None and QUESTION_PATTERN.search(query.strip()) is not None
+
+    def _submit_tool(self, tool_name: str, tool_input: str, tool_executors: Dict[str, callable]) -> Future:
+        """Execute a tool in the background, holding the lock of the resource it uses"""
+
+        lock = self.resource_locks.get(TOOL_RESOURCES.get(tool_name.lower().strip()))
+
+        def execute():
+            if lock is None:
+                return self._execute_tool(tool_name, tool_input, tool_executors)
+            with lock:
+                return self._execute_tool(tool_name, tool_input, tool_executors)
+
+        return self.executor.submit(execute)
+    
+    def _complete_speculation(self, speculation: Future, tool_name: str, tool_input: str, tool_executors: Dict[str, callable]) -> Future:
+        """Complete a speculatively prepared tool call, holding the lock of the resource it uses"""
+
+        lock = self.resource_locks.get(TOOL_RESOURCES.get(tool_name.lower().strip()))
+
+        def execute():
+            try:
+                complete = speculation.result()
+            except Exception:
+                # The preparation failed, the tool is called from scratch
+                complete = lambda: self._execute_tool(tool_name, tool_input, tool_executors)
+            if lock is None:
+                return self._call(tool_name, complete)
+            with lock:
+                return self._call(tool_name, complete)
+
+        return self.executor.submit(execute)
+
+    def _call(self, tool_name: str, complete: callable) -> tuple[str, Optional[str]]:
+        try:
+            return complete()
+        except Exception as e:
+            return f"Error executing {tool_name}: {str(e)}", None
+
+    def _execute_tool(self, tool_name: str, tool_input: str, tool_executors: Dict[str, callable]) -> tuple[str, Optional[str]]:
+        """Execute a tool and return its observation (and the code it ran, if any)"""
         
         tool_name_lower = tool_name.lower().strip()
         
         if tool_name_lower not in tool_executors:
-            return f"Error: Tool '{tool_name}' not found. Available tools: {list(tool_executors.keys())}"
+            return f"Error: Tool '{tool_name}' not found. Available tools: {list(tool_executors.keys())}", None
         
         try:
             result = tool_executors[tool_name_lower](tool_input)
             return result
         except Exception as e:
-            return f"Error executing {tool_name}: {str(e)}"
+            return f"Error executing {tool_name}: {str(e)}", None
     
     def format_trajectory(self, steps: List[AgentStep]) -> str:
         """Format the agent's trajectory for display or logging"""
@@ -414,7 +684,8 @@ The examples have finished. Now, Begin!
         
         for i, step in enumerate(steps, 1):
             trajectory += f"\n--- Step {i} ---\n"
-            trajectory += f"Thought: {step.thought}\n"
+            if step.thought is not None:
+                trajectory += f"Thought: {step.thought}\n"
             trajectory += f"Action: {step.action}\n"
             trajectory += f"Action Input: {step.action_input}\n"
             trajectory += f"Observation: {step.observation}\n"
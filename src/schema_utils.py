@@ -0,0 +1,333 @@
+import functools
+import re
+
+
+# Everyday names of the IFC classes, used to map words of a question to the node labels of the schema
+LABEL_ALIASES = {
+    "wall": ["IfcWall", "IfcWallStandardCase"],
+    "curtain wall": ["IfcCurtainWall"],
+    "door": ["IfcDoor"],
+    "window": ["IfcWindow"],
+    "floor": ["IfcBuildingStorey"],
+    "storey": ["IfcBuildingStorey"],
+    "story": ["IfcBuildingStorey"],
+    "level": ["IfcBuildingStorey"],
+    "room": ["IfcSpace"],
+    "space": ["IfcSpace"],
+    "stair": ["IfcStair"],
+    "staircase": ["IfcStair"],
+    "stairs": ["IfcStair"],
+    "column": ["IfcColumn"],
+    "pillar": ["IfcColumn"],
+    "beam": ["IfcBeam"],
+    "slab": ["IfcSlab"],
+    "roof": ["IfcRoof"],
+    "railing": ["IfcRailing"],
+    "furniture": ["IfcFurnishingElement", "IfcFurniture"],
+    "opening": ["IfcOpeningElement"],
+}
+
+
+SHARED_PROPERTIES_HEADER = "Node properties shared by all labels:"
+
+
+def parse_schema(schema: str) -> dict[str, object]:
+    """
+    Parses a schema in the text format of neo4j_graphrag's get_schema.
+
+    Returns a dictionary with the "node_properties" ({label: {property: type}}), "relationship_properties"
+    ({type: {property: type}}) and "relationships" ([(start_label, type, end_label)]) of the graph.
+    """
+    return _parse_schema(schema)
+
+
+@functools.lru_cache(maxsize=16)
+def _parse_schema(schema: str) -> dict[str, object]:
+    parsed = {"node_properties": {}, "relationship_properties": {}, "relationships": []}
+    shared_properties = {}
+    section = None
+    for line in schema.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(SHARED_PROPERTIES_HEADER):
+            # Compact format, see format_schema
+            shared_properties = parse_properties(line[len(SHARED_PROPERTIES_HEADER):].strip(" {}"))
+        elif line == "Node properties:":
+            section = "node_properties"
+        elif line == "Relationship properties:":
+            section = "relationship_properties"
+        elif line == "The relationships:":
+            section = "relationships"
+        elif section == "relationships":
+            match = re.match(r"^\(:(.+?)\)-\[:(.+?)\]->\(:(.+?)\)$", line)
+            if match is not None:
+                parsed["relationships"].append(match.groups())
+        elif section is not None:
+            name, _, properties = line.partition(" {")
+            parsed[section][name] = parse_properties(properties.rstrip("}"))
+    for properties in parsed["node_properties"].values():
+        properties.update(shared_properties)
+    return parsed
+
+
+def parse_properties(properties: str) -> dict[str, str]:
+    parsed = {}
+    for item in properties.split(", "):
+        key, _, value_type = item.rpartition(": ")
+        if key:
+            parsed[key] = value_type
+    return parsed
+
+
+def label_words(label: str) -> str:
+    """
+    Converts a node label into lowercase words. E.g. IfcWallStandardCase -> "wall standard case"
+    """
+    name = label[3:] if label.startswith("Ifc") else label
+    return " ".join(re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", name)).lower()
+
+
+def pluralize(word: str) -> str:
+    if word.endswith("y") and word[-2:-1] not in "aeiou":
+        return word[:-1] + "ies"
+    if word.endswith(("s", "x", "ch", "sh")):
+        return word + "es"
+    return word + "s"
+
+
+def label_aliases(schema: str) -> dict[str, list[str]]:
+    """
+    Maps the everyday names (singular and plural) of the node labels present in the schema to those labels.
+    """
+    return _label_aliases(schema)
+
+
+@functools.lru_cache(maxsize=16)
+def _label_aliases(schema: str) -> dict[str, list[str]]:
+    labels = parse_schema(schema)["node_properties"].keys()
+    names = {label_words(label): [label] for label in labels}
+    for name, alias_labels in LABEL_ALIASES.items():
+        present = [label for label in alias_labels if label in labels]
+        if present:
+            names[name] = present
+
+    aliases = {}
+    for name, alias_labels in names.items():
+        aliases[name] = alias_labels
+        aliases.setdefault(pluralize(name), alias_labels)
+    return aliases
+
+
+def format_schema(schema: str, labels: set[str] | None = None, relationship_types: set[str] | None = None, properties: set[str] | None = None) -> str:
+    """
+    Formats a schema compactly for prompts: the node properties shared by all the labels are listed once, and only
+    the given labels, relationship types and label-specific properties (all of them if None) are kept.
+    """
+    parsed = parse_schema(schema)
+    all_node_properties = parsed["node_properties"].values()
+    shared = set.intersection(*[set(label_properties.items()) for label_properties in all_node_properties]) if len(all_node_properties) > 1 else set()
+    shared_properties = {key: value_type for key, value_type in sorted(shared)}
+
+    node_properties = {
+        label: {key: value_type for key, value_type in label_properties.items() if key not in shared_properties and (properties is None or key in properties)}
+        for label, label_properties in parsed["node_properties"].items() if labels is None or label in labels
+    }
+    relationships = [
+        relationship for relationship in parsed["relationships"]
+        if (relationship_types is None or relationship[1] in relationship_types) and relationship[0] in node_properties and relationship[2] in node_properties
+    ]
+    used_types = {relationship[1] for relationship in relationships}
+    relationship_properties = {name: properties for name, properties in parsed["relationship_properties"].items() if name in used_types}
+
+    lines = []
+    if shared_properties:
+        lines.append(f"{SHARED_PROPERTIES_HEADER} {format_properties(shared_properties)}")
+    lines.append("Node properties:")
+    for label, label_properties in node_properties.items():
+        lines.append(f"{label} {format_properties(label_properties)}")
+    lines.append("Relationship properties:")
+    for name, type_properties in relationship_properties.items():
+        lines.append(f"{name} {format_properties(type_properties)}")
+    lines.append("The relationships:")
+    for start, name, end in relationships:
+        lines.append(f"(:{start})-[:{name}]->(:{end})")
+    return "\n".join(lines)
+
+
+def format_properties(properties: dict[str, str]) -> str:
+    return "{" + ", ".join(f"{key}: {value_type}" for key, value_type in properties.items()) + "}"
+
+
+def build_schema(node_properties: dict[str, dict[str, str]], relationship_properties: dict[str, dict[str, str]], relationships: list[tuple[str, str, str]]) -> str:
+    """
+    Writes a schema in the text format of neo4j_graphrag's get_schema (see parse_schema).
+    """
+    lines = ["Node properties:"]
+    lines += [f"{label} {format_properties(properties)}" for label, properties in node_properties.items()]
+    lines.append("Relationship properties:")
+    lines += [f"{name} {format_properties(properties)}" for name, properties in relationship_properties.items() if properties]
+    lines.append("The relationships:")
+    lines += [f"(:{start})-[:{name}]->(:{end})" for start, name, end in relationships]
+    return "\n".join(lines)
+
+
+def drop_schema_properties(schema: str, keys: set[str]) -> str:
+    """
+    Removes the given node and relationship properties (e.g. internal tags) from a schema.
+    """
+    parsed = parse_schema(schema)
+    return build_schema(
+        {label: {key: value_type for key, value_type in properties.items() if key not in keys} for label, properties in parsed["node_properties"].items()},
+        {name: {key: value_type for key, value_type in properties.items() if key not in keys} for name, properties in parsed["relationship_properties"].items()},
+        parsed["relationships"]
+    )
+
+
+# Words of property names that say nothing about their content
+_PROPERTY_STOPWORDS = {"ifc", "pset", "ac", "common", "properties", "property"}
+
+
+def words(text: str) -> set[str]:
+    """
+    Lowercase words of a text or identifier (split on non-letters and camel case), without plural endings.
+    """
+    tokens = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+", text)
+    return {token.lower()[:-1] if token.lower().endswith("s") and len(token) > 3 else token.lower() for token in tokens}
+
+
+def prune_schema(schema: str, question: str) -> str:
+    """
+    Keeps only the part of the schema relevant to a question, matching its words against the names of the node
+    labels (see label_aliases) and properties. Labels that connect two matched labels through an intermediate node
+    (e.g. IfcOpeningElement between walls and doors) are kept too. If no label matches, the whole schema is kept.
+    """
+    text = " " + " ".join(re.findall(r"[a-z]+", question.lower())) + " "
+    labels = set()
+    for alias, alias_labels in label_aliases(schema).items():
+        if f" {alias} " in text:
+            labels.update(alias_labels)
+    if not labels:
+        return format_schema(schema)
+
+    relationships = parse_schema(schema)["relationships"]
+    neighbours = {}
+    for start, _, end in relationships:
+        neighbours.setdefault(start, set()).add(end)
+        neighbours.setdefault(end, set()).add(start)
+    for a in list(labels):
+        for b in list(labels):
+            if a < b and b not in neighbours.get(a, set()):
+                labels.update(neighbours.get(a, set()) & neighbours.get(b, set()))
+
+    question_words = words(question)
+    properties = {
+        key for label in labels for key in parse_schema(schema)["node_properties"][label]
+        if (words(key) - _PROPERTY_STOPWORDS) & question_words
+    }
+    return format_schema(schema, labels=labels, properties=properties)
+
+
+_CYPHER_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_CYPHER_QUOTED_NAME = re.compile(r"`(?:[^`]|``)*`")
+_CYPHER_COMMENT = re.compile(r"//[^\n]*")
+_CYPHER_MAP = re.compile(r"\{[^{}]*\}")
+_CYPHER_RELATIONSHIP = re.compile(r"\[([^\[\]]*)\]")
+_CYPHER_NAME = r"(?:[A-Za-z_][A-Za-z0-9_]*)"
+_CYPHER_LABEL = re.compile(r":\s*(" + _CYPHER_NAME + r")")
+_CYPHER_TYPES = re.compile(r"^\s*" + _CYPHER_NAME + r"?\s*:\s*(!?" + _CYPHER_NAME + r"(?:\s*\|:?\s*!?" + _CYPHER_NAME + r")*)")
+
+
+def query_schema_elements(cypher_query: str) -> tuple[set[str], set[str]]:
+    """
+    Returns the node labels and relationship types referenced by a Cypher query.
+    """
+    query = _CYPHER_COMMENT.sub("", _CYPHER_STRING.sub("''", cypher_query))
+    # Quoted names (e.g. `x:y` aliases) are replaced by placeholders, so that their content is not parsed
+    quoted_names = []
+
+    def placeholder(match):
+        quoted_names.append(match.group(0)[1:-1].replace("``", "`"))
+        return f"__quoted{len(quoted_names) - 1}__"
+
+    query = _CYPHER_QUOTED_NAME.sub(placeholder, query)
+
+    def unquote(name):
+        match = re.fullmatch(r"__quoted(\d+)__", name)
+        return quoted_names[int(match.group(1))] if match is not None else name
+
+    # Map literals and property maps may contain "key: value" pairs, which are not labels
+    while _CYPHER_MAP.search(query):
+        query = _CYPHER_MAP.sub("", query)
+
+    relationship_types = set()
+    for pattern in _CYPHER_RELATIONSHIP.findall(query):
+        match = _CYPHER_TYPES.match(pattern)
+        if match is not None:
+            relationship_types.update(unquote(name.strip(" !:")) for name in match.group(1).split("|"))
+    # List slices (e.g. list[1..]) and relationship patterns are removed before looking for labels
+    query = _CYPHER_RELATIONSHIP.sub("", query)
+    labels = {unquote(label) for label in _CYPHER_LABEL.findall(query)}
+
+    return labels, relationship_types
+
+
+# Variables and labels of node patterns, plain or quoted (their content is blanked by mask_cypher)
+_CYPHER_SYMBOL = r"(?:" + _CYPHER_NAME + r"|`[^`]*`)"
+_CYPHER_NODE = re.compile(r"\(\s*(?:" + _CYPHER_SYMBOL + r")?\s*(?::\s*!?" + _CYPHER_SYMBOL + r"(?:\s*[|&:]\s*!?" + _CYPHER_SYMBOL + r")*)?\s*(?P<end>\{|\)|WHERE\b)", re.IGNORECASE)
+_CYPHER_CLAUSE = re.compile(r"\b(MATCH|WHERE|WITH|RETURN|UNWIND|ORDER\s+BY|SKIP|LIMIT|CALL|YIELD|UNION)\b", re.IGNORECASE)
+# Keywords that may directly precede a node pattern, any other word before "(" is a function name
+_NODE_PATTERN_KEYWORDS = {"MATCH", "WHERE", "AND", "OR", "XOR", "NOT"}
+
+
+def mask_cypher(cypher_query: str) -> str:
+    """
+    Replaces the content of strings, quoted names and comments with spaces, keeping the positions of the rest of the query.
+    """
+    def blank(match):
+        text = match.group(0)
+        if text.startswith("//"):
+            return " " * len(text)
+        return text[0] + " " * (len(text) - 2) + text[-1]
+
+    return re.sub(r"//[^\n]*|" + _CYPHER_STRING.pattern + "|" + _CYPHER_QUOTED_NAME.pattern, blank, cypher_query)
+
+
+def scope_query(cypher_query: str, key: str, parameter: str) -> str:
+    """
+    Restricts the node patterns of a Cypher query to the nodes whose property `key` equals the query parameter
+    `parameter`, e.g. (n:IfcDoor)-[:R]->(m) becomes (n:IfcDoor {key: $parameter})-[:R]->(m {key: $parameter}).
+
+    Node patterns are those in MATCH clauses and those connected to a relationship (path predicates, EXISTS and
+    COUNT subqueries, pattern comprehensions). Label predicates such as WHERE (n:IfcDoor) are not patterns.
+    """
+    masked = mask_cypher(cypher_query)
+    condition = f"{key}: ${parameter}"
+    insertions = []
+    for match in _CYPHER_NODE.finditer(masked):
+        start, end = match.start(), match.end()
+        before = masked[:start].rstrip()
+        word = re.search(r"[A-Za-z0-9_]+$", before)
+        if word is not None and word.group(0).upper() not in _NODE_PATTERN_KEYWORDS:
+            continue
+
+        connected = re.search(r"(?:-\s*>|[-\]]\s*-)$", before) is not None
+        if match.group("end") == ")":
+            connected = connected or re.match(r"\s*(?:<\s*-|-\s*[-\[])", masked[end:]) is not None
+        if not connected and match.group("end") != "{":
+            clauses = _CYPHER_CLAUSE.findall(before)
+            in_match = bool(clauses) and clauses[-1].upper() == "MATCH"
+            if not (in_match and (before.endswith((",", "=")) or (word is not None and word.group(0).upper() == "MATCH"))):
+                continue
+
+        if match.group("end") == "{":
+            empty = re.match(r"\s*\}", masked[end:]) is not None
+            insertions.append((end, condition if empty else f"{condition}, "))
+        else:
+            position = match.start("end")
+            padding = "" if masked[position - 1] in "( " else " "
+            insertions.append((position, f"{padding}{{{condition}}}" + (" " if match.group("end") != ")" else "")))
+
+    for position, text in reversed(insertions):
+        cypher_query = cypher_query[:position] + text + cypher_query[position:]
+    return cypher_query
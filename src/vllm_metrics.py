@@ -0,0 +1,71 @@
+import logging
+import urllib.request
+
+
+# Counters exported by vLLM (V1 engine) and the gauge exported by the V0 engine
+PREFIX_CACHE_QUERIES = "vllm:prefix_cache_queries_total"
+PREFIX_CACHE_HITS = "vllm:prefix_cache_hits_total"
+PREFIX_CACHE_HIT_RATE = "vllm:gpu_prefix_cache_hit_rate"
+
+
+def metrics_url(api_base_url: str) -> str:
+    """
+    Returns the Prometheus endpoint of a vLLM server given its OpenAI-compatible base URL (e.g. http://localhost:8000/v1).
+    """
+    url = api_base_url.rstrip("/")
+    if url.endswith("/v1"):
+        url = url[:-len("/v1")]
+    return url + "/metrics"
+
+
+def parse_metrics(text: str, names: list[str]) -> dict[str, float]:
+    """
+    Sums the samples (over all label sets) of the given metrics in a Prometheus text exposition.
+    """
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_and_labels, _, value = line.rpartition(" ")
+        name = name_and_labels.split("{")[0]
+        if name in names:
+            try:
+                values[name] = values.get(name, 0.0) + float(value)
+            except ValueError:
+                continue
+    return values
+
+
+def prefix_cache_stats(api_base_url: str, timeout: float = 2.0) -> dict[str, float] | None:
+    """
+    Reads the prefix cache counters of a vLLM server. Returns None if they can not be retrieved.
+
+    "queries" and "hits" are cumulative token counts, so the hit rate of a given workload is obtained by comparing
+    two snapshots with prefix_cache_hit_rate. Older servers only expose the overall "hit_rate".
+    """
+    try:
+        with urllib.request.urlopen(metrics_url(api_base_url), timeout=timeout) as response:
+            text = response.read().decode("utf-8")
+    except OSError as e:
+        logging.warning(f"Could not read vLLM metrics from {api_base_url}: {e}")
+        return None
+
+    values = parse_metrics(text, [PREFIX_CACHE_QUERIES, PREFIX_CACHE_HITS, PREFIX_CACHE_HIT_RATE])
+    stats = {}
+    if PREFIX_CACHE_QUERIES in values:
+        stats["queries"] = values[PREFIX_CACHE_QUERIES]
+        stats["hits"] = values.get(PREFIX_CACHE_HITS, 0.0)
+        stats["hit_rate"] = stats["hits"] / stats["queries"] if stats["queries"] else 0.0
+    elif PREFIX_CACHE_HIT_RATE in values:
+        stats["hit_rate"] = values[PREFIX_CACHE_HIT_RATE]
+    return stats or None
+
+
+def prefix_cache_hit_rate(before: dict[str, float] | None, after: dict[str, float] | None) -> float | None:
+    """
+    Prefix cache hit rate (fraction of prompt tokens served from the cache) between two snapshots.
+    """
+    if not before or not after or "queries" not in before or "queries" not in after:
+        return None
+    queries = after["queries"] - before["queries"]
+    return (after["hits"] - before["hits"]) / queries if queries > 0 else None
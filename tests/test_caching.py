@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from src.caching import LRUCache, TranslationCache, normalize_cypher, normalize_question
+
+
+SCHEMA = "Node properties:\nIfcDoor {IFC_name: STRING}"
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=None)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(max_size=2, ttl=-1)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_normalize_cypher_keeps_literals():
+    assert normalize_cypher("MATCH  (n)\n  WHERE n.name = 'A  B' RETURN n;") == "MATCH (n) WHERE n.name = 'A  B' RETURN n"
+
+
+def test_normalize_question_keeps_case():
+    assert normalize_question("  How many  doors are in Block A?? ") == "How many doors are in Block A"
+
+
+def test_translation_cache_exact_hit_per_schema():
+    cache = TranslationCache()
+    cache.put("How many doors?", SCHEMA, "MATCH (n:IfcDoor) RETURN count(n)")
+    assert cache.get("How many doors", SCHEMA) == "MATCH (n:IfcDoor) RETURN count(n)"
+    assert cache.get("How many doors", SCHEMA + " ") is None
+
+
+def fake_embedding(question):
+    # Questions about doors point one way, the rest another
+    return [1.0, 0.01 * len(question)] if "door" in question else [0.0, 1.0]
+
+
+def test_translation_cache_semantic_hit_requires_same_literals():
+    calls = []
+    cache = TranslationCache(embed_fn=lambda q: calls.append(q) or fake_embedding(q), similarity_threshold=0.99)
+    cache.put("Name of door 12", SCHEMA, "cypher 12")
+    assert cache.get("Name of the door 12", SCHEMA) == "cypher 12"
+    assert cache.get("Name of the door 13", SCHEMA) is None
+    assert cache.get("How many windows", SCHEMA) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_translation_cache_reuses_lookup_embedding():
+    calls = []
+    cache = TranslationCache(embed_fn=lambda q: calls.append(q) or fake_embedding(q))
+    cache.put("How many doors", SCHEMA, "cypher")
+    calls.clear()
+    assert cache.get("List the windows", SCHEMA) is None
+    cache.put("List the windows", SCHEMA, "other cypher")
+    assert calls == ["List the windows"]
+
+
+def test_translation_cache_invalidate_semantic_hit():
+    cache = TranslationCache(embed_fn=fake_embedding, similarity_threshold=0.99)
+    cache.put("Count the doors", SCHEMA, "bad cypher")
+    assert cache.get("Count the doors please", SCHEMA) == "bad cypher"
+    cache.invalidate("Count the doors please", SCHEMA)
+    assert cache.get("Count the doors", SCHEMA) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_translation_cache_batches_writes(tmp_path):
+    path = tmp_path / "cache.json"
+    cache = TranslationCache(path=str(path), save_every=2)
+    cache.put("q1", SCHEMA, "c1")
+    assert not path.exists()
+    cache.put("q2", SCHEMA, "c2")
+    assert len(json.loads(path.read_text())["entries"]) == 2
+    cache.put("q3", SCHEMA, "c3")
+    cache.close()
+
+    reloaded = TranslationCache(path=str(path))
+    assert reloaded.get("q3", SCHEMA) == "c3"
+    assert len(reloaded._entries) == 3
+
+
+def test_translation_cache_evicts_oldest():
+    cache = TranslationCache(embed_fn=fake_embedding, max_size=2)
+    for i in range(3):
+        cache.put(f"door {i}", SCHEMA, f"c{i}")
+    assert cache.get("door 0", SCHEMA) is None
+    assert cache.get("door 2", SCHEMA) == "c2"
+    assert len(cache._indexes[next(iter(cache._indexes))]) == 2
+
+
+def test_translation_cache_namespaces_share_a_file(tmp_path):
+    path = str(tmp_path / "cache.json")
+    small = TranslationCache(path=path, namespace="small-model:abc")
+    small.put("How many doors", SCHEMA, "small cypher")
+    small.close()
+
+    large = TranslationCache(path=path, namespace="large-model:abc")
+    assert large.get("How many doors", SCHEMA) is None
+    large.put("How many doors", SCHEMA, "large cypher")
+    large.close()
+
+    assert TranslationCache(path=path, namespace="small-model:abc").get("How many doors", SCHEMA) == "small cypher"
+    assert TranslationCache(path=path, namespace="large-model:abc").get("How many doors", SCHEMA) == "large cypher"
+
+
+def test_translation_cache_concurrent_saves(tmp_path):
+    import threading
+
+    path = tmp_path / "cache.json"
+    caches = [TranslationCache(path=str(path), save_every=1) for _ in range(4)]
+    threads = [threading.Thread(target=lambda c=cache, i=i: [c.put(f"q{i}-{j}", SCHEMA, "c") for j in range(10)]) for i, cache in enumerate(caches)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(json.loads(path.read_text())["entries"]) == 10
+    assert [p.name for p in tmp_path.iterdir()] == ["cache.json"]
@@ -0,0 +1,40 @@
+from src.cypher_templates import match_cypher_template
+
+
+SCHEMA = """Node properties:
+IfcDoor {IFC_global_id: STRING, IFC_name: STRING}
+IfcWall {IFC_global_id: STRING, IFC_name: STRING}
+IfcWallStandardCase {IFC_global_id: STRING, IFC_name: STRING}
+Relationship properties:
+The relationships:
+(:IfcDoor)-[:IfcRelFillsElement]->(:IfcWall)"""
+
+GLOBAL_ID = "2OrWItJ6zAwBNp0OUxK$Dv"
+
+
+def test_count_single_label():
+    assert match_cypher_template("How many doors are there?", SCHEMA) == "MATCH (n:IfcDoor)\nRETURN count(n) AS count"
+
+
+def test_count_several_labels_sums_per_label_counts():
+    cypher = match_cypher_template("count the walls in the building", SCHEMA)
+    assert "MATCH (n:IfcWall) RETURN count(n) AS count\nUNION ALL\nMATCH (n:IfcWallStandardCase)" in cypher
+    assert cypher.endswith("RETURN sum(count) AS count")
+    assert " OR " not in cypher
+
+
+def test_list_uses_union_of_labels():
+    cypher = match_cypher_template("List all the walls", SCHEMA)
+    assert cypher.startswith("MATCH (n:IfcWall)\n")
+    assert "UNION ALL\nMATCH (n:IfcWallStandardCase)\n" in cypher
+
+
+def test_property_matches_label_and_id():
+    cypher = match_cypher_template(f"What is the name of the door with id {GLOBAL_ID}?", SCHEMA)
+    assert cypher == f"MATCH (n:IfcDoor {{IFC_global_id: '{GLOBAL_ID}'}})\nRETURN n.IFC_name AS name"
+
+
+def test_unknown_elements_are_left_to_the_llm():
+    assert match_cypher_template("How many columns are there?", SCHEMA) is None
+    assert match_cypher_template(f"What is the name of the element with id {GLOBAL_ID}", SCHEMA) is None
+    assert match_cypher_template("How many doors lead to the kitchen?", SCHEMA) is None
@@ -0,0 +1,141 @@
+"""
+Tests against a running Neo4j server with APOC (e.g. the one installed by scripts/), skipped unless NEO4J_TEST_URI is
+set. NEO4J_TEST_USERNAME, NEO4J_TEST_PASSWORD and NEO4J_TEST_DATABASE default to neo4j, neo4j and neo4j. Use a scratch
+database: the tests delete the nodes of their own buildings afterwards, but untagged nodes are tagged by the handler.
+"""
+import os
+
+import pytest
+
+ifc_handler = pytest.importorskip("src.ifc_handler")
+
+from src.ifc2graph.custom_neo4j import CustomNeo4j
+
+URI = os.environ.get("NEO4J_TEST_URI")
+pytestmark = pytest.mark.skipif(URI is None, reason="NEO4J_TEST_URI is not set")
+
+BUILDINGS = {"TestHouse": 2, "TestSchool": 3}
+
+
+def building_tables(windows: int, label: str) -> tuple[list, list]:
+    """A storey with a number of windows (and a building-specific label, to check the schema)"""
+    nodes = [{"label": "IfcBuildingStorey", "properties": {"id": 0, "IFC_global_id": f"storey-{label}", "IFC_type": "IfcBuildingStorey"}},
+             {"label": label, "properties": {"id": 1, "IFC_global_id": f"element-{label}", "IFC_type": label}}]
+    nodes += [{"label": "IfcWindow", "properties": {"id": i + 2, "IFC_global_id": f"window-{label}-{i}", "IFC_type": "IfcWindow"}} for i in range(windows)]
+    relationships = [{"type": "IfcRelContainedInSpatialStructure", "start_id": node["properties"]["id"], "end_id": 0, "properties": {"IFC_global_id": f"rel-{label}"}} for node in nodes[1:]]
+    return nodes, relationships
+
+
+@pytest.fixture
+def handler_factory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/schema")
+
+    def fake_ifc_graph_tables(path, workers=1, use_cache=True, building=None):
+        name = os.path.splitext(os.path.basename(path))[0]
+        return CustomNeo4j.TagTables(*building_tables(BUILDINGS[name], f"Ifc{name}Only"), building)
+
+    monkeypatch.setattr(ifc_handler, "ifc_graph_tables", fake_ifc_graph_tables)
+    handlers = []
+
+    def create(name: str, **kwargs):
+        kwargs.setdefault("building_isolation", "property")
+        handler = ifc_handler.IFCGraphHandler(
+            URI, os.environ.get("NEO4J_TEST_USERNAME", "neo4j"), os.environ.get("NEO4J_TEST_PASSWORD", "neo4j"),
+            os.environ.get("NEO4J_TEST_DATABASE", "neo4j"), ifc_path=f"data/ifc/{name}.ifc", **kwargs
+        )
+        handlers.append(handler)
+        return handler
+
+    yield create
+
+    for handler in handlers:
+        for building in BUILDINGS:
+            CustomNeo4j.DeleteAll(handler.driver, database=handler.database, building=building)
+        handler.close()
+
+
+def window_count(handler) -> int:
+    result = handler.execute_cypher_query("MATCH (n:IfcWindow) RETURN count(n) AS windows")
+    assert result.ok, result.error
+    return result.rows[0]["windows"]
+
+
+def test_switching_the_configured_building_between_runs(handler_factory):
+    # Run 1 loads the house, run 2 (a new process, with a new configuration) loads the school into the same database
+    house = handler_factory("TestHouse")
+    assert window_count(house) == 2
+
+    school = handler_factory("TestSchool")
+    assert window_count(school) == 3
+    labels = set(ifc_handler.parse_schema(school.graph_schema)["node_properties"])
+    assert "IfcTestSchoolOnly" in labels and "IfcTestHouseOnly" not in labels
+    assert "building" not in school.graph_schema
+
+    # Without reset, the loaded school is queried as it is
+    school_again = handler_factory("TestSchool", reset=False)
+    assert window_count(school_again) == 3
+    assert school_again.graph_schema == school.graph_schema
+
+
+def test_single_building_is_not_tagged_until_another_one_is_added(handler_factory):
+    house = handler_factory("TestHouse", building_isolation="auto")
+    if house.building_isolation == "database":
+        pytest.skip("Enterprise Edition keeps buildings in separate databases")
+    assert house.building_isolation == "none"
+    assert house._scoped("MATCH (n:`IfcWindow`) RETURN n") == ("MATCH (n:`IfcWindow`) RETURN n", {})
+    assert window_count(house) == 2
+
+    house.add_building("TestSchool", "data/ifc/TestSchool.ifc")
+    assert house.building_isolation == "property"
+    assert window_count(house) == 2
+    house.switch_building("TestSchool")
+    assert window_count(house) == 3
+
+
+def test_async_queries_from_sequential_event_loops(handler_factory):
+    import asyncio
+
+    house = handler_factory("TestHouse")
+
+    async def count_windows():
+        try:
+            result = await house.execute_cypher_query_async("MATCH (n:IfcWindow) RETURN count(n) AS windows")
+            assert result.ok, result.error
+            return result.rows[0]["windows"]
+        finally:
+            await house.close_async()
+
+    # The result cache would answer the second query without reaching the driver
+    house.result_cache.max_size = 0
+    assert asyncio.run(count_windows()) == 2
+    assert asyncio.run(count_windows()) == 2
+    assert len(house.async_drivers) == 0
+
+
+def test_async_driver_per_event_loop(handler_factory):
+    import asyncio
+
+    house = handler_factory("TestHouse")
+
+    async def driver():
+        return house._async_driver()
+
+    # Without close_async, each loop still gets a driver of its own
+    assert asyncio.run(driver()) is not asyncio.run(driver())
+
+
+def test_sync_renumbers_kept_nodes(handler_factory):
+    house = handler_factory("TestHouse")
+
+    # The same model exported again, with its windows in the reverse order: only the vertex indices change
+    nodes, relationships = building_tables(BUILDINGS["TestHouse"], "IfcTestHouseOnly")
+    ids = {node["properties"]["id"]: len(nodes) - 1 - node["properties"]["id"] for node in nodes}
+    for node in nodes:
+        node["properties"]["id"] = ids[node["properties"]["id"]]
+    for relationship in relationships:
+        relationship["start_id"], relationship["end_id"] = ids[relationship["start_id"]], ids[relationship["end_id"]]
+    CustomNeo4j.SyncTables(house.driver, *CustomNeo4j.TagTables(nodes, relationships, "TestHouse"), database=house.database, building="TestHouse", silent=True)
+
+    records, _, _ = house.driver.execute_query("MATCH (n {building: 'TestHouse'}) RETURN n.IFC_global_id AS key, n.id AS id", database_=house.database)
+    assert {record["key"]: record["id"] for record in records} == {node["properties"]["IFC_global_id"]: node["properties"]["id"] for node in nodes}
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+llm_transport = pytest.importorskip("src.llm_transport")
+
+
+def test_async_client_per_event_loop():
+    async def client():
+        return llm_transport.get_async_client("http://localhost:8000/v1")
+
+    async def same_loop():
+        return llm_transport.get_async_client("http://localhost:8000/v1") is llm_transport.get_async_client("http://localhost:8000/v1")
+
+    assert asyncio.run(same_loop())
+    assert asyncio.run(client()) is not asyncio.run(client())
+    llm_transport.close_clients()
+
+
+def test_close_clients_closes_the_pools_of_finished_loops():
+    async def client():
+        return llm_transport.get_async_client("http://localhost:8000/v1")
+
+    async_client = asyncio.run(client())
+    sync_client = llm_transport.get_client("http://localhost:8000/v1")
+    llm_transport.close_clients()
+    assert async_client._client.is_closed
+    assert sync_client._client.is_closed
+    assert len(llm_transport._async_clients) == 0
@@ -0,0 +1,170 @@
+import threading
+
+from src.react_agent import ReActAgent, deictic_target, normalize_tool_input, retrieval_request
+
+
+class ScriptedLLM():
+    """Helper LLM that returns the given outputs in order"""
+
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+
+    def __call__(self, input_data, instruction_type):
+        return self.outputs.pop(0)
+
+
+def retrieve_then_finish(retrieve_input):
+    return [
+        f"Thought: I need the element first\nAction: retrieve_building\nAction Input: {retrieve_input}\n",
+        "Thought: Done\nAction: finish\nAction Input: It is door 1\n",
+    ]
+
+
+def test_deictic_target_ignores_the_phrasing():
+    assert deictic_target("What is the name of the door in front of me?") == ("door", "in front of me")
+    assert deictic_target("Get the ID of the door in front of me") == ("door", "in front of me")
+    assert deictic_target("How tall is the closest window?") == deictic_target("Retrieve the closest windows") == ("window", "closest")
+    assert deictic_target("Get the ID of my left door") == ("door", "left")
+    assert deictic_target("How many doors are there?") is None
+
+
+def test_normalize_tool_input():
+    assert normalize_tool_input(" 'What is the door in  front of me?' ") == "what is the door in front of me"
+
+
+def test_retrieval_request_is_phrased_as_in_the_prompt_examples():
+    assert retrieval_request("What is the name of the door in front of me?") == "Get the ID of the door in front of me"
+    assert retrieval_request("How tall is the closest window?") == "Get the ID of the closest window"
+    assert retrieval_request("What color is the wall I'm looking at?") == "Get the ID of the wall I am looking at"
+    assert retrieval_request("Is the door I am looking at open?") == retrieval_request("I am looking at a door, is it open?") == "Get the ID of the door I am looking at"
+    assert retrieval_request("How many doors are there?") is None
+
+
+def test_should_speculate_ignores_this_and_that():
+    agent = ReActAgent(ScriptedLLM([]))
+    assert agent._should_speculate("What is the door in front of me?")
+    assert not agent._should_speculate("Is that all the windows?")
+    assert not agent._should_speculate("How many doors does this building have?")
+
+
+def test_speculation_is_completed_when_the_request_matches():
+    query = "What is the name of the door in front of me?"
+    calls = []
+    tool_executors = {"retrieve_building": lambda retrieve_input: calls.append(("tool", retrieve_input)) or ("door 1", "code")}
+    speculative_executors = {"retrieve_building": lambda retrieve_input: calls.append(("prepare", retrieve_input)) or (lambda: ("door 1", "speculative code"))}
+
+    # Rephrased as in the examples of the prompt
+    agent = ReActAgent(ScriptedLLM(retrieve_then_finish("Get the ID of the door in front of me.")), speculative_retrieval=True, stream=False)
+    answer, steps = agent.run(query, tool_executors, speculative_executors=speculative_executors)
+
+    assert answer == "It is door 1"
+    assert calls == [("prepare", "Get the ID of the door in front of me")]
+    assert steps[0].code == "speculative code"
+
+
+def test_speculation_is_discarded_when_the_request_differs():
+    query = "What is the name of the door in front of me?"
+    calls = []
+    tool_executors = {"retrieve_building": lambda retrieve_input: calls.append(("tool", retrieve_input)) or ("door 1", "code")}
+    speculative_executors = {"retrieve_building": lambda retrieve_input: calls.append(("prepare", retrieve_input)) or (lambda: ("wrong", "speculative code"))}
+
+    # Same element, but the code must also get its height
+    agent = ReActAgent(ScriptedLLM(retrieve_then_finish("Get the ID and height of the door in front of me")), speculative_retrieval=True, stream=False)
+    _, steps = agent.run(query, tool_executors, speculative_executors=speculative_executors)
+
+    assert ("tool", "Get the ID and height of the door in front of me") in calls
+    assert steps[0].observation == "door 1"
+
+
+def test_discarded_speculation_does_not_hold_the_sandbox_lock():
+    query = "What is the name of the door in front of me?"
+    release = threading.Event()
+    prepared = threading.Event()
+
+    def prepare(retrieve_input):
+        # Still generating when the agent decides on a different request
+        release.wait(timeout=5)
+        prepared.set()
+        return lambda: ("wrong", None)
+
+    agent = ReActAgent(ScriptedLLM(retrieve_then_finish("Get the ID of the door behind me")), speculative_retrieval=True, stream=False)
+
+    def retrieve(retrieve_input):
+        # The real call uses the sandbox while the speculation is still running
+        assert not prepared.is_set()
+        release.set()
+        return "door 1", "code"
+
+    _, steps = agent.run(query, {"retrieve_building": retrieve}, speculative_executors={"retrieve_building": prepare})
+    assert steps[0].observation == "door 1"
+
+
+def test_failed_preparation_falls_back_to_the_tool():
+    query = "What is the name of the door in front of me?"
+
+    def prepare(retrieve_input):
+        raise RuntimeError("LLM unavailable")
+
+    agent = ReActAgent(ScriptedLLM(retrieve_then_finish("Get the ID of the door in front of me")), speculative_retrieval=True, stream=False)
+    _, steps = agent.run(query, {"retrieve_building": lambda retrieve_input: ("door 1", "code")}, speculative_executors={"retrieve_building": prepare})
+    assert steps[0].observation == "door 1"
+
+
+def test_complete_action_end_waits_for_the_whole_input():
+    agent = ReActAgent(ScriptedLLM([]))
+    assert agent._complete_action_end("Thought: x\nAction: query_building\n") is None
+    assert agent._complete_action_end("Thought: x\nAction: query_building\nAction Input: How many do") is None
+    output = "Thought: x\nAction: query_building\nAction Input: How many doors?\nObservation: 3"
+    assert output[:agent._complete_action_end(output)].endswith("Action Input: How many doors?")
+
+
+def test_complete_action_end_allows_multiline_final_answers():
+    agent = ReActAgent(ScriptedLLM([]))
+    output = "Thought: done\nAction: finish\nAction Input: There are:\n- 3 doors\n"
+    assert agent._complete_action_end(output) is None
+    output += "\nThought:"
+    assert output[:agent._complete_action_end(output)].endswith("- 3 doors")
+
+
+def test_parse_actions_reads_every_action():
+    agent = ReActAgent(ScriptedLLM([]))
+    output = "Thought: x\nAction: query_building\nAction Input: How many doors?\nAction: retrieve_building\nAction Input: the door in front of me\n\nObservation:"
+    assert agent._parse_actions(output) == [("query_building", "How many doors?"), ("retrieve_building", "the door in front of me")]
+
+
+def long_steps(count, observation_chars=4000):
+    from src.react_agent import AgentStep
+    return [AgentStep(thought=f"step {i}", action="query_building", action_input=f"question {i}", observation=f"{i}" * observation_chars) for i in range(count)]
+
+
+def test_prompt_extends_the_previous_one():
+    agent = ReActAgent(ScriptedLLM([]), max_prompt_tokens=100000)
+    history = long_steps(1, 10)
+    first = agent._create_react_prompt("How many doors?", history)
+    history += long_steps(2, 10)[1:]
+    second = agent._create_react_prompt("How many doors?", history)
+    assert second.startswith(first[:-len("Thought:")])
+
+
+def test_fit_prompt_budget_truncates_the_oldest_observations():
+    agent = ReActAgent(ScriptedLLM([]), max_observation_tokens=2000, old_observation_tokens=10)
+    static_tokens = len(agent._static_prompt()) // 4
+    agent.max_prompt_tokens = static_tokens + 2500
+    history = long_steps(3)
+
+    prompt = agent._fit_prompt_budget("How many doors?", history)
+    assert "2" * 4000 in prompt
+    assert "0" * 4000 not in prompt and "characters truncated" in prompt
+    assert len(prompt) // 4 <= agent.max_prompt_tokens
+
+
+def test_fit_prompt_budget_keeps_the_last_step_whole():
+    agent = ReActAgent(ScriptedLLM([]), max_observation_tokens=2000, old_observation_tokens=10, max_prompt_tokens=1)
+    prompt = agent._fit_prompt_budget("How many doors?", long_steps(2))
+    assert "1" * 4000 in prompt
+
+
+def test_close_cancels_queued_calls():
+    agent = ReActAgent(ScriptedLLM([]))
+    agent.close()
+    assert agent.executor._shutdown
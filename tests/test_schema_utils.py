@@ -0,0 +1,85 @@
+from src.schema_utils import drop_schema_properties, format_schema, parse_schema, prune_schema, query_schema_elements, scope_query
+
+
+SCHEMA = """Node properties:
+IfcDoor {IFC_global_id: STRING, IFC_name: STRING, OverallHeight: FLOAT}
+IfcWall {IFC_global_id: STRING, IFC_name: STRING, IsExternal: BOOLEAN}
+IfcOpeningElement {IFC_global_id: STRING, IFC_name: STRING}
+IfcSlab {IFC_global_id: STRING, IFC_name: STRING}
+Relationship properties:
+IfcRelFillsElement {IFC_global_id: STRING}
+IfcRelVoidsElement {IFC_global_id: STRING}
+The relationships:
+(:IfcDoor)-[:IfcRelFillsElement]->(:IfcOpeningElement)
+(:IfcOpeningElement)-[:IfcRelVoidsElement]->(:IfcWall)"""
+
+
+def test_query_schema_elements():
+    labels, relationship_types = query_schema_elements("MATCH (n:IfcDoor)-[r:IfcRelFillsElement]->(m:IfcOpeningElement) RETURN n, m")
+    assert labels == {"IfcDoor", "IfcOpeningElement"}
+    assert relationship_types == {"IfcRelFillsElement"}
+
+
+def test_query_schema_elements_ignores_strings_maps_and_comments():
+    labels, relationship_types = query_schema_elements(
+        "MATCH (n:IfcDoor {IFC_name: 'a:B'}) // (m:IfcNope)\nWHERE n.x = \"c:D\" RETURN {key: n.IFC_name} AS map"
+    )
+    assert labels == {"IfcDoor"}
+    assert relationship_types == set()
+
+
+def test_query_schema_elements_reads_quoted_names():
+    labels, relationship_types = query_schema_elements("MATCH (n:IfcDoor)-[r:`Rel Type`|IfcRelX]->(m:`Ifc Wall`) RETURN n.x AS `x:y`, m")
+    assert labels == {"IfcDoor", "Ifc Wall"}
+    assert relationship_types == {"Rel Type", "IfcRelX"}
+
+
+def test_query_schema_elements_variable_length_and_slices():
+    labels, relationship_types = query_schema_elements("MATCH (a:IfcSpace)-[:A|:B*1..3]->(b) RETURN collect(b)[1..] AS rest")
+    assert labels == {"IfcSpace"}
+    assert relationship_types == {"A", "B"}
+
+
+def test_format_schema_lists_shared_properties_once():
+    schema = format_schema(SCHEMA)
+    assert schema.splitlines()[0] == "Node properties shared by all labels: {IFC_global_id: STRING, IFC_name: STRING}"
+    assert "IfcDoor {OverallHeight: FLOAT}" in schema
+    assert parse_schema(schema)["node_properties"] == parse_schema(SCHEMA)["node_properties"]
+
+
+def test_prune_schema_keeps_mentioned_labels_and_intermediate_nodes():
+    parsed = parse_schema(prune_schema(SCHEMA, "Which doors are in external walls?"))
+    assert set(parsed["node_properties"]) == {"IfcDoor", "IfcWall", "IfcOpeningElement"}
+    assert parsed["node_properties"]["IfcWall"] == {"IFC_global_id": "STRING", "IFC_name": "STRING", "IsExternal": "BOOLEAN"}
+    assert "OverallHeight" not in parsed["node_properties"]["IfcDoor"]
+    assert len(parsed["relationships"]) == 2
+
+
+def test_prune_schema_keeps_everything_without_matches():
+    assert set(parse_schema(prune_schema(SCHEMA, "What is the weather?"))["node_properties"]) == {"IfcDoor", "IfcWall", "IfcOpeningElement", "IfcSlab"}
+
+
+def test_scope_query_filters_node_patterns():
+    assert scope_query("MATCH (n:IfcDoor)-[:IfcRelFillsElement]->(m) WHERE n.IFC_name = '(a)' RETURN count(n), m", "building", "building") == \
+        "MATCH (n:IfcDoor {building: $building})-[:IfcRelFillsElement]->(m {building: $building}) WHERE n.IFC_name = '(a)' RETURN count(n), m"
+    assert scope_query("MATCH (n:IfcDoor {IFC_global_id: 'x'}) RETURN n", "building", "building") == \
+        "MATCH (n:IfcDoor {building: $building, IFC_global_id: 'x'}) RETURN n"
+    assert scope_query("MATCH (n {}) RETURN n", "building", "building") == "MATCH (n {building: $building}) RETURN n"
+
+
+def test_scope_query_leaves_expressions_alone():
+    scoped = scope_query("MATCH p = (a), (b:IfcWall) WHERE (a:IfcDoor) AND EXISTS { (a)-->(b) } RETURN (a.x - 1) AS y", "building", "building")
+    assert scoped == "MATCH p = (a {building: $building}), (b:IfcWall {building: $building}) WHERE (a:IfcDoor) AND EXISTS { (a {building: $building})-->(b {building: $building}) } RETURN (a.x - 1) AS y"
+
+
+def test_scope_query_handles_quoted_names():
+    assert scope_query("MATCH (n:`IfcDoor`) RETURN n", "building", "building") == "MATCH (n:`IfcDoor` {building: $building}) RETURN n"
+    assert scope_query("MATCH (`a b`:`Ifc Door`|IfcWindow)-[:`Rel`]->(m:IfcWall) RETURN `a b`", "building", "building") == \
+        "MATCH (`a b`:`Ifc Door`|IfcWindow {building: $building})-[:`Rel`]->(m:IfcWall {building: $building}) RETURN `a b`"
+
+
+def test_drop_schema_properties():
+    parsed = parse_schema(drop_schema_properties(SCHEMA, {"IFC_name", "IFC_global_id"}))
+    assert parsed["node_properties"]["IfcDoor"] == {"OverallHeight": "FLOAT"}
+    assert parsed["relationship_properties"] == {}
+    assert len(parsed["relationships"]) == 2
@@ -0,0 +1,18 @@
+from src.ifc2graph.spatial_grid import addToGrid, gridCell, hasNeighbourWithin
+
+
+def test_has_neighbour_within_the_distance():
+    grid = {}
+    addToGrid(grid, [0.0, 0.0, 0.0], 0.2)
+    assert hasNeighbourWithin(grid, [0.19, 0.0, 0.0], 0.2)
+    assert hasNeighbourWithin(grid, [-0.1, -0.1, 0.0], 0.2)
+    assert not hasNeighbourWithin(grid, [0.2, 0.0, 0.0], 0.2)
+    assert not hasNeighbourWithin(grid, [0.0, 0.0, 1.0], 0.2)
+
+
+def test_non_positive_distances_find_no_neighbours():
+    for distance in (0, -0.2):
+        grid = {}
+        addToGrid(grid, [1.0, 2.0, 3.0], distance)
+        assert gridCell([1.0, 2.0, 3.0], distance) == (1.0, 2.0, 3.0)
+        assert not hasNeighbourWithin(grid, [1.0, 2.0, 3.0], distance)
@@ -0,0 +1,33 @@
+from src.vllm_metrics import PREFIX_CACHE_HITS, PREFIX_CACHE_QUERIES, metrics_url, parse_metrics, prefix_cache_hit_rate
+
+
+METRICS = """# HELP vllm:prefix_cache_queries_total Prefix cache queries, in terms of number of queried tokens.
+# TYPE vllm:prefix_cache_queries_total counter
+vllm:prefix_cache_queries_total{engine="0",model_name="Qwen/Qwen3-14B"} 1000.0
+vllm:prefix_cache_queries_total{engine="1",model_name="Qwen/Qwen3-14B"} 500.0
+vllm:prefix_cache_hits_total{engine="0",model_name="Qwen/Qwen3-14B"} 600.0
+vllm:num_requests_running{engine="0",model_name="Qwen/Qwen3-14B"} 2.0
+vllm:prefix_cache_hits_total_broken{engine="0"} NaN-ish
+"""
+
+
+def test_metrics_url():
+    assert metrics_url("http://localhost:8008/v1/") == "http://localhost:8008/metrics"
+    assert metrics_url("http://localhost:8008") == "http://localhost:8008/metrics"
+
+
+def test_parse_metrics_sums_label_sets():
+    values = parse_metrics(METRICS, [PREFIX_CACHE_QUERIES, PREFIX_CACHE_HITS])
+    assert values == {PREFIX_CACHE_QUERIES: 1500.0, PREFIX_CACHE_HITS: 600.0}
+
+
+def test_parse_metrics_ignores_missing_and_invalid_values():
+    assert parse_metrics("metric_a 1\nmetric_b not-a-number\n", ["metric_b", "metric_c"]) == {}
+
+
+def test_prefix_cache_hit_rate_between_snapshots():
+    before = {"queries": 1000.0, "hits": 100.0}
+    after = {"queries": 2000.0, "hits": 850.0}
+    assert prefix_cache_hit_rate(before, after) == 0.75
+    assert prefix_cache_hit_rate(before, before) is None
+    assert prefix_cache_hit_rate(None, after) is None